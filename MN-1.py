@@ -1,5 +1,5 @@
 import customtkinter as ctk
-from tkinter import filedialog
+from tkinter import filedialog, READABLE as TK_READABLE
 import pygame
 import os
 from mutagen.mp3 import MP3
@@ -8,16 +8,113 @@ from mutagen.flac import FLAC as FLAC_MUTAGEN
 from mutagen.oggvorbis import OggVorbis
 from mutagen.wave import WAVE
 # --- End Add ---
+from mutagen import File as MutagenFile
 import time
 import random
 import threading
 import numpy as np
 import soundfile as sf # Using soundfile for waveform generation
+from PIL import Image, ImageDraw
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import traceback
 import subprocess # Keep for potential future use or if needed by other libs
 import sys # Keep for sys module usage
+import argparse
+import bisect
+import functools
+import queue
+import sqlite3
+import json
+import tempfile
+import cProfile
+import pstats
+import tracemalloc
+import logging
+import logging.handlers
+import asyncio
+import socket
+from array import array
+from collections import OrderedDict, deque
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+try:
+    from scipy.signal import sosfilt # Optional: needed for the equalizer bands
+except ImportError:
+    sosfilt = None
+
+# --- Logging ---
+LOG_LEVELS = ("debug", "info", "warning", "error")
+LOG_DEFAULT_LEVEL = "warning" # Quiet by default; --log-level info/debug for lifecycle/per-action detail
+LOG_FORMAT = "%(asctime)s.%(msecs)03d %(levelname)-7s %(threadName)s: %(message)s"
+LOG_RATE_LIMIT = 5 # Records let through per call site per window; the rest are counted and summarised
+LOG_RATE_WINDOW_S = 1.0
+
+log = logging.getLogger("mn1")
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Passes at most `limit` records per call site (file + line) per window. The first record
+    from a site in a new window notes how many were dropped in the previous one.
+    Critical records always pass.
+    """
+
+    def __init__(self, limit=LOG_RATE_LIMIT, window_s=LOG_RATE_WINDOW_S, clock=time.monotonic):
+        super().__init__()
+        self.limit = limit
+        self.window_s = window_s
+        self.clock = clock
+        self.suppressed_total = 0
+        self._sites = {} # (pathname, lineno) -> [window start, passed, suppressed]
+        self._lock = threading.Lock() # Records come from the Tk thread and workers
+
+    def filter(self, record):
+        if record.levelno >= logging.CRITICAL:
+            return True
+        key = (record.pathname, record.lineno)
+        now = self.clock()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.window_s:
+                suppressed = site[2] if site else 0
+                self._sites[key] = [now, 1, 0]
+            elif site[1] < self.limit:
+                site[1] += 1
+                suppressed = 0
+            else:
+                site[2] += 1
+                self.suppressed_total += 1
+                return False
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar message(s) suppressed)"
+            record.args = None
+        return True
+
+
+log.addFilter(RateLimitFilter())
+
+
+def setup_logging(level=LOG_DEFAULT_LEVEL, log_file=None):
+    """
+    Routes the "mn1" logger through a queue: callers (the Tk thread included) only enqueue
+    records and a QueueListener thread writes them to stderr and, optionally, log_file.
+    Returns the listener; stop() it on exit to flush.
+    """
+    formatter = logging.Formatter(LOG_FORMAT, datefmt="%H:%M:%S")
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, *handlers)
+    log.handlers.clear()
+    log.addHandler(logging.handlers.QueueHandler(records))
+    log.setLevel(getattr(logging, level.upper()))
+    log.propagate = False
+    listener.start()
+    return listener
 
 # --- Color Definitions ---
 COLOR_BLACK = "#000000"; COLOR_WHITE = "#FFFFFF"; COLOR_NEAR_WHITE = "#F5F5F5"
@@ -168,8 +265,2945 @@ THEMES = {
 
 SPINE_LINEWIDTH = 0.8
 
+# --- Instrumentation ---
+PERF_BUCKET_BOUNDS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 33, 66, 125, 250, 500, 1000, 2000, 5000) # Histogram bucket upper edges; one more bucket above
+PERF_OVERLAY_REFRESH_MS = 500 # Overlay redraw period while it is shown
+
+
+class TimingHistogram:
+    """Fixed-size histogram of one section's durations (ms): count, total, max and per-bucket counts."""
+    __slots__ = ("count", "total_ms", "max_ms", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(PERF_BUCKET_BOUNDS_MS) + 1)
+
+    def add(self, ms):
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+        self.buckets[bisect.bisect_left(PERF_BUCKET_BOUNDS_MS, ms)] += 1
+
+    def percentile(self, p):
+        """Upper edge of the bucket holding the p-th percentile (the max for the open top bucket)."""
+        rank = self.count * p / 100.0
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return min(PERF_BUCKET_BOUNDS_MS[i], self.max_ms) if i < len(PERF_BUCKET_BOUNDS_MS) else self.max_ms
+        return 0.0
+
+    def summary(self):
+        return {"count": self.count, "mean_ms": self.total_ms / self.count if self.count else 0.0,
+                "p50_ms": self.percentile(50), "p99_ms": self.percentile(99), "max_ms": self.max_ms,
+                "buckets": dict(zip([f"<={b}" for b in PERF_BUCKET_BOUNDS_MS] + [f">{PERF_BUCKET_BOUNDS_MS[-1]}"], self.buckets))}
+
+
+class PerfTimers:
+    """
+    Hot-path timers (monotonic perf_counter) feeding one TimingHistogram per section.
+    Off by default: start() then returns None and stop() returns at once, so the
+    instrumented code only pays for a flag test.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.sections = {} # name -> TimingHistogram
+        self._lock = threading.Lock() # Sections are timed on the Tk thread and on task workers
+
+    def start(self):
+        return time.perf_counter() if self.enabled else None
+
+    def stop(self, name, started):
+        if started is None:
+            return
+        self.record(name, (time.perf_counter() - started) * 1000.0)
+
+    def record(self, name, ms):
+        """Adds a duration measured by the caller (e.g. summed over a loop)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.sections.get(name)
+            if histogram is None:
+                histogram = self.sections[name] = TimingHistogram()
+            histogram.add(ms)
+
+    def timed(self, name):
+        """Decorator timing every call of a function as section `name`."""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.stop(name, started)
+            return wrapper
+        return decorate
+
+    def summary(self):
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in sorted(self.sections.items())}
+
+    def reset(self):
+        with self._lock:
+            self.sections.clear()
+
+    def dump_json(self, path):
+        """Writes the per-section statistics and histograms to path."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"bucket_bounds_ms": PERF_BUCKET_BOUNDS_MS, "sections": self.summary()}, f, indent=1)
+
+    def format_table(self):
+        """Plain-text table for the on-screen overlay."""
+        lines = [f"{'SECTION':<18}{'N':>6}{'MEAN':>8}{'P50':>8}{'P99':>8}{'MAX':>8}  ms"]
+        for name, stats in self.summary().items():
+            lines.append(f"{name:<18}{stats['count']:>6}{stats['mean_ms']:>8.2f}{stats['p50_ms']:>8.2f}"
+                         f"{stats['p99_ms']:>8.2f}{stats['max_ms']:>8.2f}")
+        if len(lines) == 1:
+            lines.append("(no samples yet)" if self.enabled else "(timers off)")
+        return "\n".join(lines)
+
+
+PERF = PerfTimers() # Shared by the module-level hot paths and MN1MusicPlayer; enabled by --perf or the overlay
+
+# --- Decoded Audio Cache Settings ---
+DECODED_CACHE_BUDGET_MB = 256 # Default memory budget for decoded audio of recent/prefetched tracks
+WAVEFORM_TARGET_POINTS = 500 # Number of peak points for the static waveform display
+DECODE_BLOCK_FRAMES = 262144 # Frames decoded between abort checks (~6 s at 44.1 kHz)
+
+# --- Memory Budget Settings ---
+MEMORY_BUDGET_MB = 1024 # Default total for per-track buffers: current track samples, decoded cache and rendered images
+OSC_MIN_SAMPLE_RATE = 4000 # Coarsest oscilloscope sample rate (Hz) a tight budget may decimate to
+INT16_FULL_SCALE = 32767.0 # Oscilloscope samples stored as int16 are scaled by this
+
+
+def buffer_nbytes(array):
+    """Bytes a sample buffer keeps in RAM; memory-mapped buffers live in a temp file and count as 0."""
+    if array is None or isinstance(array, np.memmap):
+        return 0
+    return int(getattr(array, "nbytes", 0))
+
+
+def allocate_samples(count, dtype, use_memmap=False):
+    """Sample store for `count` values, in RAM or memory-mapped from an anonymous temp file."""
+    if use_memmap:
+        # The file is already unlinked (POSIX) or deleted on close, and is freed with the last view
+        return np.memmap(tempfile.TemporaryFile(prefix="mn1-samples-"), dtype=dtype, mode="w+", shape=(max(1, count),))
+    return np.empty(count, dtype=dtype)
+
+
+class DecodedAudioCache:
+    """Thread-safe LRU cache of decoded audio (oscilloscope samples + waveform peaks) bounded by a byte budget."""
+    def __init__(self, budget_mb=DECODED_CACHE_BUDGET_MB):
+        self.budget_bytes = max(0, int(budget_mb * 1024 * 1024))
+        self._entries = OrderedDict() # song_path -> entry dict, least recently used first
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    @staticmethod
+    def _file_mtime(song_path):
+        """Returns the file modification time, or None if the file can't be stat'ed."""
+        try:
+            return os.path.getmtime(song_path)
+        except OSError:
+            return None
+
+    def get(self, song_path):
+        """Returns (peak_data, raw_data, sample_rate) for a cached track, or None on a miss."""
+        mtime = self._file_mtime(song_path) # Stat outside the lock
+        with self._lock:
+            entry = self._entries.get(song_path)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry["mtime"] != mtime:
+                # File changed on disk since it was decoded: drop the stale entry
+                self._remove_locked(song_path)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(song_path) # Mark as most recently used
+            self.hits += 1
+            return entry["peak_data"], entry["raw_data"], entry["sample_rate"]
+
+    def contains(self, song_path):
+        """Checks for a cached entry without touching LRU order or statistics."""
+        with self._lock:
+            return song_path in self._entries
+
+    def put(self, song_path, peak_data, raw_data, sample_rate):
+        """Stores decoded data for a track, evicting least recently used entries to stay within budget."""
+        nbytes = buffer_nbytes(peak_data) + buffer_nbytes(raw_data)
+        if nbytes > self.budget_bytes:
+            return False # A single track larger than the whole budget is never cached
+        mtime = self._file_mtime(song_path)
+        with self._lock:
+            if song_path in self._entries:
+                self._remove_locked(song_path)
+            self._entries[song_path] = {
+                "peak_data": peak_data, "raw_data": raw_data, "sample_rate": sample_rate,
+                "nbytes": nbytes, "mtime": mtime,
+            }
+            self.current_bytes += nbytes
+            self._evict_locked()
+        return True
+
+    def discard(self, song_path):
+        """Removes a track from the cache if present (not counted as an eviction)."""
+        with self._lock:
+            if song_path in self._entries:
+                self._remove_locked(song_path)
+
+    def clear(self):
+        """Drops all cached entries."""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def bytes_excluding(self, song_path):
+        """Bytes held by entries other than song_path's (the player shares the current track's arrays)."""
+        with self._lock:
+            entry = self._entries.get(song_path)
+            return self.current_bytes - (entry["nbytes"] if entry else 0)
+
+    def trim(self, max_bytes, keep=None):
+        """Evicts least recently used entries other than `keep` until the others hold at most max_bytes."""
+        with self._lock:
+            kept = self._entries[keep]["nbytes"] if keep in self._entries else 0
+            self._evict_locked(limit=max_bytes + kept, keep=keep)
+
+    def set_budget_mb(self, budget_mb):
+        """Changes the memory budget, evicting entries immediately if it shrank."""
+        with self._lock:
+            self.budget_bytes = max(0, int(budget_mb * 1024 * 1024))
+            self._evict_locked()
+
+    def stats(self):
+        """Returns a snapshot of cache usage and hit/eviction counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+            }
+
+    def _remove_locked(self, song_path):
+        entry = self._entries.pop(song_path)
+        self.current_bytes -= entry["nbytes"]
+        return entry
+
+    def _evict_locked(self, limit=None, keep=None):
+        # Evict least recently used entries until within budget (or limit), never `keep`
+        limit = self.budget_bytes if limit is None else limit
+        while self.current_bytes > limit:
+            oldest_path = next((path for path in self._entries if path != keep), None)
+            if oldest_path is None:
+                break
+            entry = self._remove_locked(oldest_path)
+            self.evictions += 1
+            self.evicted_bytes += entry["nbytes"]
+
+
+class MemoryBudget:
+    """
+    Global byte budget for per-track buffers. Each source reports the bytes it holds (the
+    current track's samples, the decoded cache, rendered images); sources with a trim
+    callback give memory back when the total runs over. plan_samples() picks the layout of
+    a new track's oscilloscope samples so that it fits next to everything that can't be trimmed.
+    """
+    def __init__(self, budget_mb=MEMORY_BUDGET_MB):
+        self.budget_bytes = max(0, int(budget_mb * 1024 * 1024))
+        self._sources = {} # name -> (size callable, trim callable taking a byte limit, or None)
+        self._lock = threading.Lock()
+        self.downgrades = 0 # Tracks given a cheaper layout than the default
+
+    def add_source(self, name, size, trim=None):
+        with self._lock:
+            self._sources[name] = (size, trim)
+
+    def usage(self):
+        """Returns {source name: bytes held}."""
+        with self._lock:
+            sources = list(self._sources.items())
+        return {name: int(size()) for name, (size, _) in sources} # Sources lock themselves
+
+    def used_bytes(self):
+        return sum(self.usage().values())
+
+    def fits(self, nbytes):
+        return self.used_bytes() + nbytes <= self.budget_bytes
+
+    def plan_samples(self, frames, sample_rate, downsample_factor, replacing="track"):
+        """
+        Returns (downsample factor, dtype, memmap) for a track's oscilloscope samples: the default
+        layout if it fits, else int16, then coarser decimation (down to OSC_MIN_SAMPLE_RATE), and a
+        memory-mapped int16 store as the last resort. `replacing` and trimmable sources don't count.
+        """
+        with self._lock:
+            fixed = [name for name, (_, trim) in self._sources.items() if trim is None and name != replacing]
+        usage = self.usage()
+        available = self.budget_bytes - sum(usage[name] for name in fixed)
+        factor = max(1, int(downsample_factor))
+        candidates = [(factor, np.float64), (factor, np.int16)]
+        coarser = factor * 2
+        while sample_rate / coarser >= OSC_MIN_SAMPLE_RATE:
+            candidates.append((coarser, np.int16))
+            coarser *= 2
+        for step, dtype in candidates:
+            if -(-frames // step) * np.dtype(dtype).itemsize <= available:
+                if (step, dtype) != candidates[0]:
+                    self.downgrades += 1
+                    log.info("Memory budget: oscilloscope samples as %s at 1/%d rate", np.dtype(dtype).name, step)
+                return step, dtype, False
+        self.downgrades += 1
+        log.info("Memory budget: oscilloscope samples memory-mapped (%.0f MB available)", available / (1024 * 1024))
+        return factor, np.int16, True
+
+    def enforce(self):
+        """Trims sources, in registration order, while the total is over budget. Returns the bytes freed."""
+        usage = self.usage()
+        over = sum(usage.values()) - self.budget_bytes
+        freed = 0
+        with self._lock:
+            sources = list(self._sources.items())
+        for name, (size, trim) in sources:
+            if over <= 0:
+                break
+            if trim is None or usage[name] <= 0:
+                continue
+            trim(max(0, usage[name] - over))
+            released = usage[name] - int(size())
+            over -= released
+            freed += released
+        return freed
+
+    def stats(self):
+        usage = self.usage()
+        return {"budget_bytes": self.budget_bytes, "used_bytes": sum(usage.values()),
+                "sources": usage, "downgrades": self.downgrades}
+
+
+# --- Track Import ---
+SUPPORTED_EXTENSIONS = (".mp3", ".flac", ".ogg", ".wav")
+IMPORT_PROBE_WORKERS = 8 # Concurrent metadata probes (I/O bound, so more than the core count is fine)
+IMPORT_MAX_IN_FLIGHT = IMPORT_PROBE_WORKERS * 4 # Candidates submitted but not yet handed to the UI
+IMPORT_POLL_INTERVAL_MS = 50 # How often the Tk thread collects probe results
+IMPORT_MAX_BATCH = 250 # Results drained from the probe queue at a time
+
+# --- Background Tasks ---
+# Lower value starts first. Limits cap the workers one kind may hold, keeping some free for the others.
+TASK_PRIORITY_FOREGROUND = 0 # Decoding the track being played
+TASK_PRIORITY_METADATA = 1 # Import/revalidation probes
+TASK_PRIORITY_PREFETCH = 2 # Decoding the upcoming track into the cache
+TASK_PRIORITY_BACKGROUND = 3 # Thumbnails and other nice-to-have analysis
+TASK_PRIORITY_LIMITS = {TASK_PRIORITY_FOREGROUND: 1, TASK_PRIORITY_METADATA: IMPORT_PROBE_WORKERS,
+                        TASK_PRIORITY_PREFETCH: 1, TASK_PRIORITY_BACKGROUND: 2}
+TASK_WORKERS = IMPORT_PROBE_WORKERS + 2 # Probes can't occupy every worker: one decode + one prefetch still start
+TASK_POLL_INTERVAL_MS = 15 # How often finished tasks are delivered to the Tk thread while any are outstanding
+
+# --- UI Time Slicing ---
+UI_SLICE_BUDGET_MS = 8 # Max time a bulk tracklist update may hold the Tk thread per slice
+UI_SLICE_GAP_MS = 1 # Pause between slices so input/redraw events get processed
+
+# --- Library Index ---
+MN1_DATA_DIR = os.path.join(os.path.expanduser("~"), ".mn1")
+LIBRARY_DB_PATH = os.path.join(MN1_DATA_DIR, "library.sqlite3")
+LIBRARY_LOOKUP_CHUNK = 500 # Paths per index query during import (stays under SQLite's variable limit)
+# Tag keys stored in the index, with their ID3 frame equivalents for MP3
+INDEXED_TAGS = {"title": "TIT2", "artist": "TPE1", "album": "TALB", "tracknumber": "TRCK", "date": "TDRC"}
+
+# --- Session / Playlists ---
+SESSION_PATH = os.path.join(MN1_DATA_DIR, "session.json")
+SESSION_FORMAT_VERSION = 1
+PLAYLIST_EXTENSIONS = (".m3u", ".m3u8")
+
+# --- Tracklist View ---
+TRACKLIST_ROW_HEIGHT = 24 # Pixel height of one tracklist row
+TRACKLIST_WHEEL_ROWS = 3 # Rows scrolled per mouse wheel notch
+
+# --- Tracklist Thumbnails ---
+THUMB_PEAK_POINTS = 48 # Coarse peaks stored per track (one byte each) for the row thumbnails
+THUMB_SIZE = (48, 14) # Thumbnail size in (unscaled) pixels
+THUMB_CACHE_ENTRIES = 512 # Rendered thumbnail images kept (LRU)
+THUMB_ANALYSIS_BLOCK = 65536 # Frames per block when scanning a file for coarse peaks
+
+# --- UI Update Loop ---
+UPDATE_INTERVAL_MS = 50 # Position/visual refresh period while playing (20 Hz); idle when stopped/paused
+
+# --- Track Switching ---
+TRACK_SWITCH_DEBOUNCE_MS = 250 # Quiet period after next/prev/double-click before the track is actually loaded
+
+# --- Shuffle Settings ---
+SHUFFLE_NO_REPEAT_WINDOW = 8 # Tracks from the end of one shuffle cycle kept away from the start of the next
+
+# --- Profiling ---
+PROFILE_DIR = os.path.join(MN1_DATA_DIR, "profiles") # One timestamped subdirectory per saved session
+PROFILE_TRACEMALLOC_FRAMES = 10 # Stack depth recorded per allocation
+PROFILE_MAX_SNAPSHOTS = 64 # tracemalloc snapshots kept (one per track load); the first is kept as the baseline
+PROFILE_SUMMARY_LINES = 30 # Rows of each table in summary.txt
+
+
+class ShuffleOrder:
+    """
+    Shuffle play order over hashable track keys, built with a Fisher-Yates permutation.
+    Positions up to the cursor are the play history, positions after it are the upcoming
+    order. next()/previous() are O(1); add()/remove() update the permutation in place.
+    """
+    def __init__(self, keys=(), no_repeat_window=SHUFFLE_NO_REPEAT_WINDOW, rng=None):
+        self.no_repeat_window = no_repeat_window
+        self._rng = rng or random.Random()
+        self._order = [] # Track keys in play order; None marks a removed history slot
+        self._pos = {} # key -> position in _order
+        self._cursor = -1 # Position of the current track (-1 = nothing played yet)
+        self._holes = 0 # Number of None slots in _order
+        self.reset(keys)
+
+    def __len__(self):
+        return len(self._pos)
+
+    def __contains__(self, key):
+        return key in self._pos
+
+    @property
+    def current(self):
+        """The key at the cursor, or None if nothing has been played (or it was removed)."""
+        if 0 <= self._cursor < len(self._order):
+            return self._order[self._cursor]
+        return None
+
+    def reset(self, keys, current=None):
+        """Builds a fresh permutation of keys. If given, current becomes the first played entry."""
+        self._order = [k for k in keys if k != current]
+        self._shuffle_range(0, len(self._order))
+        if current is not None:
+            self._order.insert(0, current)
+        self._holes = 0
+        self._reindex()
+        self._cursor = 0 if current is not None else -1
+
+    def next(self):
+        """Advances to and returns the next key, starting a new cycle when the order is exhausted."""
+        if not self._pos:
+            return None
+        position = self._cursor + 1
+        while position < len(self._order) and self._order[position] is None:
+            position += 1
+        if position >= len(self._order):
+            self._start_new_cycle()
+            position = 0
+        self._cursor = position
+        return self._order[position]
+
+    def previous(self):
+        """Steps back in the play history and returns that key, or None at the start of history."""
+        position = self._cursor - 1
+        while position >= 0 and self._order[position] is None:
+            position -= 1
+        if position < 0:
+            return None
+        self._cursor = position
+        return self._order[position]
+
+    def upcoming(self, count):
+        """Returns up to count keys that next() will return, without advancing."""
+        keys = []
+        position = self._cursor + 1
+        while position < len(self._order) and len(keys) < count:
+            if self._order[position] is not None:
+                keys.append(self._order[position])
+            position += 1
+        return keys
+
+    def add(self, key):
+        """Inserts a new key at a uniformly random position in the upcoming order."""
+        if key in self._pos:
+            return
+        self._order.append(key)
+        new_position = len(self._order) - 1
+        self._pos[key] = new_position
+        # Inside-out Fisher-Yates step restricted to the upcoming part
+        swap_position = self._rng.randint(self._cursor + 1, new_position)
+        self._swap(swap_position, new_position)
+
+    def remove(self, key):
+        """Removes a key by tombstoning its slot; the order is compacted once half of it is holes."""
+        position = self._pos.pop(key, None)
+        if position is None:
+            return
+        self._order[position] = None
+        self._holes += 1
+        if self._holes > len(self._order) // 2:
+            self._compact()
+
+    def set_current(self, key):
+        """Makes key the current entry (e.g. the user picked a track by hand) without disturbing history."""
+        if key not in self._pos or self.current == key:
+            return
+        position = self._pos[key]
+        target = self._cursor + 1
+        if position > self._cursor:
+            # Upcoming: bring it forward to the cursor
+            self._swap(position, target)
+        else:
+            # Already played: tombstone the old slot and replay it from here
+            self._order[position] = None
+            self._holes += 1
+            if target < len(self._order):
+                # Move whatever was next to the end of the order to free the slot
+                moved = self._order[target]
+                self._order.append(moved)
+                if moved is not None: self._pos[moved] = len(self._order) - 1
+                self._order[target] = key
+            else:
+                self._order.append(key)
+            self._pos[key] = target
+        self._cursor = target
+        if self._holes > len(self._order) // 2:
+            self._compact()
+
+    def clear(self):
+        """Removes all keys."""
+        self.reset(())
+
+    def _swap(self, i, j):
+        order = self._order
+        order[i], order[j] = order[j], order[i]
+        if order[i] is not None: self._pos[order[i]] = i
+        if order[j] is not None: self._pos[order[j]] = j
+
+    def _shuffle_range(self, start, end):
+        # Classic Fisher-Yates over _order[start:end]
+        order = self._order
+        for i in range(end - 1, start, -1):
+            j = self._rng.randint(start, i)
+            order[i], order[j] = order[j], order[i]
+
+    def _reindex(self):
+        self._pos = {k: i for i, k in enumerate(self._order) if k is not None}
+
+    def _compact(self):
+        current = self.current
+        live = [k for k in self._order[:self._cursor + 1] if k is not None]
+        upcoming = [k for k in self._order[self._cursor + 1:] if k is not None]
+        self._order = live + upcoming
+        self._holes = 0
+        self._reindex()
+        if current is not None:
+            self._cursor = self._pos[current]
+        else:
+            self._cursor = len(live) - 1
+
+    def _start_new_cycle(self):
+        """Reshuffles all keys, keeping the last few played tracks away from the start of the new cycle."""
+        history = [k for k in self._order if k is not None]
+        window = min(self.no_repeat_window, len(history) // 2)
+        recent = set(history[-window:]) if window > 0 else set()
+        self._order = history
+        self._shuffle_range(0, len(self._order))
+        if recent:
+            # Swap any recently played key out of the first `window` slots
+            order = self._order
+            candidates = [i for i in range(window, len(order)) if order[i] not in recent]
+            for i in range(window):
+                if order[i] in recent:
+                    j = candidates.pop(self._rng.randrange(len(candidates)))
+                    order[i], order[j] = order[j], order[i]
+        self._holes = 0
+        self._reindex()
+        self._cursor = -1
+
+
+def reopen_mixer_at_rate(sample_rate):
+    """
+    Re-opens the pygame mixer at sample_rate (keeping sample size, channel count and music volume)
+    so SDL doesn't have to resample. Returns True if the device was re-opened.
+    """
+    current = pygame.mixer.get_init()
+    if not sample_rate or (current and current[0] == sample_rate):
+        return False # Already at the requested rate (or rate unknown)
+    size, channels = (current[1], current[2]) if current else (-16, 2)
+    volume = None
+    if current:
+        try: volume = pygame.mixer.music.get_volume()
+        except pygame.error: pass
+        pygame.mixer.music.stop()
+        pygame.mixer.quit()
+    try:
+        pygame.mixer.init(frequency=int(sample_rate), size=size, channels=channels)
+    except pygame.error as e:
+        # Device refused the rate: fall back to the previous/default configuration
+        log.warning("Could not open audio output at %s Hz (%s), using default rate.", sample_rate, e)
+        if current: pygame.mixer.init(frequency=current[0], size=size, channels=channels)
+        else: pygame.mixer.init(size=size, channels=channels)
+    if volume is not None:
+        pygame.mixer.music.set_volume(volume)
+    return True
+
+
+def _read_tags(audio):
+    """Returns the INDEXED_TAGS present in a Mutagen file as plain strings."""
+    tags = {}
+    if not getattr(audio, "tags", None):
+        return tags
+    for key, id3_frame in INDEXED_TAGS.items():
+        try:
+            value = audio.tags.get(id3_frame) if hasattr(audio.tags, "getall") else audio.tags.get(key) # ID3 (MP3/WAV) vs Vorbis comments
+        except Exception:
+            continue
+        if value is None: continue
+        value = value.text if hasattr(value, "text") else value # ID3 frame -> list of values
+        if isinstance(value, (list, tuple)):
+            value = value[0] if value else None
+        if value is not None and str(value).strip():
+            tags[key] = str(value).strip()
+    return tags
+
+
+def probe_audio_file(song_path, stat_result=None):
+    """
+    Validates a file with Mutagen and returns its stream info, tags and the size/mtime
+    it was probed at as a dict, or None if the extension isn't supported.
+    Raises if the file is missing or unreadable.
+    """
+    st = stat_result or os.stat(song_path) # Raises FileNotFoundError for missing files
+    file_ext = os.path.splitext(song_path)[1].lower()
+    if file_ext == ".mp3": audio = MP3(song_path)
+    elif file_ext == ".flac": audio = FLAC_MUTAGEN(song_path)
+    elif file_ext == ".ogg": audio = OggVorbis(song_path)
+    elif file_ext == ".wav": audio = WAVE(song_path)
+    else:
+        return None
+    info = audio.info
+    return {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "format": file_ext[1:],
+        "length": float(getattr(info, "length", 0.0) or 0.0),
+        "sample_rate": getattr(info, "sample_rate", None),
+        "channels": getattr(info, "channels", None),
+        "tags": _read_tags(audio),
+    }
+
+
+def probe_with_index(song_path, cached=None):
+    """
+    Returns the indexed info if the file's size and mtime still match it, otherwise re-probes.
+    The returned dict has "indexed": True when it came from the index (nothing to write back).
+    """
+    st = os.stat(song_path)
+    if cached and cached["size"] == st.st_size and cached["mtime_ns"] == st.st_mtime_ns:
+        return dict(cached, indexed=True)
+    info = probe_audio_file(song_path, st)
+    if info is not None:
+        info["indexed"] = False
+    return info
+
+
+class LibraryIndex:
+    """
+    Persistent SQLite index of probed track metadata, keyed by path and validated by size + mtime.
+    Safe to share between threads (one connection guarded by a lock). Writes are batched
+    into a single transaction per call.
+    """
+    _COLUMNS = ("path", "size", "mtime_ns", "length", "format", "sample_rate", "channels", "tags")
+
+    def __init__(self, db_path=LIBRARY_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        try:
+            if db_path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._conn = self._open(db_path)
+        except (OSError, sqlite3.Error) as e:
+            # Read-only home directory, corrupt database file etc. - keep working with a throwaway index
+            log.warning("Library index unavailable (%s): %s. Using an in-memory index.", db_path, e)
+            self.db_path = ":memory:"
+            self._conn = self._open(":memory:")
+
+    @staticmethod
+    def _open(db_path):
+        """Connects and creates the schema; closes the connection again if that fails."""
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        try:
+            with conn:
+                if db_path != ":memory:":
+                    conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS tracks (
+                        path TEXT PRIMARY KEY,
+                        size INTEGER NOT NULL,
+                        mtime_ns INTEGER NOT NULL,
+                        length REAL,
+                        format TEXT,
+                        sample_rate INTEGER,
+                        channels INTEGER,
+                        tags TEXT
+                    )""")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS peaks (
+                        path TEXT PRIMARY KEY,
+                        size INTEGER NOT NULL,
+                        mtime_ns INTEGER NOT NULL,
+                        peaks BLOB NOT NULL
+                    )""")
+        except sqlite3.Error:
+            conn.close()
+            raise
+        return conn
+
+    def _row_to_info(self, row):
+        info = dict(zip(self._COLUMNS[1:], row[1:]))
+        info["tags"] = json.loads(info["tags"]) if info["tags"] else {}
+        return info
+
+    def lookup_many(self, paths):
+        """Returns {path: info} for every given path present in the index (not validated against disk)."""
+        paths = list(paths)
+        found = {}
+        with self._lock:
+            for start in range(0, len(paths), LIBRARY_LOOKUP_CHUNK):
+                chunk = paths[start:start + LIBRARY_LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT {', '.join(self._COLUMNS)} FROM tracks WHERE path IN ({placeholders})", chunk)
+                for row in rows:
+                    found[row[0]] = self._row_to_info(row)
+        return found
+
+    def store_many(self, items):
+        """Inserts/replaces (path, info) pairs in one transaction."""
+        rows = [(path, info["size"], info["mtime_ns"], info["length"], info["format"],
+                 info["sample_rate"], info["channels"], json.dumps(info.get("tags") or {}))
+                for path, info in items]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO tracks ({', '.join(self._COLUMNS)}) VALUES ({','.join('?' * len(self._COLUMNS))})",
+                rows)
+
+    def get_info(self, song_path):
+        """Returns up-to-date info for one file, re-probing (and storing) only if it changed."""
+        info = probe_with_index(song_path, self.lookup_many([song_path]).get(song_path))
+        if info is not None and not info["indexed"]:
+            self.store_many([(song_path, info)])
+        return info
+
+    def lookup_peaks(self, song_path, stat_result):
+        """Returns the stored coarse peaks (uint8 array) if they match the file's size/mtime, else None."""
+        with self._lock:
+            row = self._conn.execute("SELECT size, mtime_ns, peaks FROM peaks WHERE path = ?", (song_path,)).fetchone()
+        if row and row[0] == stat_result.st_size and row[1] == stat_result.st_mtime_ns:
+            return np.frombuffer(row[2], dtype=np.uint8)
+        return None
+
+    def store_peaks(self, song_path, stat_result, peaks):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO peaks (path, size, mtime_ns, peaks) VALUES (?, ?, ?, ?)",
+                               (song_path, stat_result.st_size, stat_result.st_mtime_ns,
+                                np.asarray(peaks, dtype=np.uint8).tobytes()))
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.close()
+            except sqlite3.Error as e:
+                log.error("Error closing library index: %s", e)
+
+
+class ProfileSession:
+    """
+    cProfile statistics per thread (the thread that calls start(), normally the Tk thread,
+    plus each task worker around the tasks it runs) and a tracemalloc snapshot per track
+    load. save() writes them to a timestamped directory: <thread>.prof, all.prof (merged, for
+    snakeviz/pstats), NNN-<track>.tracemalloc and summary.txt. Recording can be paused and
+    resumed; nothing is recorded until start().
+    """
+
+    def __init__(self):
+        self.active = False
+        self.profiles = {} # thread name -> cProfile.Profile
+        self.snapshots = [] # (label, tracemalloc.Snapshot)
+        self._lock = threading.Lock()
+        self._main_profile = None
+        self._workers_unsupported = False
+
+    def _profile_for(self, thread_name):
+        with self._lock:
+            profile = self.profiles.get(thread_name)
+            if profile is None:
+                profile = self.profiles[thread_name] = cProfile.Profile()
+            return profile
+
+    def start(self):
+        """Starts or resumes recording; profiles the calling thread until pause()."""
+        if self.active:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+        self._main_profile = self._profile_for(threading.current_thread().name)
+        try:
+            self._main_profile.enable()
+        except ValueError as e: # Another profiler or debugger holds the hook
+            log.warning("cProfile unavailable, recording allocations only: %s", e)
+            self._main_profile = None
+        self.active = True
+
+    def pause(self):
+        if not self.active:
+            return
+        self.active = False
+        if self._main_profile is not None:
+            self._main_profile.disable()
+            self._main_profile = None
+        tracemalloc.stop() # Taken snapshots are kept
+
+    def run_profiled(self, fn, *args):
+        """Calls fn(*args), profiled under the calling thread's name while recording (task workers)."""
+        if not self.active or self._workers_unsupported:
+            return fn(*args)
+        profile = self._profile_for(threading.current_thread().name)
+        try:
+            profile.enable()
+        except ValueError: # Python 3.12+: one cProfile hook per process
+            self._workers_unsupported = True
+            log.warning("Worker threads can't be profiled separately on this Python version.")
+            return fn(*args)
+        try:
+            return fn(*args)
+        finally:
+            profile.disable()
+
+    def snapshot(self, label):
+        """Records the allocations live right now (call at a comparable point, e.g. each track load)."""
+        if not self.active or not tracemalloc.is_tracing():
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")))
+        with self._lock:
+            self.snapshots.append((label, snapshot))
+            if len(self.snapshots) > PROFILE_MAX_SNAPSHOTS:
+                del self.snapshots[1]
+
+    def save(self, base_dir=PROFILE_DIR):
+        """Stops recording and writes everything collected. Returns the directory, or None if empty."""
+        self.pause()
+        with self._lock:
+            profiles, self.profiles = self.profiles, {}
+            snapshots, self.snapshots = self.snapshots, []
+        for profile in profiles.values():
+            profile.create_stats()
+        profiles = {name: profile for name, profile in profiles.items() if profile.stats}
+        if not profiles and not snapshots:
+            return None
+        out_dir = os.path.join(base_dir, time.strftime("%Y%m%d-%H%M%S"))
+        os.makedirs(out_dir, exist_ok=True)
+        with open(os.path.join(out_dir, "summary.txt"), "w", encoding="utf-8") as summary:
+            if profiles:
+                for name, profile in profiles.items():
+                    profile.dump_stats(os.path.join(out_dir, f"{name}.prof"))
+                merged = pstats.Stats(*profiles.values(), stream=summary)
+                merged.dump_stats(os.path.join(out_dir, "all.prof"))
+                summary.write(f"cProfile, all threads ({', '.join(profiles)}), by cumulative time\n")
+                merged.sort_stats("cumulative").print_stats(PROFILE_SUMMARY_LINES)
+            for i, (label, snapshot) in enumerate(snapshots):
+                safe_label = "".join(c if c.isalnum() or c in "-_." else "_" for c in label)[:60]
+                snapshot.dump(os.path.join(out_dir, f"{i:03d}-{safe_label}.tracemalloc"))
+            if len(snapshots) > 1:
+                (first_label, first), (last_label, last) = snapshots[0], snapshots[-1]
+                summary.write(f"\ntracemalloc: growth from '{first_label}' to '{last_label}' ({len(snapshots)} snapshots)\n")
+                for stat in last.compare_to(first, "lineno")[:PROFILE_SUMMARY_LINES]:
+                    summary.write(f"{stat}\n")
+        return out_dir
+
+
+PROFILER = ProfileSession() # Started by --profile or the in-app toggle
+
+
+class TaskToken:
+    """
+    Cancellation token shared by one or more executor tasks. Queued tasks whose token is
+    cancelled never start; running ones poll it (is_set() lets it stand in for an abort Event).
+    """
+    def __init__(self):
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+
+    def is_set(self):
+        return self._event.is_set()
+
+
+class _Task:
+    __slots__ = ("fn", "args", "token", "priority", "name", "on_done", "on_error", "queued_at")
+
+    def __init__(self, fn, args, token, priority, name, on_done, on_error):
+        self.fn, self.args, self.token = fn, args, token
+        self.priority, self.name = priority, name
+        self.on_done, self.on_error = on_done, on_error
+        self.queued_at = time.perf_counter()
+
+
+class TaskExecutor:
+    """
+    One bounded pool of worker threads for all background work (decoding, metadata probes,
+    peak analysis, thumbnails). Queued tasks start lowest priority value first, FIFO within a
+    priority, and TASK_PRIORITY_LIMITS caps how many workers each kind may hold at once, so a
+    track decode never waits behind a burst of probes or thumbnail scans. Tasks are called as
+    fn(token, *args). on_done(result) / on_error(exc) run on the Tk thread: finished tasks go
+    on a results queue that is polled with root.after while callbacks are outstanding (submit
+    tasks with callbacks from the Tk thread; deliver() does the same for a caller without Tk).
+    """
+    def __init__(self, root=None, workers=TASK_WORKERS, limits=None):
+        self.root = root
+        self._limits = dict(TASK_PRIORITY_LIMITS if limits is None else limits)
+        self._queues = {} # priority -> deque of queued _Tasks
+        self._running = {} # priority -> number of workers busy with it
+        self._depth = 0
+        self._cond = threading.Condition()
+        self._results = queue.Queue()
+        self._awaiting_delivery = 0 # Tasks with callbacks not yet delivered (Tk thread only)
+        self._poll_after_id = None
+        self._closed = False
+        # Observability
+        self.peak_depth = 0
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0 # Cancelled before they started
+        self._timings = {} # name -> [count, wait_total, wait_max, run_total, run_max] (seconds)
+        self._workers = [threading.Thread(target=self._work, daemon=True, name=f"mn1-task-{i}") for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def queue_depth(self):
+        return self._depth
+
+    def submit(self, fn, *args, priority=TASK_PRIORITY_BACKGROUND, name=None, token=None, on_done=None, on_error=None):
+        """Queues fn(token, *args) and returns its TaskToken (a new one unless `token` is shared)."""
+        token = token or TaskToken()
+        task = _Task(fn, args, token, priority, name or getattr(fn, "__name__", "task"), on_done, on_error)
+        if on_done or on_error:
+            self._awaiting_delivery += 1
+            self._schedule_delivery()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("TaskExecutor is closed")
+            self._queues.setdefault(priority, deque()).append(task)
+            self._depth += 1
+            self.peak_depth = max(self.peak_depth, self._depth)
+            self._cond.notify()
+        return token
+
+    def deliver(self, max_items=None):
+        """Runs the callbacks of finished tasks on the calling (Tk) thread. Cancelled tasks' results are dropped."""
+        delivered = 0
+        while max_items is None or delivered < max_items:
+            try:
+                task, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            delivered += 1
+            self._awaiting_delivery -= 1
+            if task.token.cancelled:
+                continue
+            try:
+                if error is None:
+                    if task.on_done: task.on_done(result)
+                elif task.on_error:
+                    task.on_error(error) # Without on_error the worker has already logged it
+            except Exception:
+                log.exception("Error in callback of background task '%s'", task.name)
+        return delivered
+
+    def stats(self):
+        """Queue depth, outcome counts and per-kind wait/run latency (ms)."""
+        with self._cond:
+            timings = {name: {"count": t[0],
+                              "wait_avg_ms": t[1] / t[0] * 1000, "wait_max_ms": t[2] * 1000,
+                              "run_avg_ms": t[3] / t[0] * 1000, "run_max_ms": t[4] * 1000}
+                       for name, t in self._timings.items()}
+            return {"queued": self._depth, "peak_queued": self.peak_depth, "running": sum(self._running.values()),
+                    "completed": self.completed, "failed": self.failed, "skipped": self.skipped, "tasks": timings}
+
+    def close(self, timeout=0.3):
+        """Drops queued tasks and stops the workers (running tasks should have been cancelled by their owners)."""
+        with self._cond:
+            self._closed = True
+            self._queues.clear()
+            self._depth = 0
+            self._cond.notify_all()
+        if self._poll_after_id is not None:
+            try: self.root.after_cancel(self._poll_after_id)
+            except Exception: pass
+            self._poll_after_id = None
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+        stuck = sum(1 for worker in self._workers if worker.is_alive())
+        if stuck:
+            log.warning("%s background task worker(s) did not stop in time.", stuck)
+
+    def _schedule_delivery(self):
+        if self.root is not None and self._poll_after_id is None and not self._closed:
+            self._poll_after_id = self.root.after(TASK_POLL_INTERVAL_MS, self._poll_results)
+
+    def _poll_results(self):
+        self._poll_after_id = None
+        self.deliver()
+        if self._awaiting_delivery > 0:
+            self._schedule_delivery()
+
+    def _next_task(self):
+        """Pops the next startable task (lock held), dropping cancelled ones on the way."""
+        for priority in sorted(self._queues):
+            tasks = self._queues[priority]
+            while tasks and tasks[0].token.cancelled:
+                self._finish_skipped(tasks.popleft())
+            if tasks and self._running.get(priority, 0) < self._limits.get(priority, len(self._workers)):
+                self._depth -= 1
+                self._running[priority] = self._running.get(priority, 0) + 1
+                return tasks.popleft()
+        return None
+
+    def _finish_skipped(self, task):
+        self._depth -= 1
+        self.skipped += 1
+        if task.on_done or task.on_error:
+            self._results.put((task, None, None)) # Keeps the delivery count right; deliver() drops it
+
+    def _work(self):
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                    task = self._next_task()
+            started = time.perf_counter()
+            result, error = None, None
+            try:
+                result = PROFILER.run_profiled(task.fn, task.token, *task.args)
+            except Exception as e:
+                error = e
+            finished = time.perf_counter()
+            with self._cond:
+                self._running[task.priority] -= 1
+                if error is None: self.completed += 1
+                else: self.failed += 1
+                timing = self._timings.setdefault(task.name, [0, 0.0, 0.0, 0.0, 0.0])
+                wait, run = started - task.queued_at, finished - started
+                timing[0] += 1
+                timing[1] += wait; timing[2] = max(timing[2], wait)
+                timing[3] += run; timing[4] = max(timing[4], run)
+                self._cond.notify_all() # A capped priority may be able to start now
+            if error is not None and task.on_error is None and not task.token.cancelled:
+                # Nobody else sees this error: log it here, where the traceback still points at the task
+                log.error("Background task '%s' failed", task.name, exc_info=error)
+            if task.on_done or task.on_error:
+                self._results.put((task, result, error))
+
+
+def coarse_peaks(peak_data, points=THUMB_PEAK_POINTS):
+    """Reduces a peak envelope to `points` max-pooled values scaled to 0-255 (uint8)."""
+    peak_data = np.abs(np.asarray(peak_data, dtype=np.float32))
+    if peak_data.size == 0:
+        return np.zeros(points, dtype=np.uint8)
+    if peak_data.size < points:
+        peak_data = np.interp(np.linspace(0, peak_data.size - 1, points), np.arange(peak_data.size), peak_data)
+    edges = np.linspace(0, peak_data.size, points + 1).astype(np.int64)
+    pooled = np.maximum.reduceat(peak_data, edges[:-1])
+    top = pooled.max()
+    if top <= 0:
+        return np.zeros(points, dtype=np.uint8)
+    return np.round(pooled / top * 255).astype(np.uint8)
+
+
+def analyze_coarse_peaks(song_path, abort_flag, points=THUMB_PEAK_POINTS):
+    """Scans a file block by block (bounded memory) for its coarse peaks; None if aborted."""
+    block_peaks = []
+    for block in sf.blocks(song_path, blocksize=THUMB_ANALYSIS_BLOCK, dtype="float32", always_2d=True):
+        if abort_flag.is_set():
+            return None
+        block_peaks.append(float(np.abs(block).max()) if block.size else 0.0)
+    return coarse_peaks(block_peaks, points)
+
+
+def render_thumbnail(peaks, color, size=THUMB_SIZE):
+    """Draws coarse peaks as a mirrored bar waveform (PIL, at 2x for HiDPI scaling)."""
+    width, height = size[0] * 2, size[1] * 2
+    image = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    mid = (height - 1) / 2.0
+    bar = width / max(1, len(peaks))
+    for i, peak in enumerate(peaks):
+        half = max(0.5, peak / 255.0 * mid)
+        x0 = int(i * bar)
+        x1 = max(x0, int((i + 1) * bar) - 2) # 1-2 px gap between bars
+        draw.rectangle([x0, mid - half, x1, mid + half], fill=color)
+    return image
+
+
+class ThumbnailRenderer:
+    """
+    Produces tracklist thumbnails as low-priority executor tasks. A task is skipped unless its
+    track is still visible when a worker gets to it. Coarse peaks come from the library index,
+    or from scanning the file (then stored, so it happens once per file version). Finished PIL
+    images (None on failure) are handed to on_ready(track_id, path, color, image) on the Tk thread.
+    """
+    _SCROLLED_AWAY = object()
+
+    def __init__(self, library, executor, on_ready):
+        self.library = library
+        self.executor = executor
+        self.on_ready = on_ready
+        self._pending = set() # (path, color) requested but not yet delivered
+        self._visible = frozenset()
+        self._token = TaskToken() # Shared by all thumbnail tasks; cancelled on close
+
+    def set_visible(self, track_ids):
+        self._visible = frozenset(track_ids)
+
+    def request(self, track_id, song_path, color):
+        key = (song_path, color)
+        if key in self._pending or self._token.cancelled:
+            return
+        self._pending.add(key)
+        self.executor.submit(self._render, track_id, song_path, color, priority=TASK_PRIORITY_BACKGROUND,
+                             name="thumbnail", token=self._token,
+                             on_done=lambda image: self._deliver(track_id, song_path, color, image))
+
+    def close(self):
+        self._token.cancel()
+
+    def _deliver(self, track_id, song_path, color, image):
+        self._pending.discard((song_path, color))
+        if image is not self._SCROLLED_AWAY: # Otherwise asked again if it comes back into view
+            self.on_ready(track_id, song_path, color, image)
+
+    def _render(self, token, track_id, song_path, color):
+        if track_id not in self._visible:
+            return self._SCROLLED_AWAY
+        try:
+            st = os.stat(song_path)
+            peaks = self.library.lookup_peaks(song_path, st)
+            if peaks is None:
+                peaks = analyze_coarse_peaks(song_path, token)
+                if peaks is None:
+                    return None # Closing
+                self.library.store_peaks(song_path, st, peaks)
+            return render_thumbnail(peaks, color)
+        except Exception as e:
+            log.debug("Thumbnail skipped for %s: %s", os.path.basename(song_path), e)
+            return None
+
+
+def iter_audio_files(root_dir):
+    """
+    Walks a directory tree with os.scandir and yields supported audio files lazily.
+    Only the extension is checked here (no file is opened). Each directory is listed
+    and sorted on its own, so memory stays bounded by the largest single folder.
+    Directory symlinks aren't followed to avoid loops.
+    """
+    pending_dirs = [root_dir]
+    while pending_dirs:
+        current_dir = pending_dirs.pop()
+        try:
+            with os.scandir(current_dir) as it:
+                entries = sorted(it, key=lambda e: e.name.lower())
+        except OSError as e:
+            log.warning("Skipping unreadable folder: %s - Error: %s", current_dir, e)
+            continue
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.name.lower().endswith(SUPPORTED_EXTENSIONS) and entry.is_file():
+                    yield entry.path
+            except OSError:
+                continue
+        pending_dirs.extend(reversed(subdirs)) # Pop in alphabetical order (depth-first)
+
+
+def read_m3u(playlist_path):
+    """
+    Yields the local file paths listed in an M3U/M3U8 playlist (comments and URLs skipped).
+    Relative entries are resolved against the playlist's folder. .m3u files that aren't
+    valid UTF-8 are read as Latin-1, the traditional M3U encoding.
+    """
+    with open(playlist_path, "rb") as f:
+        raw = f.read()
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = raw.decode("latin-1")
+    base_dir = os.path.dirname(os.path.abspath(playlist_path))
+    for line in text.splitlines():
+        entry = line.strip()
+        if not entry or entry.startswith("#"):
+            continue
+        if entry.startswith("file://"):
+            entry = url2pathname(urlparse(entry).path) # file:///C:/a%20b.mp3 -> C:\a b.mp3 on Windows
+        elif "://" in entry:
+            continue # Stream URL
+        yield os.path.normpath(os.path.join(base_dir, entry)) # join keeps absolute entries as they are
+
+
+def write_m3u(playlist_path, song_paths, library=None):
+    """Writes an extended M3U playlist (UTF-8). Durations/titles come from the library index when available."""
+    song_paths = list(song_paths)
+    indexed = library.lookup_many(song_paths) if library else {}
+    lines = ["#EXTM3U"]
+    for song_path in song_paths:
+        info = indexed.get(song_path)
+        if info:
+            tags = info.get("tags") or {}
+            title = f"{tags['artist']} - {tags['title']}" if tags.get("artist") and tags.get("title") else \
+                    os.path.splitext(os.path.basename(song_path))[0]
+            lines.append(f"#EXTINF:{int(round(info.get('length') or 0))},{title}")
+        lines.append(song_path)
+    tmp_path = playlist_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="\n") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, playlist_path)
+
+
+def iter_import_candidates(paths):
+    """Expands playlist files in a selection into the tracks they list."""
+    for path in paths:
+        if path.lower().endswith(PLAYLIST_EXTENSIONS):
+            try:
+                yield from read_m3u(path)
+            except OSError as e:
+                log.warning("Could not read playlist %s: %s", os.path.basename(path), e)
+        else:
+            yield path
+
+
+def save_session(session_path, song_paths, state):
+    """
+    Writes the tracklist and player state as compact JSON. Tracks are stored as
+    [folder index, file name] pairs against a shared folder table, which keeps big
+    libraries (many tracks per folder) small. Written atomically via a temp file.
+    """
+    folders = {}
+    tracks = []
+    for song_path in song_paths:
+        folder, name = os.path.split(song_path)
+        tracks.append([folders.setdefault(folder, len(folders)), name])
+    session = dict(state, v=SESSION_FORMAT_VERSION, dirs=list(folders), tracks=tracks)
+    os.makedirs(os.path.dirname(os.path.abspath(session_path)), exist_ok=True)
+    tmp_path = session_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(session, f, separators=(",", ":"), ensure_ascii=False)
+    os.replace(tmp_path, session_path)
+
+
+def load_session(session_path):
+    """Returns (song_paths, state) from a saved session, or None if there is none/it's unreadable."""
+    try:
+        with open(session_path, "r", encoding="utf-8") as f:
+            session = json.load(f)
+        if session.get("v") != SESSION_FORMAT_VERSION:
+            log.warning("Ignoring session with unknown format version: %s", session.get('v'))
+            return None
+        folders = session.pop("dirs")
+        song_paths = [os.path.join(folders[folder], name) for folder, name in session.pop("tracks")]
+        return song_paths, session
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+        log.warning("Could not load session %s: %s", session_path, e)
+        return None
+
+
+class SlicedWork:
+    """
+    Applies items from an iterable to a callback on the Tk thread, spread across root.after
+    slices that each stop after budget_ms, so bulk tracklist updates never block input or the
+    playhead. on_progress(work) runs after every slice, on_complete(work) after the last one.
+    """
+    def __init__(self, root, items, apply_item, on_complete=None, on_progress=None, budget_ms=UI_SLICE_BUDGET_MS):
+        self.root = root
+        self.applied = 0
+        self.slices = 0
+        self.finished = False
+        self.cancelled = False
+        self._items = iter(items)
+        self._apply_item = apply_item
+        self._on_complete = on_complete
+        self._on_progress = on_progress
+        self._budget = budget_ms / 1000.0
+        self._after_id = None
+
+    def start(self):
+        self._after_id = self.root.after_idle(self._run_slice)
+        return self
+
+    def cancel(self):
+        self.cancelled = True
+        if self._after_id is not None:
+            try: self.root.after_cancel(self._after_id)
+            except Exception: pass
+            self._after_id = None
+
+    def _run_slice(self):
+        self._after_id = None
+        if self.cancelled:
+            return
+        deadline = time.perf_counter() + self._budget
+        self.slices += 1
+        for item in self._items:
+            self._apply_item(item)
+            self.applied += 1
+            if time.perf_counter() >= deadline:
+                break
+        else:
+            self.finished = True
+        if self._on_progress:
+            self._on_progress(self)
+        if self.finished:
+            if self._on_complete:
+                self._on_complete(self)
+        else:
+            self._after_id = self.root.after(UI_SLICE_GAP_MS, self._run_slice)
+
+
+class TrackImportJob:
+    """
+    Probes candidate files as metadata tasks on the shared TaskExecutor and collects results
+    for the Tk thread. Candidates are pulled lazily from any iterable (list or generator) by a
+    feeder thread, with at most IMPORT_MAX_IN_FLIGHT probes outstanding. Results are (path, info, error)
+    tuples: info None and error None means an unsupported file type.
+    With a LibraryIndex, candidates are looked up in chunks first and unchanged files
+    skip the Mutagen parse.
+    """
+    def __init__(self, candidates, executor, library=None, revalidate=False):
+        self.total = len(candidates) if hasattr(candidates, "__len__") else None # None while still discovering
+        self.submitted = 0
+        self.completed = 0
+        self.added_count = 0 # Maintained by the consumer
+        self.revalidate = revalidate # Checking tracks already in the tracklist (e.g. restored session)
+        self._candidates = candidates
+        self._library = library
+        self._results = queue.Queue()
+        self._token = TaskToken() # Shared by every probe of this job
+        self._slots = threading.BoundedSemaphore(IMPORT_MAX_IN_FLIGHT)
+        self._feeding_done = threading.Event()
+        self._executor = executor
+        self._feeder = threading.Thread(target=self._feed, daemon=True, name="mn1-import-feed")
+        self._feeder.start()
+
+    @property
+    def cancelled(self):
+        return self._token.cancelled
+
+    @property
+    def finished(self):
+        """True once every candidate was probed (or the job was cancelled) and all results were drained."""
+        return (self._feeding_done.is_set() and self.completed >= self.submitted) or \
+               (self.cancelled and self._feeding_done.is_set())
+
+    def cancel(self):
+        """Stops submitting new probes; queued probes are skipped, running ones finish but their results are dropped."""
+        self._token.cancel()
+
+    def drain(self, max_items=IMPORT_MAX_BATCH):
+        """Returns up to max_items finished results (called on the Tk thread)."""
+        batch = []
+        while len(batch) < max_items:
+            try:
+                batch.append(self._results.get_nowait())
+            except queue.Empty:
+                break
+        self.completed += len(batch)
+        if self.cancelled:
+            return []
+        return batch
+
+    def _feed(self):
+        try:
+            for chunk in self._chunks():
+                indexed = self._library.lookup_many(chunk) if self._library else {}
+                if not self._submit_chunk(chunk, indexed):
+                    break
+        except Exception as e:
+            log.error("Import: error while listing candidates: %s", e)
+        finally:
+            if self.total is None or self.cancelled:
+                self.total = self.submitted
+            self._feeding_done.set()
+
+    def _chunks(self):
+        """Groups candidates for index lookups. A generator is only read one chunk ahead."""
+        chunk = []
+        for song_path in self._candidates:
+            chunk.append(song_path)
+            if len(chunk) >= LIBRARY_LOOKUP_CHUNK:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _submit_chunk(self, chunk, indexed):
+        """Submits one chunk of probes; returns False if the job was cancelled."""
+        for song_path in chunk:
+            # Wait while IMPORT_MAX_IN_FLIGHT probes are outstanding (skipped probes never release, hence the timeout)
+            while not self._slots.acquire(timeout=0.1):
+                if self._token.cancelled:
+                    return False
+            if self._token.cancelled:
+                self._slots.release()
+                return False
+            try:
+                self._executor.submit(self._run_probe, song_path, indexed.get(song_path),
+                                      priority=TASK_PRIORITY_METADATA, name="probe", token=self._token)
+            except RuntimeError: # Executor closed (application exiting)
+                self._slots.release()
+                return False
+            self.submitted += 1
+        return True
+
+    def _run_probe(self, token, song_path, cached):
+        try:
+            result = (song_path, probe_with_index(song_path, cached), None)
+        except Exception as e:
+            result = (song_path, None, e)
+        self._slots.release()
+        self._results.put(result)
+
+
+class TracklistModel:
+    """
+    Ordered tracklist with stable per-track IDs.
+    Keeps a path -> ID hash index and an ordered sequence of slots with a Fenwick tree
+    over slot occupancy. Append, remove, position -> ID and ID -> position are all
+    O(log n). Removing a track leaves a tombstone; slots are compacted once more than
+    half are dead. Observers subscribed with subscribe() are called as
+    callback(event, track_id, index) with event "added", "removed" or "cleared".
+    Behaves like a read-only list of paths (len, [index], iteration, `in`) for the player.
+    """
+    def __init__(self):
+        self._path_by_id = {}
+        self._name_by_id = {} # Display name, computed once per track
+        self._id_by_path = {}
+        self._slot_by_id = {}
+        self._slots = [] # slot -> track ID, or None for a removed track
+        self._tree = [0] # 1-based Fenwick tree over slot occupancy (1 = live)
+        self._next_id = 1
+        self._listeners = []
+
+    # --- List-like access ---
+
+    def __len__(self):
+        return len(self._id_by_path)
+
+    def __bool__(self):
+        return bool(self._id_by_path)
+
+    def __contains__(self, song_path):
+        return song_path in self._id_by_path
+
+    def __iter__(self):
+        for track_id in self._slots:
+            if track_id is not None:
+                yield self._path_by_id[track_id]
+
+    def __getitem__(self, index):
+        return self._path_by_id[self.id_at(index)]
+
+    # --- ID / position lookups ---
+
+    def id_of(self, song_path):
+        return self._id_by_path.get(song_path)
+
+    def path_of(self, track_id):
+        return self._path_by_id.get(track_id)
+
+    def name_at(self, index):
+        return self._name_by_id[self.id_at(index)]
+
+    def name_of(self, track_id):
+        return self._name_by_id[track_id]
+
+    def id_at(self, index):
+        """Track ID at a position (Fenwick descent for the (index+1)-th live slot)."""
+        if index < 0:
+            index += len(self)
+        if not (0 <= index < len(self)):
+            raise IndexError("tracklist index out of range")
+        remaining = index + 1
+        pos = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and self._tree[nxt] < remaining:
+                pos = nxt
+                remaining -= self._tree[nxt]
+            step >>= 1
+        return self._slots[pos] # pos is the 1-based position just before the target, i.e. its 0-based slot
+
+    def index_of(self, track_id):
+        """Current position of a track ID, or None if it isn't in the tracklist."""
+        slot = self._slot_by_id.get(track_id)
+        return None if slot is None else self._prefix(slot + 1) - 1
+
+    def index_of_path(self, song_path):
+        return self.index_of(self._id_by_path.get(song_path))
+
+    # --- Mutation ---
+
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    def _notify(self, event, track_id, index):
+        for callback in self._listeners:
+            callback(event, track_id, index)
+
+    def append(self, song_path):
+        """Adds a track at the end and returns its ID (existing ID if the path is already present)."""
+        track_id = self._id_by_path.get(song_path)
+        if track_id is not None:
+            return track_id
+        track_id = self._next_id; self._next_id += 1
+        self._path_by_id[track_id] = song_path
+        self._name_by_id[track_id] = os.path.basename(song_path)
+        self._id_by_path[song_path] = track_id
+        self._slot_by_id[track_id] = len(self._slots)
+        self._slots.append(track_id)
+        # New Fenwick node i covers slots (i - lowbit(i), i]; all but the new one are already counted
+        i = len(self._tree)
+        self._tree.append(1 + self._prefix(i - 1) - self._prefix(i - (i & -i)))
+        self._notify("added", track_id, len(self) - 1)
+        return track_id
+
+    def remove(self, track_id):
+        """Removes a track by ID and returns its path (None if unknown)."""
+        slot = self._slot_by_id.pop(track_id, None)
+        if slot is None:
+            return None
+        index = self._prefix(slot + 1) - 1
+        song_path = self._path_by_id.pop(track_id)
+        del self._name_by_id[track_id]
+        del self._id_by_path[song_path]
+        self._slots[slot] = None
+        i = slot + 1
+        while i < len(self._tree):
+            self._tree[i] -= 1
+            i += i & -i
+        if len(self._slots) > 32 and len(self) < len(self._slots) // 2:
+            self._compact()
+        self._notify("removed", track_id, index)
+        return song_path
+
+    def remove_at(self, index):
+        return self.remove(self.id_at(index))
+
+    def clear(self):
+        self._path_by_id.clear(); self._name_by_id.clear(); self._id_by_path.clear()
+        self._slot_by_id.clear(); self._slots.clear()
+        self._tree = [0]
+        self._notify("cleared", None, None)
+
+    # --- Fenwick helpers ---
+
+    def _prefix(self, i):
+        """Number of live slots among the first i slots."""
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _compact(self):
+        """Drops tombstones and rebuilds the tree in O(n)."""
+        self._slots = [track_id for track_id in self._slots if track_id is not None]
+        self._slot_by_id = {track_id: slot for slot, track_id in enumerate(self._slots)}
+        n = len(self._slots)
+        self._tree = [0] + [1] * n
+        for i in range(1, n + 1):
+            parent = i + (i & -i)
+            if parent <= n:
+                self._tree[parent] += self._tree[i]
+
+
+class TrackSearchIndex:
+    """
+    Incremental trigram index over track names and cached tags, used by the tracklist filter.
+    Postings are compact arrays of track IDs; every candidate is verified with a substring
+    check, so re-indexed or removed tracks only leave harmless stale postings, which are
+    rebuilt once they outnumber the live ones. A query that extends the previous one
+    (typing) only narrows the previous result.
+    """
+    def __init__(self):
+        self._texts = {} # track ID -> lowercase searchable text
+        self._postings = {} # trigram -> array of track IDs
+        self._posted = 0 # Total postings written (live + stale)
+        self._live = 0 # Postings belonging to current texts
+        self._version = 0
+        self._last = None # (version, query, result)
+
+    @staticmethod
+    def _trigrams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def add(self, track_id, name, tags=None):
+        """Indexes (or re-indexes) a track's name and tag values."""
+        if track_id in self._texts:
+            self.remove(track_id)
+        text = " ".join([name] + [str(v) for v in (tags or {}).values()]).lower()
+        self._texts[track_id] = text
+        grams = self._trigrams(text)
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is None:
+                posting = self._postings[gram] = array("q")
+            posting.append(track_id)
+        self._posted += len(grams); self._live += len(grams)
+        self._version += 1
+
+    def remove(self, track_id):
+        text = self._texts.pop(track_id, None)
+        if text is None:
+            return
+        self._live -= len(self._trigrams(text))
+        self._version += 1
+        if self._posted > 1024 and self._live < self._posted // 2:
+            self._rebuild()
+
+    def clear(self):
+        self._texts.clear(); self._postings.clear()
+        self._posted = self._live = 0
+        self._version += 1
+        self._last = None
+
+    def _rebuild(self):
+        texts = self._texts
+        self._texts = {}; self._postings = {}
+        self._posted = self._live = 0
+        for track_id in sorted(texts):
+            text = texts[track_id]
+            self._texts[track_id] = text
+            grams = self._trigrams(text)
+            for gram in grams:
+                self._postings.setdefault(gram, array("q")).append(track_id)
+            self._posted += len(grams); self._live += len(grams)
+
+    def search(self, query):
+        """Returns the sorted IDs of tracks containing every whitespace-separated term, or None for an empty query."""
+        terms = query.lower().split()
+        if not terms:
+            return None
+        last = self._last
+        if last and last[0] == self._version and all(any(old in new for new in terms) for old in last[1]):
+            # Every previous term is still contained in a current one (typing): only narrow the last result
+            result = self._matching(last[2], terms)
+        else:
+            long_terms = [t for t in terms if len(t) >= 3]
+            if long_terms:
+                # Rarest trigram across all terms gives the smallest candidate set
+                candidates = min((self._postings.get(gram, ()) for t in long_terms for gram in self._trigrams(t)), key=len)
+                result = sorted(set(self._matching(candidates, terms))) # Stale postings may repeat an ID
+            else:
+                # Only 1-2 character terms: a plain scan (ID order is nearly sorted already)
+                result = sorted(self._matching(self._texts, terms))
+        self._last = (self._version, terms, result)
+        return result
+
+    def _matching(self, candidates, terms):
+        """Candidates (live IDs only) whose text contains every term."""
+        texts = self._texts
+        if len(terms) == 1:
+            term = terms[0]
+            return [tid for tid in candidates if term in texts.get(tid, "")]
+        return [tid for tid in candidates if tid in texts and all(t in texts[tid] for t in terms)]
+
+
+class VirtualTrackList:
+    """
+    Virtualized tracklist view over a TracklistModel. A pool of row widgets (just enough
+    to fill the viewport) is re-bound to data as the list scrolls, so the widget count stays
+    constant however long the tracklist is. Clicks are resolved to a data index at click time,
+    so adding/removing tracks never re-binds rows. The selection is a single track ID, so it
+    survives removals above it and a selection change restyles at most two rows.
+    set_filter() restricts the rows to a sorted list of track IDs (the model only appends,
+    so ID order is tracklist order); indices passed to/from callbacks are always model indices.
+    """
+    def __init__(self, master, model, on_select, on_activate, font, row_height=TRACKLIST_ROW_HEIGHT,
+                 thumbnail_for=None, on_visible=None):
+        self.model = model
+        self.thumbnail_for = thumbnail_for # track ID -> image or None (not available yet)
+        self.on_visible = on_visible # Called with the visible track IDs after each render
+        self.on_select = on_select # Called with the data index on click
+        self.on_activate = on_activate # Called with the data index on double-click
+        self.font = font
+        self.row_height = row_height
+        self.first_row = 0 # Row position shown at the top
+        self.selected_id = None # Track ID of the selected row
+        self.filter_ids = None # Sorted track IDs shown while a filter is active
+        self.rows = [] # Pool of {"frame", "label", "index", "track_id", "text", "color", "image"} dicts
+        self.visible_rows = 0
+        self.bg_color = COLOR_BLACK; self.text_color = COLOR_WHITE; self.selected_text_color = COLOR_DEEP_RED
+        self._refresh_pending = None
+
+        self.frame = ctk.CTkFrame(master, corner_radius=0)
+        self.frame.grid_rowconfigure(0, weight=1)
+        self.frame.grid_columnconfigure(0, weight=1)
+        self.body = ctk.CTkFrame(self.frame, corner_radius=0)
+        self.body.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = ctk.CTkScrollbar(self.frame, command=self._on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.body.bind("<Configure>", self._on_resize)
+        self._bind_wheel(self.body)
+
+    # --- Pool management ---
+
+    def _bind_wheel(self, widget):
+        widget.bind("<MouseWheel>", self._on_mousewheel) # Windows / macOS
+        widget.bind("<Button-4>", lambda e: self.scroll_rows(-TRACKLIST_WHEEL_ROWS)) # X11 wheel up
+        widget.bind("<Button-5>", lambda e: self.scroll_rows(TRACKLIST_WHEEL_ROWS)) # X11 wheel down
+
+    def _create_row(self, slot):
+        row_frame = ctk.CTkFrame(self.body, fg_color=self.bg_color, corner_radius=0, height=self.row_height)
+        row_label = ctk.CTkLabel(row_frame, text="", font=self.font, fg_color="transparent",
+                                 text_color=self.text_color, anchor="w", justify="left", cursor="hand2",
+                                 compound="left")
+        row_label.pack(fill="both", expand=True, padx=5)
+        # Bindings refer to the pool slot; the data index is looked up when the click happens
+        for widget in (row_frame, row_label):
+            widget.bind("<Button-1>", lambda e, s=slot: self._on_row_event(s, self.on_select))
+            widget.bind("<Double-Button-1>", lambda e, s=slot: self._on_row_event(s, self.on_activate))
+            self._bind_wheel(widget)
+        return {"frame": row_frame, "label": row_label, "index": None, "track_id": None, "text": None, "color": None,
+                "image": None}
+
+    def _on_resize(self, event=None):
+        height = self.body.winfo_height()
+        needed = max(1, height // self.row_height + 1) # +1 for the partially visible bottom row
+        while len(self.rows) < needed:
+            self.rows.append(self._create_row(len(self.rows)))
+        self.visible_rows = needed
+        self.render()
+
+    def _on_row_event(self, slot, callback):
+        position = self.first_row + slot
+        if 0 <= position < self._row_total():
+            callback(self.model.index_of(self._row_track_id(position)))
+
+    # --- Row position <-> track mapping (differs only while filtered) ---
+
+    def _row_total(self):
+        return len(self.model) if self.filter_ids is None else len(self.filter_ids)
+
+    def _row_track_id(self, position):
+        return self.model.id_at(position) if self.filter_ids is None else self.filter_ids[position]
+
+    def _row_position_of(self, track_id):
+        if self.filter_ids is None:
+            return self.model.index_of(track_id)
+        position = bisect.bisect_left(self.filter_ids, track_id)
+        return position if position < len(self.filter_ids) and self.filter_ids[position] == track_id else None
+
+    def set_filter(self, track_ids):
+        """Shows only the given track IDs (sorted), or every track for None."""
+        self.filter_ids = track_ids
+        self.first_row = 0
+        self.render()
+
+    # --- Scrolling ---
+
+    def _full_rows(self):
+        """Rows that fit entirely in the viewport."""
+        return max(1, self.body.winfo_height() // self.row_height)
+
+    def _on_mousewheel(self, event):
+        if event.delta:
+            steps = -event.delta // 120 if abs(event.delta) >= 120 else -int(np.sign(event.delta)) # Windows vs macOS deltas
+            self.scroll_rows(steps * TRACKLIST_WHEEL_ROWS)
+
+    def _on_scrollbar(self, *args):
+        count = self._row_total()
+        if not args or count == 0:
+            return
+        if args[0] == "moveto":
+            self.first_row = int(float(args[1]) * count)
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            self.first_row += amount * (self._full_rows() if len(args) > 2 and args[2] == "pages" else 1)
+        self.render()
+
+    def scroll_rows(self, amount):
+        self.first_row += amount
+        self.render()
+
+    def scroll_to(self, index):
+        """Scrolls the minimum amount needed to make a data index fully visible (if it isn't filtered out)."""
+        if not (0 <= index < len(self.model)):
+            return
+        position = self._row_position_of(self.model.id_at(index))
+        if position is None:
+            return
+        full_rows = self._full_rows()
+        if position < self.first_row:
+            self.first_row = position
+        elif position >= self.first_row + full_rows:
+            self.first_row = position - full_rows + 1
+        else:
+            return
+        self.render()
+
+    # --- Rendering ---
+
+    def refresh(self):
+        """Schedules a re-render on idle, coalescing bursts of data changes (e.g. bulk import)."""
+        if self._refresh_pending is None:
+            self._refresh_pending = self.frame.after_idle(self.render)
+
+    def render(self):
+        """Binds the visible slice of data to the row pool. Only changed rows are reconfigured."""
+        self._refresh_pending = None
+        if not self.frame.winfo_exists():
+            return
+        count = self._row_total()
+        full_rows = self._full_rows()
+        self.first_row = max(0, min(self.first_row, count - full_rows))
+        for slot, row in enumerate(self.rows):
+            index = self.first_row + slot
+            if slot >= self.visible_rows or index >= count:
+                if row["index"] is not None:
+                    row["frame"].place_forget()
+                    row["index"] = None
+                continue
+            if row["index"] is None:
+                row["frame"].place(x=0, y=slot * self.row_height, relwidth=1.0, height=self.row_height)
+            row["index"] = index
+            row["track_id"] = self._row_track_id(index)
+            text = self.model.name_of(row["track_id"])
+            if text != row["text"]:
+                row["label"].configure(text=(" " + text) if row["image"] else text)
+                row["text"] = text
+            self._style_row(row)
+            self._set_row_image(row)
+        if count:
+            self.scrollbar.set(self.first_row / count, min(1.0, (self.first_row + full_rows) / count))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        if self.on_visible:
+            self.on_visible([row["track_id"] for row in self.rows if row["index"] is not None])
+
+    def _set_row_image(self, row):
+        image = self.thumbnail_for(row["track_id"]) if self.thumbnail_for else None
+        if image is not row["image"]:
+            row["label"].configure(image=image, text=(" " + row["text"]) if image else row["text"])
+            row["image"] = image
+
+    def update_thumbnail(self, track_id):
+        """Shows a newly available thumbnail if its row is on screen."""
+        row = self._row_for_id(track_id)
+        if row is not None:
+            self._set_row_image(row)
+
+    def _style_row(self, row):
+        color = self.selected_text_color if row["track_id"] == self.selected_id else self.text_color
+        if color != row["color"]:
+            row["label"].configure(text_color=color)
+            row["color"] = color
+
+    def _row_for_id(self, track_id):
+        """Pooled row currently showing a track ID, or None if it's off-screen."""
+        index = self._row_position_of(track_id)
+        if index is None:
+            return None
+        slot = index - self.first_row
+        if 0 <= slot < self.visible_rows and self.rows[slot]["index"] == index:
+            return self.rows[slot]
+        return None
+
+    @property
+    def selected_index(self):
+        """Position of the selected track, or -1 (O(log n) via the model)."""
+        index = self.model.index_of(self.selected_id)
+        return -1 if index is None else index
+
+    def set_selected(self, index):
+        """Selects a data index (-1 clears) and restyles only the old and new rows."""
+        new_id = self.model.id_at(index) if 0 <= index < len(self.model) else None
+        old_id, self.selected_id = self.selected_id, new_id
+        if old_id == new_id:
+            return
+        for track_id in (old_id, new_id):
+            row = self._row_for_id(track_id) if track_id is not None else None
+            if row is not None:
+                self._style_row(row)
+
+    def reset(self):
+        """Clears selection and scroll position (tracklist emptied)."""
+        self.first_row = 0
+        self.selected_id = None
+        self.filter_ids = None
+        self.render()
+
+    def set_colors(self, bg_color, text_color, selected_text_color, scrollbar_color, scrollbar_hover_color):
+        self.bg_color = bg_color; self.text_color = text_color; self.selected_text_color = selected_text_color
+        self.frame.configure(fg_color=bg_color)
+        self.body.configure(fg_color=bg_color)
+        self.scrollbar.configure(fg_color=bg_color, button_color=scrollbar_color, button_hover_color=scrollbar_hover_color)
+        for row in self.rows:
+            row["frame"].configure(fg_color=bg_color)
+            row["color"] = None # Force text colour update on next render
+        self.render()
+
+
+# --- DSP Settings ---
+DSP_BLOCK_FRAMES = 4096 # Frames per decoded block fed through the DSP chain (~93 ms at 44.1 kHz)
+EQ_BAND_FREQUENCIES = (31, 62, 125, 250, 500, 1000, 2000, 4000, 8000, 16000) # Peaking EQ centre frequencies (Hz)
+EQ_BAND_Q = 1.41 # Roughly one octave per band
+DSP_TIMING_HISTORY = 1024 # Number of recent per-block timings kept for statistics
+
+
+def read_replaygain_db(song_path):
+    """Returns the ReplayGain track gain (dB) from the file's tags, or 0.0 if not tagged."""
+    try:
+        audio = MutagenFile(song_path)
+    except Exception:
+        return 0.0
+    if audio is None or not audio.tags:
+        return 0.0
+    for key in audio.tags.keys():
+        # Vorbis comments use 'replaygain_track_gain', ID3 uses 'TXXX:REPLAYGAIN_TRACK_GAIN'
+        if key.lower().endswith("replaygain_track_gain"):
+            value = audio.tags[key]
+            text = value.text[0] if hasattr(value, "text") else (value[0] if isinstance(value, list) else value)
+            try:
+                return float(str(text).lower().replace("db", "").strip())
+            except ValueError:
+                return 0.0
+    return 0.0
+
+
+class DSPChain:
+    """
+    Block-based DSP stage: pre-amp, per-track (ReplayGain) gain and peaking EQ biquads.
+    Works in place on float32 (frames, channels) NumPy blocks; filter state is kept
+    between blocks and all filtering is vectorised (scipy sosfilt), with no per-sample Python.
+    """
+    def __init__(self, band_frequencies=EQ_BAND_FREQUENCIES, band_q=EQ_BAND_Q, sample_rate=44100, channels=2, replaygain=False):
+        self.replaygain = replaygain # Apply the ReplayGain track gain from tags on each load
+        self.band_frequencies = np.asarray(band_frequencies, dtype=np.float64)
+        self.band_q = band_q
+        self.band_gains_db = np.zeros(len(self.band_frequencies))
+        self.preamp_db = 0.0
+        self.track_gain_db = 0.0
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self._gain = 1.0 # Linear pre-amp * track gain
+        self._eq_active = False
+        self._dtype = np.dtype(np.float32) # Sample type of the blocks; coefficients and state are kept in it
+        self._sos = None # (bands, 6) second-order sections
+        self._zi = None # (bands, 2, channels) filter state carried across blocks
+        # Per-block processing times (seconds), kept in a fixed-size ring
+        self._block_times = np.zeros(DSP_TIMING_HISTORY)
+        self._block_frames = np.zeros(DSP_TIMING_HISTORY, dtype=np.int64)
+        self._block_count = 0
+        if sosfilt is None:
+            log.warning("scipy not installed, equalizer bands are disabled (gain still applies).")
+        self.configure(sample_rate, channels)
+
+    def configure(self, sample_rate, channels):
+        """Sets the stream format, recomputing coefficients and resetting filter state."""
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self._zi = np.zeros((len(self.band_frequencies), 2, channels), dtype=self._dtype)
+        self._update_coefficients()
+
+    def reset(self):
+        """Clears filter state (e.g. after a seek or track change)."""
+        self._zi.fill(0.0)
+
+    def set_band_gains(self, gains_db):
+        """Sets the gain (dB) of each EQ band."""
+        gains = np.asarray(gains_db, dtype=np.float64)
+        if gains.shape != self.band_gains_db.shape:
+            raise ValueError(f"Expected {len(self.band_gains_db)} EQ band gains, got {gains.size}")
+        self.band_gains_db = gains
+        self._update_coefficients()
+
+    def set_preamp_db(self, gain_db):
+        self.preamp_db = float(gain_db)
+        self._update_gain()
+
+    def set_track_gain_db(self, gain_db):
+        self.track_gain_db = float(gain_db)
+        self._update_gain()
+
+    def _update_gain(self):
+        self._gain = 10.0 ** ((self.preamp_db + self.track_gain_db) / 20.0)
+
+    def _update_coefficients(self):
+        # RBJ audio EQ cookbook peaking filters, computed for all bands at once
+        gains = self.band_gains_db.copy()
+        gains[self.band_frequencies >= 0.45 * self.sample_rate] = 0.0 # Bands near/above Nyquist are bypassed
+        a = 10.0 ** (gains / 40.0)
+        w0 = 2.0 * np.pi * self.band_frequencies / self.sample_rate
+        alpha = np.sin(w0) / (2.0 * self.band_q)
+        cos_w0 = np.cos(w0)
+        a0 = 1.0 + alpha / a
+        self._sos = np.column_stack([
+            (1.0 + alpha * a) / a0, (-2.0 * cos_w0) / a0, (1.0 - alpha * a) / a0,
+            np.ones_like(a0), (-2.0 * cos_w0) / a0, (1.0 - alpha / a) / a0,
+        ]).astype(self._dtype) # Same type as the blocks, so sosfilt doesn't upcast each one
+        self._eq_active = sosfilt is not None and bool(np.any(gains != 0.0))
+        self._update_gain()
+
+    def process(self, block):
+        """Processes a (frames, channels) float32 block in place and returns it."""
+        start = time.perf_counter()
+        if self._eq_active:
+            if block.dtype != self._dtype: # Once, if the stream's sample type ever changes
+                self._set_dtype(block.dtype)
+            # sosfilt has no out= argument: it filters its own copy of the block and returns it
+            filtered, self._zi = sosfilt(self._sos, block, axis=0, zi=self._zi)
+            np.copyto(block, filtered)
+        if self._gain != 1.0:
+            block *= self._gain
+        np.clip(block, -1.0, 1.0, out=block)
+        slot = self._block_count % DSP_TIMING_HISTORY
+        self._block_times[slot] = time.perf_counter() - start
+        self._block_frames[slot] = len(block)
+        self._block_count += 1
+        return block
+
+    def _set_dtype(self, dtype):
+        self._dtype = np.dtype(dtype)
+        self._sos = self._sos.astype(self._dtype)
+        self._zi = self._zi.astype(self._dtype)
+
+    def timing_stats(self):
+        """Returns per-block processing time statistics (ms) relative to the real-time budget."""
+        count = min(self._block_count, DSP_TIMING_HISTORY)
+        if count == 0:
+            return {"blocks": 0}
+        times_ms = self._block_times[:count] * 1000.0
+        budget_ms = 1000.0 * float(np.mean(self._block_frames[:count])) / self.sample_rate
+        return {
+            "blocks": self._block_count,
+            "mean_ms": float(np.mean(times_ms)),
+            "p50_ms": float(np.percentile(times_ms, 50)),
+            "p99_ms": float(np.percentile(times_ms, 99)),
+            "max_ms": float(np.max(times_ms)),
+            "budget_ms": budget_ms,
+            "load": float(np.mean(times_ms)) / budget_ms if budget_ms > 0 else 0.0,
+        }
+
+
+class MixerMusicOutput:
+    """Audio output backed by pygame.mixer.music (SDL decodes and streams the file)."""
+    def is_ready(self): return bool(pygame.mixer.get_init())
+    def load(self, path): pygame.mixer.music.load(path)
+    def play(self, start=0.0): pygame.mixer.music.play(start=start)
+    def pause(self): pygame.mixer.music.pause()
+    def unpause(self): pygame.mixer.music.unpause()
+    def stop(self): pygame.mixer.music.stop()
+    def get_busy(self): return pygame.mixer.music.get_busy()
+    def get_pos(self): return pygame.mixer.music.get_pos()
+    def set_volume(self, volume): pygame.mixer.music.set_volume(volume)
+    def get_volume(self): return pygame.mixer.music.get_volume()
+    def close(self): pass
+
+
+class DSPStreamOutput:
+    """
+    Audio output that decodes the file with soundfile in blocks, runs each block through
+    a DSPChain and queues the result on a reserved pygame mixer channel. The mixer is
+    re-opened at the file's sample rate so no resampling happens after the DSP stage.
+    Mirrors the MixerMusicOutput interface (pygame.mixer.music semantics).
+    """
+    def __init__(self, dsp, block_frames=DSP_BLOCK_FRAMES):
+        self.dsp = dsp
+        self.block_frames = block_frames
+        self.underruns = 0
+        self._file = None
+        self._channel = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._volume = 1.0
+        self._paused = False
+        self._clock_start = None # monotonic time of play()
+        self._paused_at = None
+        self._paused_total = 0.0
+        # Preallocated block buffers, sized in load()
+        self._in_buf = None # (frames, file channels) float32 from the decoder
+        self._mix_buf = None # (frames, output channels) float32 processed by the DSP chain
+        self._pcm_buf = None # (frames, output channels) in the mixer's sample format
+
+    def is_ready(self):
+        return bool(pygame.mixer.get_init())
+
+    def load(self, path):
+        self.stop()
+        self._close_file()
+        info = sf.info(path)
+        reopen_mixer_at_rate(info.samplerate) # The DSP output always runs at the file's rate
+        frequency, size, out_channels = pygame.mixer.get_init()
+        if size not in (-16, 32): # Signed 16-bit or float32; pygame's 16 is unsigned and isn't converted
+            raise pygame.error(f"DSP output does not support mixer sample size {size}")
+        self._file = sf.SoundFile(path)
+        self.dsp.configure(frequency, out_channels)
+        self.dsp.set_track_gain_db(read_replaygain_db(path) if self.dsp.replaygain else 0.0)
+        self._in_buf = np.zeros((self.block_frames, self._file.channels), dtype=np.float32)
+        self._mix_buf = np.zeros((self.block_frames, out_channels), dtype=np.float32)
+        self._pcm_buf = self._mix_buf if size == 32 else np.zeros((self.block_frames, out_channels), dtype=np.int16)
+
+    def play(self, start=0.0):
+        self.stop()
+        if self._file is None:
+            raise pygame.error("No file loaded")
+        start_frame = int(max(0.0, start) * self._file.samplerate)
+        self._file.seek(min(start_frame, max(0, self._file.frames - 1)))
+        self.dsp.reset()
+        pygame.mixer.set_reserved(1) # Keep channel 0 for the stream
+        self._channel = pygame.mixer.Channel(0)
+        self._channel.set_volume(self._volume)
+        self._paused = False
+        self._paused_total = 0.0
+        self._paused_at = None
+        self._clock_start = time.monotonic()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._feed_loop, args=(self._channel, self._stop_event), daemon=True)
+        self._thread.start()
+
+    def pause(self):
+        if self._channel and not self._paused:
+            self._channel.pause()
+            self._paused = True
+            self._paused_at = time.monotonic()
+
+    def unpause(self):
+        if self._channel and self._paused:
+            self._channel.unpause()
+            self._paused = False
+            self._paused_total += time.monotonic() - self._paused_at
+            self._paused_at = None
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            # Until the feed thread has exited it may still read self._file or queue on the
+            # mixer, which load()/close() tear down next; it notices the event within one block
+            self._thread.join()
+        if self._channel: # After the join, so no block is queued behind the stop
+            try: self._channel.stop()
+            except pygame.error: pass
+        self._thread = None
+        self._channel = None
+        self._paused = False
+        self._clock_start = None
+
+    def get_busy(self):
+        if self._channel is None or self._paused:
+            return False
+        return bool((self._thread and self._thread.is_alive()) or self._channel.get_busy())
+
+    def get_pos(self):
+        if self._clock_start is None:
+            return -1
+        now = self._paused_at if self._paused else time.monotonic()
+        return int(1000.0 * (now - self._clock_start - self._paused_total))
+
+    def set_volume(self, volume):
+        self._volume = float(volume)
+        if self._channel: self._channel.set_volume(self._volume)
+
+    def get_volume(self):
+        return self._volume
+
+    def close(self):
+        self.stop()
+        self._close_file()
+
+    def _close_file(self):
+        if self._file is not None:
+            try: self._file.close()
+            except Exception: pass
+            self._file = None
+
+    def _feed_loop(self, channel, stop_event):
+        """Stream thread: keeps one block playing and one queued on the channel."""
+        block_seconds = self.block_frames / float(self.dsp.sample_rate)
+        blocks_sent = 0
+        try:
+            while not stop_event.is_set():
+                if channel.get_busy() and channel.get_queue() is not None:
+                    stop_event.wait(block_seconds / 4.0) # Both slots full (or paused): wait
+                    continue
+                sound = self._next_block_sound()
+                if sound is None or stop_event.is_set():
+                    break # End of file (or stopped while decoding)
+                if channel.get_busy():
+                    channel.queue(sound)
+                else:
+                    if blocks_sent > 0:
+                        self.underruns += 1 # Channel ran dry before the next block was ready
+                    channel.play(sound)
+                blocks_sent += 1
+        except Exception as e:
+            log.error("DSP stream error: %s", e)
+
+    def _next_block_sound(self):
+        """Decodes, processes and converts the next block. Returns None at end of file."""
+        data = self._file.read(out=self._in_buf)
+        frames = len(data)
+        if frames == 0:
+            return None
+        block = self._mix_buf[:frames]
+        in_channels, out_channels = data.shape[1], block.shape[1]
+        if in_channels == out_channels or in_channels == 1:
+            block[...] = data # Same layout, or mono broadcast to all output channels
+        elif in_channels > out_channels:
+            block[...] = data[:, :out_channels] # More channels than the output: keep the first ones
+        else:
+            block[:, :in_channels] = data
+            block[:, in_channels:] = 0.0
+        self.dsp.process(block)
+        if self._pcm_buf is self._mix_buf:
+            pcm = block
+        else:
+            block *= 32767.0
+            pcm = self._pcm_buf[:frames]
+            np.copyto(pcm, block, casting='unsafe')
+        return pygame.mixer.Sound(buffer=pcm) # The Sound copies the samples, so the buffer can be reused
+
+
+class NullAudioOutput:
+    """
+    Silent audio output with the MixerMusicOutput interface, for headless runs and benchmarks.
+    The position follows `clock` (time.monotonic, or a scripted clock). A track stops being
+    busy once track_length(path) seconds have played (never, without track_length).
+    """
+    def __init__(self, clock=time.monotonic, track_length=None):
+        self.clock = clock
+        self.track_length = track_length
+        self.loads = 0
+        self._path = None
+        self._length = None
+        self._start = 0.0
+        self._volume = 1.0
+        self._clock_start = None # clock() at play()
+        self._paused_at = None
+        self._paused_total = 0.0
+
+    def is_ready(self): return True
+
+    def load(self, path):
+        self.stop()
+        self._path = path
+        self._length = self.track_length(path) if self.track_length else None
+        self.loads += 1
+
+    def play(self, start=0.0):
+        if self._path is None:
+            raise RuntimeError("No file loaded")
+        self._start = max(0.0, start)
+        self._clock_start = self.clock()
+        self._paused_at = None
+        self._paused_total = 0.0
+
+    def pause(self):
+        if self._clock_start is not None and self._paused_at is None:
+            self._paused_at = self.clock()
+
+    def unpause(self):
+        if self._paused_at is not None:
+            self._paused_total += self.clock() - self._paused_at
+            self._paused_at = None
+
+    def stop(self):
+        self._clock_start = None
+        self._paused_at = None
+
+    def get_busy(self):
+        if self._clock_start is None or self._paused_at is not None:
+            return False
+        return self._length is None or self._start + self._elapsed() < self._length
+
+    def get_pos(self):
+        if self._clock_start is None:
+            return -1
+        return int(1000.0 * self._elapsed())
+
+    def set_volume(self, volume): self._volume = float(volume)
+    def get_volume(self): return self._volume
+    def close(self): self.stop()
+
+    def _elapsed(self):
+        now = self._paused_at if self._paused_at is not None else self.clock()
+        return now - self._clock_start - self._paused_total
+
+
+def decode_waveform_data(song_path, abort_flag, osc_downsample_factor, target_points=WAVEFORM_TARGET_POINTS, memory=None):
+    """
+    Decodes an audio file with soundfile and builds the oscilloscope samples and waveform peaks.
+    Returns (peak_data, raw_data, effective_sample_rate), or None if abort_flag was set.
+    With a MemoryBudget, raw_data may be int16 (scaled by INT16_FULL_SCALE), more decimated
+    or memory-mapped so the track fits; otherwise it is float64 at 1/osc_downsample_factor rate.
+    Raises on load/processing errors so the caller can map them to a display message.
+    """
+    # --- Check for abort signal frequently ---
+    if abort_flag.is_set():
+        return None
+
+    # --- Load Audio using soundfile ---
+    # soundfile supports many formats (MP3, FLAC, OGG, WAV etc.) via libsndfile
+    # always_2d=True ensures consistent shape even for mono files
+    if not os.path.exists(song_path):
+        raise FileNotFoundError(f"Audio file not found: {song_path}")
+
+    decode_started = PERF.start()
+    peaks_seconds = 0.0
+    try:
+        audio_file = sf.SoundFile(song_path)
+    except (sf.SoundFileError, OSError, MemoryError):
+        raise # Let the caller report these as they are
+    except Exception as load_err:
+        # Check specifically for missing libsndfile library
+        if "sndfile library not found" in str(load_err).lower():
+            raise ImportError(f"libsndfile not found. Soundfile cannot operate. Error: {load_err}")
+        raise RuntimeError(f"Soundfile load failed: {load_err}")
+
+    # Decode in blocks, mixing each to mono and reducing it straight to oscilloscope samples and
+    # peaks, so the full-rate track is never held and an aborted decode stops within one block.
+    # Allocation failures (MemoryError, OSError from the memmap file) reach the caller unchanged
+    with audio_file:
+        original_sample_rate = audio_file.samplerate
+        estimated_frames = max(0, audio_file.frames) # An estimate for some formats (e.g. some MP3s)
+        if memory is not None:
+            factor, sample_dtype, use_memmap = memory.plan_samples(estimated_frames, original_sample_rate, osc_downsample_factor)
+        else:
+            factor, sample_dtype, use_memmap = max(1, int(osc_downsample_factor)), np.float64, False
+        raw_data = allocate_samples(-(-estimated_frames // factor), sample_dtype, use_memmap)
+        stored = 0
+        # Peaks: max |sample| per chunk of chunk_size frames, the last chunk possibly shorter
+        chunk_size = max(1, estimated_frames // target_points) if estimated_frames else DECODE_BLOCK_FRAMES
+        peak_parts = []
+        partial_peak, partial_fill = 0.0, 0
+        filled = 0
+        for block in audio_file.blocks(blocksize=DECODE_BLOCK_FRAMES, dtype='float64', always_2d=True):
+            if abort_flag.is_set():
+                return None
+            # Convert to mono if stereo by averaging channels
+            mono = np.mean(block, axis=1) if block.shape[1] > 1 else block[:, 0]
+
+            # --- Oscilloscope samples: every factor-th frame of the track ---
+            picked = mono[(-filled) % factor::factor]
+            if stored + len(picked) > len(raw_data): # Frame count was an estimate
+                grown = allocate_samples(max(stored + len(picked), len(raw_data) * 3 // 2), sample_dtype, use_memmap)
+                grown[:stored] = raw_data[:stored]
+                raw_data = grown
+            if sample_dtype == np.int16:
+                raw_data[stored:stored + len(picked)] = np.rint(np.clip(picked, -1.0, 1.0) * INT16_FULL_SCALE)
+            else:
+                raw_data[stored:stored + len(picked)] = picked
+            stored += len(picked)
+
+            # --- Peaks, vectorised per block ---
+            peaks_started = time.perf_counter()
+            magnitude = np.abs(mono)
+            pos = 0
+            if partial_fill: # Complete the chunk left open by the previous block
+                take = min(len(magnitude), chunk_size - partial_fill)
+                partial_peak = max(partial_peak, float(magnitude[:take].max()))
+                partial_fill += take
+                pos = take
+                if partial_fill == chunk_size:
+                    peak_parts.append(np.array([partial_peak]))
+                    partial_peak, partial_fill = 0.0, 0
+            whole = (len(magnitude) - pos) // chunk_size
+            if whole:
+                peak_parts.append(magnitude[pos:pos + whole * chunk_size].reshape(whole, chunk_size).max(axis=1))
+                pos += whole * chunk_size
+            if pos < len(magnitude):
+                partial_peak, partial_fill = float(magnitude[pos:].max()), len(magnitude) - pos
+            peaks_seconds += time.perf_counter() - peaks_started
+            filled += len(block)
+    if partial_fill:
+        peak_parts.append(np.array([partial_peak]))
+    raw_data = raw_data[:stored]
+    peak_data = np.concatenate(peak_parts) if peak_parts else np.array([])
+    PERF.stop("decode", decode_started)
+    PERF.record("peaks", peaks_seconds * 1000.0) # The peak reduction's share of the decode pass
+
+    if abort_flag.is_set():
+        return None
+
+    # --- Process Audio Data ---
+    if filled == 0:
+        raise ValueError("Audio file contains no samples.")
+
+    # Check for silence (optional, but can be informative)
+    if not np.any(peak_data):
+        log.warning("Audio file %s appears to be silent.", os.path.basename(song_path))
+
+    effective_sample_rate = original_sample_rate / factor
+    return peak_data, raw_data, effective_sample_rate
+
+
+class PlayerEngine:
+    """
+    Playback core without any UI: the current track, play/pause/stop/seek transitions, loop
+    and mix modes and what happens when a track ends. Audio goes through an output with the
+    MixerMusicOutput interface (pygame, the DSP stream or NullAudioOutput), so the logic runs
+    headless. Front ends subscribe(callback) and get callback(event, detail) synchronously:
+      "loading"     detail=resumed   a track is about to be (re)loaded
+      "track"       detail=resumed   it loaded and started (resumed: from stopped_position)
+      "load_failed" detail=(path, exception)  it couldn't be loaded/played; state is stopped
+      "state"       detail="playing" | "paused" | "resumed" | "stopped"
+      "seek"        detail=position  seek() moved the position
+      "ended"       detail=path      the track reached its end (state is already stopped)
+      "finished"    detail=path      the end of the tracklist was reached without looping
+      "error"       detail=exception a pause/resume/seek/end check failed
+    """
+    def __init__(self, output, tracks=None, shuffle_order=None, track_length=None, prepare_output=None):
+        self.output = output
+        self.tracks = tracks if tracks is not None else TracklistModel()
+        self.shuffle_order = shuffle_order if shuffle_order is not None else ShuffleOrder()
+        self.track_length = track_length # path -> seconds (0.0 if unknown); None: always 0.0
+        self.prepare_output = prepare_output # Called with the path before each load (e.g. native rate)
+        self.current_song = ""
+        self.current_song_index = 0
+        self.playing_state = False
+        self.paused = False
+        self.stopped_position = 0.0 # Position in seconds when stopped/paused, and the base of get_pos() while playing
+        self.song_time = 0.0 # Last known position in seconds
+        self.song_length = 0.0
+        self.shuffle_state = False
+        self.loop_state = 0 # 0: No loop, 1: Loop all, 2: Loop one
+        self._listeners = []
+
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    def _notify(self, event, detail=None):
+        for callback in self._listeners:
+            callback(event, detail)
+
+    # --- Transitions ---
+
+    def play_index(self, index, start=0.0):
+        """Loads the track at index and plays it from `start` seconds. Returns True if it started."""
+        if index is None or not (0 <= index < len(self.tracks)):
+            return False
+        song_path = self.tracks[index]
+        resumed = start > 0 and song_path == self.current_song
+        self.current_song_index = index
+        self.current_song = song_path
+        self.stopped_position = self.song_time = max(0.0, start)
+        self._notify("loading", resumed)
+        try:
+            self.output.stop() # Stop potential previous playback cleanly
+            if self.prepare_output:
+                self.prepare_output(song_path)
+            self.output.load(song_path)
+            self.song_length = self.track_length(song_path) if self.track_length else 0.0
+            self.output.play(start=self.stopped_position)
+        except Exception as e:
+            self.playing_state = False; self.paused = False; self.current_song = "" # Reset state
+            self._notify("load_failed", (song_path, e))
+            return False
+        self.playing_state = True
+        self.paused = False
+        log.debug("%s: %s at %.2fs", "Resuming stopped playback" if resumed else "Starting new playback",
+                  os.path.basename(song_path), start)
+        self._notify("track", resumed)
+        self._notify("state", "playing")
+        return True
+
+    def toggle_play_pause(self, selected_index=-1):
+        """Pauses, resumes, or starts playback: the selected track, else the stopped/current one, else the first."""
+        if not self.tracks:
+            return
+        if self.playing_state:
+            self.pause()
+        elif self.paused:
+            self.resume()
+        else:
+            index, resume = self._track_to_start(selected_index)
+            self.play_index(index, start=self.stopped_position if resume else 0.0)
+
+    def _track_to_start(self, selected_index):
+        """Returns (index, resume) for PLAY pressed while stopped."""
+        current_valid = 0 <= self.current_song_index < len(self.tracks) and \
+                        self.tracks[self.current_song_index] == self.current_song
+        if 0 <= selected_index < len(self.tracks):
+            index = selected_index
+        elif self.current_song and self.stopped_position > 0 and current_valid:
+            return self.current_song_index, True # Nothing selected: resume the track stopped mid-way
+        elif 0 <= self.current_song_index < len(self.tracks):
+            index = self.current_song_index
+        else:
+            index = 0
+        resume = index == self.current_song_index and self.stopped_position > 0 and \
+                 self.current_song == self.tracks[index]
+        return index, resume
+
+    def pause(self):
+        if not self.playing_state or self.paused:
+            return
+        try:
+            self.stopped_position = self.song_time = self.position()
+            self.output.pause()
+        except Exception as e:
+            self._notify("error", e)
+            return
+        self.paused = True
+        self.playing_state = False # Not actively playing anymore
+        log.debug("Playback Paused at %.2fs", self.stopped_position)
+        self._notify("state", "paused")
+
+    def resume(self):
+        if not self.paused:
+            return
+        try:
+            self.output.unpause()
+        except Exception as e:
+            self._notify("error", e)
+            return
+        self.paused = False
+        self.playing_state = True
+        # stopped_position already holds the resume time
+        log.debug("Resumed playback from %.2fs", self.stopped_position)
+        self._notify("state", "resumed")
+
+    def stop(self):
+        """Stops playback and records the position. Returns False if nothing was playing or paused."""
+        if not (self.playing_state or self.paused):
+            return False
+        final_pos = self.stopped_position if self.paused else self.song_time
+        try:
+            if self.playing_state:
+                final_pos = self.position()
+            self.output.stop()
+        except Exception as e:
+            log.warning("Audio output error during stop: %s", e)
+        self.playing_state = False
+        self.paused = False
+        # Clip to length, or allow slightly over if the length is unknown
+        self.stopped_position = float(np.clip(final_pos, 0.0, self.song_length if self.song_length > 0 else final_pos + 1.0))
+        self.song_time = self.stopped_position
+        log.debug("Stopped. Recorded pos: %.2fs", self.stopped_position)
+        self._notify("state", "stopped")
+        return True
+
+    def seek(self, position_seconds):
+        """Moves to position_seconds; keeps playing/paused state (a stopped player starts there next time)."""
+        if not (self.current_song and self.song_length > 0 and self.output.is_ready()):
+            log.debug("Seek ignored: No song, zero length, or mixer not initialized.")
+            return False
+        # Clamp slightly before the end; seeking exactly to the end is unreliable
+        seek_pos = float(np.clip(position_seconds, 0.0, self.song_length - 0.1 if self.song_length > 0.1 else 0.0))
+        log.debug("Seeking to: %.2fs (requested: %.2fs)", seek_pos, position_seconds)
+        self.stopped_position = self.song_time = seek_pos
+        self._notify("seek", seek_pos)
+        if not (self.playing_state or self.paused):
+            log.debug("Player stopped, updated next start pos to %.2fs", seek_pos)
+            return True
+        was_paused = self.paused
+        try:
+            # pygame.mixer.music.set_pos() is unreliable; stop/load/play(start=...) is the safe way
+            self.output.stop()
+            self.output.load(self.current_song)
+            self.output.play(start=seek_pos)
+            if was_paused:
+                self.output.pause()
+        except Exception as e:
+            self.playing_state = False; self.paused = False
+            self._notify("error", e)
+            return False
+        self.playing_state = not was_paused
+        self.paused = was_paused
+        self._notify("state", "paused" if was_paused else "playing")
+        return True
+
+    # --- Position / End of Track ---
+
+    def position(self):
+        """Current position in seconds: the output clock while playing, else the last known time."""
+        if self.playing_state and self.output.is_ready() and self.output.get_busy():
+            pos_ms = self.output.get_pos() # Time since the last play()/unpause, -1 if unknown
+            if pos_ms != -1:
+                return self.stopped_position + pos_ms / 1000.0
+        return self.song_time
+
+    def update_position(self):
+        """Advances song_time from the output while playing. Returns it, or None if the output isn't running."""
+        if not self.playing_state or self.paused:
+            return None
+        if not (self.output.is_ready() and self.output.get_busy()):
+            return None
+        pos_ms = self.output.get_pos()
+        if pos_ms == -1:
+            return None
+        # Prevent runaway time: clip to the length plus a small buffer
+        position = self.stopped_position + pos_ms / 1000.0
+        self.song_time = float(np.clip(position, 0.0, (self.song_length + 0.1) if self.song_length > 0 else position + 1.0))
+        return self.song_time
+
+    def end_pending(self):
+        """True if the track looks finished (past its length, or the output stopped by itself)."""
+        if not self.playing_state:
+            return False
+        is_past_end = self.song_length > 0 and self.song_time >= self.song_length - 0.05
+        return is_past_end or (self.output.is_ready() and not self.output.get_busy())
+
+    def check_end(self):
+        """Confirms the end of the current track and switches to stopped at its end. Returns True if it ended."""
+        if not self.playing_state or self.paused:
+            return False
+        try:
+            is_at_end = self.song_length > 0 and self.song_time >= self.song_length - 0.05
+            output_stopped = self.output.is_ready() and not self.output.get_busy()
+            pos_error = self.output.is_ready() and self.output.get_pos() == -1
+            if not (output_stopped or pos_error or is_at_end):
+                if not self.output.is_ready():
+                    log.debug("Mixer stopped unexpectedly.")
+                    self.stop()
+                return False
+        except Exception as e:
+            self._notify("error", e)
+            self.stop()
+            return False
+        log.debug("Detected song end: %s (OutputStopped: %s, PosError: %s, IsAtEnd: %s)",
+                  os.path.basename(self.current_song), output_stopped, pos_error, is_at_end)
+        self.playing_state = False
+        self.paused = False
+        self.stopped_position = self.song_time = self.song_length if self.song_length > 0 else 0.0
+        self._notify("ended", self.current_song)
+        return True
+
+    def advance_after_end(self):
+        """After a track ended: replays it (Loop One), moves on (Loop All / MIX / more tracks) or finishes."""
+        if not self.tracks:
+            return
+        if self.loop_state == 2:
+            log.debug("Looping current song.")
+            self.play_index(self.current_song_index)
+        elif self.loop_state == 1 or self.shuffle_state or self.current_song_index < len(self.tracks) - 1:
+            if self.shuffle_state: log.debug("Mix on - playing random.")
+            elif self.loop_state == 1: log.debug("Looping all - playing next.")
+            else: log.debug("Playing next song in sequence.")
+            self.play_index(self.next_track_index())
+        else:
+            log.info("End of tracklist reached.")
+            last_song = self.current_song
+            self.stopped_position = self.song_time = 0.0
+            self.current_song_index = 0 # PLAY starts over from the first track
+            self._notify("finished", last_song)
+
+    # --- Track Order ---
+
+    def next_track_index(self):
+        """Index of the next track: the next shuffle entry with MIX on (advances it), else the next row, wrapping."""
+        if not self.tracks:
+            return None
+        if self.shuffle_state and len(self.tracks) > 1:
+            # Next entry of the shuffle permutation (O(1), no repeats until exhausted)
+            self.sync_shuffle_current()
+            next_path = self.shuffle_order.next()
+            if next_path == self.current_song:
+                next_path = self.shuffle_order.next() # Never replay the same track back-to-back
+            return self.tracks.index_of_path(next_path)
+        if self.shuffle_state:
+            return 0
+        return (self.current_song_index + 1) % len(self.tracks)
+
+    def previous_track_index(self):
+        """Index of the previous track: back through the shuffle history with MIX on, else the previous row."""
+        if not self.tracks:
+            return None
+        if self.shuffle_state:
+            self.sync_shuffle_current()
+            previous_path = self.shuffle_order.previous()
+            if previous_path is not None:
+                return self.tracks.index_of_path(previous_path)
+        return (self.current_song_index - 1 + len(self.tracks)) % len(self.tracks)
+
+    def upcoming_index(self):
+        """Index of the track expected to play next (without advancing anything), or None if unknown."""
+        if not self.tracks or not (0 <= self.current_song_index < len(self.tracks)):
+            return None
+        if self.loop_state == 2 or len(self.tracks) == 1:
+            return None # Loop One replays the current track
+        if self.shuffle_state:
+            # The shuffle permutation knows what comes next (None at the end of a cycle)
+            self.sync_shuffle_current()
+            upcoming = self.shuffle_order.upcoming(1)
+            return self.tracks.index_of_path(upcoming[0]) if upcoming else None
+        next_index = self.current_song_index + 1
+        if next_index >= len(self.tracks):
+            if self.loop_state != 1:
+                return None # End of tracklist, nothing follows
+            next_index = 0
+        return next_index
+
+    def sync_shuffle_current(self):
+        """Aligns the shuffle cursor with a track the user picked by hand."""
+        if self.current_song and self.shuffle_order.current != self.current_song:
+            self.shuffle_order.set_current(self.current_song)
+
+    def set_shuffle(self, enabled):
+        self.shuffle_state = bool(enabled)
+        if self.shuffle_state:
+            # Start a fresh permutation with the current track as the first played entry
+            current = self.current_song if self.current_song in self.tracks else None
+            self.shuffle_order.reset(self.tracks, current=current)
+
+    def cycle_loop(self):
+        """OFF -> ALL -> ONE -> OFF."""
+        self.loop_state = (self.loop_state + 1) % 3
+        return self.loop_state
+
+
+# --- Control Socket ---
+CONTROL_SOCKET_PATH = os.path.join(MN1_DATA_DIR, "control.sock")
+CONTROL_COMMANDS = ("play", "pause", "seek", "next", "enqueue", "status")
+CONTROL_MAX_REQUEST = 64 * 1024 # Longest accepted request line in bytes (enqueue can carry many paths)
+CONTROL_REPLY_TIMEOUT = 5.0 # Seconds a command may wait for the Tk thread before the client gets an error
+
+
+class ControlServer:
+    """
+    Local control socket. An asyncio loop on its own thread accepts newline-delimited JSON
+    requests such as {"cmd": "seek", "position": 30}. "status" is answered on that thread from
+    the last published snapshot; every other command is queued for the Tk thread, which is
+    woken through a socket pair (fileno()) and runs it in process_pending(). Each request gets
+    one reply line: {"ok": true, "result": ...} or {"ok": false, "error": "..."}, echoing "id".
+    """
+
+    def __init__(self, path, handler):
+        self.path = path
+        self.handler = handler # handler(request) -> result, called by process_pending()
+        self.snapshot = ({}, time.monotonic()) # (status dict, when it was published); replaced, never mutated
+        self.pending = queue.Queue() # (request, future) waiting for the Tk thread
+        self._wake_recv, self._wake_send = socket.socketpair()
+        self._wake_recv.setblocking(False)
+        self._wake_send.setblocking(False)
+        self.loop = None
+        self.thread = None
+        self.handled = 0 # Commands run by process_pending()
+        self.status_queries = 0
+
+    def fileno(self):
+        """Readable when commands are waiting for process_pending()."""
+        return self._wake_recv.fileno()
+
+    def start(self, timeout=2.0):
+        """Binds the socket and starts the server thread. Raises OSError if it can't listen."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._remove_stale_socket()
+        ready, failure = threading.Event(), []
+        self.thread = threading.Thread(target=self._run, args=(ready, failure), name="mn1-control", daemon=True)
+        self.thread.start()
+        if not ready.wait(timeout):
+            raise OSError(f"Control socket did not start within {timeout}s")
+        if failure:
+            raise OSError(f"Could not listen on {self.path}: {failure[0]}")
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self.path):
+            return
+        probe = socket.socket(socket.AF_UNIX)
+        try:
+            probe.connect(self.path)
+        except OSError:
+            os.unlink(self.path) # Left behind by a player that didn't shut down cleanly
+        else:
+            raise OSError(f"Another player is already listening on {self.path}")
+        finally:
+            probe.close()
+
+    def _run(self, ready, failure):
+        """Server thread: runs the asyncio loop until close()."""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            server = self.loop.run_until_complete(
+                asyncio.start_unix_server(self._serve_client, self.path, limit=CONTROL_MAX_REQUEST))
+            os.chmod(self.path, 0o600) # Only this user may control the player
+        except Exception as e:
+            failure.append(e)
+            self.loop.close()
+            ready.set()
+            return
+        ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            # Drop open connections, then the listener
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            server.close()
+            self.loop.run_until_complete(server.wait_closed())
+            self.loop.close()
+
+    async def _serve_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError: # Longer than CONTROL_MAX_REQUEST
+                    writer.write(self._encode({"ok": False, "error": "request too long"}))
+                    break
+                if not line:
+                    break
+                writer.write(self._encode(await self._reply(line)))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _reply(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return {"ok": False, "error": "invalid JSON"}
+        if not isinstance(request, dict) or request.get("cmd") not in CONTROL_COMMANDS:
+            return {"ok": False, "error": f"unknown command, expected one of: {', '.join(CONTROL_COMMANDS)}"}
+        if request["cmd"] == "status":
+            self.status_queries += 1
+            reply = {"ok": True, "result": self.status()}
+        else:
+            future = self.loop.create_future()
+            self.pending.put((request, future))
+            try:
+                self._wake_send.send(b"\0")
+            except OSError:
+                pass # Buffer full: a wake-up is already pending
+            try:
+                reply = await asyncio.wait_for(future, CONTROL_REPLY_TIMEOUT)
+            except asyncio.TimeoutError:
+                future.cancel() # The client was told it failed: process_pending() must not run it later
+                reply = {"ok": False, "error": "player did not respond"}
+        if "id" in request:
+            reply["id"] = request["id"]
+        return reply
+
+    @staticmethod
+    def _encode(reply):
+        return json.dumps(reply, separators=(",", ":")).encode("utf-8") + b"\n"
+
+    def publish(self, snapshot):
+        """Sets the status reported to clients (call from the thread that owns the player state)."""
+        self.snapshot = (snapshot, time.monotonic())
+
+    def status(self):
+        """The last published snapshot, with the position advanced to now while playing."""
+        snapshot, published = self.snapshot
+        snapshot = dict(snapshot)
+        if snapshot.get("state") == "playing":
+            position = snapshot["position"] + time.monotonic() - published
+            snapshot["position"] = round(min(position, snapshot["length"]) if snapshot["length"] > 0 else position, 3)
+        return snapshot
+
+    def process_pending(self, *args):
+        """Runs the queued commands. Call on the Tk thread when fileno() is readable (args: Tk file handler)."""
+        try:
+            while self._wake_recv.recv(4096):
+                pass
+        except OSError:
+            pass # Drained (BlockingIOError) or closed
+        while True:
+            try:
+                request, future = self.pending.get_nowait()
+            except queue.Empty:
+                return
+            if future.done(): # Timed out (cancelled) while queued; a retrying client must not get it twice
+                log.debug("Control command '%s' dropped, client already timed out", request["cmd"])
+                continue
+            try:
+                reply = {"ok": True, "result": self.handler(request)}
+            except ValueError as e: # Bad arguments
+                reply = {"ok": False, "error": str(e)}
+            except Exception as e:
+                log.exception("Control command '%s' failed", request["cmd"])
+                reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.handled += 1
+            try:
+                self.loop.call_soon_threadsafe(self._resolve, future, reply)
+            except RuntimeError:
+                pass # Server already closed
+
+    @staticmethod
+    def _resolve(future, reply):
+        if not future.done(): # The client may have timed out
+            future.set_result(reply)
+
+    def close(self, timeout=1.0):
+        """Stops the server thread and removes the socket file."""
+        if self.thread and self.thread.is_alive():
+            try:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+            except RuntimeError:
+                pass
+            self.thread.join(timeout)
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        self._wake_recv.close()
+        self._wake_send.close()
+
+
+def _engine_state(name):
+    """Class attribute that forwards a playback state attribute to the player's PlayerEngine."""
+    return property(lambda self: getattr(self.engine, name), lambda self, value: setattr(self.engine, name, value))
+
+
 class MN1MusicPlayer:
-    def __init__(self, root):
+    # Playback state is owned by the PlayerEngine; the UI reads (and restores) it through these
+    current_song = _engine_state("current_song")
+    current_song_index = _engine_state("current_song_index")
+    playing_state = _engine_state("playing_state")
+    paused = _engine_state("paused")
+    stopped_position = _engine_state("stopped_position")
+    song_time = _engine_state("song_time")
+    song_length = _engine_state("song_length")
+    shuffle_state = _engine_state("shuffle_state")
+    loop_state = _engine_state("loop_state")
+    shuffle_order = _engine_state("shuffle_order")
+
+    def __init__(self, root, decoded_cache_mb=DECODED_CACHE_BUDGET_MB, native_rate_output=False, dsp_chain=None,
+                 library=None, session_path=SESSION_PATH, control_socket=None, perf_json=None,
+                 memory_budget_mb=MEMORY_BUDGET_MB):
         self.root = root
         self.root.title("MN-1")
         self.root.geometry("800x650")
@@ -179,10 +3213,10 @@ class MN1MusicPlayer:
         try:
             if os.name == 'nt': # Windows
                 self.root.wm_attributes("-topmost", True)
-                print("Window set to always on top.")
+                log.info("Window set to always on top.")
             # Add similar checks for other OS if needed (e.g., using platform module)
         except Exception as e:
-            print(f"Could not set always-on-top attribute: {e}")
+            log.warning("Could not set always-on-top attribute: %s", e)
 
         # Themes
         self.themes = THEMES
@@ -197,22 +3231,23 @@ class MN1MusicPlayer:
         try:
             pygame.mixer.init()
         except pygame.error as e:
-            print(f"FATAL: Error initializing pygame mixer: {e}")
+            log.critical("Error initializing pygame mixer: %s", e)
             try:
                 import tkinter.messagebox
                 tkinter.messagebox.showerror("Pygame Error", f"Could not initialize audio output.\nError: {e}\n\nThe application might not play sound.")
             except: pass # Ignore if messagebox fails
 
+        # Audio output: pygame.mixer.music streaming, or block decoding through the DSP chain
+        self.dsp_chain = dsp_chain
+        self.audio_output = DSPStreamOutput(dsp_chain) if dsp_chain is not None else MixerMusicOutput()
+
         # Player State Variables
-        self.current_song = ""
-        self.songs_list = []
-        self.current_song_index = 0
+        self.songs_list = TracklistModel() # Ordered paths with stable IDs; list-like for index access
+        # Playback core (current track, play/pause/seek state, loop/mix); the widgets follow its events
+        self.engine = PlayerEngine(self.audio_output, self.songs_list, ShuffleOrder(),
+                                   track_length=self._track_length, prepare_output=self._ensure_output_rate)
+        self.engine.subscribe(self._on_engine_event)
         self.previous_volume = 0.5
-        self.stopped_position = 0.0 # Store position in seconds when stopped/paused
-        self.playing_state = False
-        self.paused = False
-        self.shuffle_state = False
-        self.loop_state = 0  # 0: No loop, 1: Loop all, 2: Loop one
         self.muted = False
         self.slider_active = False  # True when user is dragging the song slider
         self.waveform_dragging = False # True when user is dragging on waveform plot
@@ -222,8 +3257,40 @@ class MN1MusicPlayer:
         self.has_error = False
         self.sidebar_visible = True
 
-        try: pygame.mixer.music.set_volume(self.previous_volume)
-        except Exception as e: print(f"Warning: Could not set initial volume: {e}")
+        # Native sample rate output: re-open the mixer at each track's rate instead of resampling
+        self.native_rate_output = native_rate_output
+        self.native_rate_by_path = {} # song path -> sample rate reported by soundfile
+        self.output_reopen_count = 0
+
+        # Debounced track switching: after() id of the pending load, if any
+        self.pending_track_switch = None
+
+        # All background work (decode, prefetch, probes, thumbnails) runs on one bounded, prioritised pool
+        self.tasks = TaskExecutor(self.root)
+        # Background import (metadata probing off the Tk thread)
+        self.import_job = None
+        # Tracklist thumbnails: rendered off-thread for visible rows into a bounded LRU of CTkImages
+        self.thumbnail_images = OrderedDict() # (path, color) -> CTkImage, or False if the file can't be analysed
+        # Tracklist filter: trigram index over names/tags, kept in step with songs_list
+        self.search_index = TrackSearchIndex()
+        self.filter_update_pending = None
+        self.applied_filter = "" # Filter text the view currently reflects
+        self.filter_entry = None
+        # Persistent metadata index (duration, format, tags), so files are only parsed when they change
+        self.library = library if library is not None else LibraryIndex()
+        self.session_path = session_path # None disables session save/restore
+        self.thumbnailer = ThumbnailRenderer(self.library, self.tasks, self._on_thumbnail_ready)
+        self.restore_work = None # SlicedWork adding restored rows
+        # Scripting socket (off unless a path is given); status queries read a snapshot published on the Tk thread
+        self.control_server = None
+        self.status_publish_pending = None
+        # Hot-path timing overlay (F2) and JSON dump (F3, and on close when perf_json is set)
+        self.perf_json = perf_json
+        self.perf_overlay = None
+        self.perf_overlay_after_id = None
+
+        try: self.audio_output.set_volume(self.previous_volume)
+        except Exception as e: log.warning("Could not set initial volume: %s", e)
 
         # Fonts
         self.title_font = ("SF Mono", 16, "bold")
@@ -244,20 +3311,31 @@ class MN1MusicPlayer:
         self.waveform_peak_data = None # Holds processed peak data for static waveform
         self.raw_sample_data = None # Holds raw (or downsampled) sample data for oscilloscope
         self.sample_rate = None # Effective sample rate of raw_sample_data
-        self.waveform_thread = None
-        self.waveform_abort_flag = threading.Event()
+        self.waveform_token = None # TaskToken of the decode in flight for the current song
+
+        # Decoded audio cache (recently played + prefetched tracks) and prefetch worker
+        self.decoded_cache = DecodedAudioCache(decoded_cache_mb)
+        self.prefetch_token = None # TaskToken of the prefetch decode in flight
+
+        # Global memory budget: the current track's samples are planned to fit, the cache yields to them
+        self.memory = MemoryBudget(memory_budget_mb)
+        self.memory.add_source("track", lambda: buffer_nbytes(self.raw_sample_data) + buffer_nbytes(self.waveform_peak_data))
+        self.memory.add_source("cache", lambda: self.decoded_cache.bytes_excluding(self._shared_cache_key()),
+                               lambda limit: self.decoded_cache.trim(limit, keep=self._shared_cache_key()))
+        self.image_bytes = 0 # Rendered images estimate; updated on the Tk thread, read by the decode workers
+        self.memory.add_source("images", lambda: self.image_bytes)
+        self.window_minimized = False # Buffers are released while minimized and reloaded on restore
 
         # Oscilloscope parameters
         self.osc_window_seconds = 0.05 # Time window to display
         self.osc_downsample_factor = 5 # Downsample raw audio for performance
 
         # Time & Title Variables
-        self.song_length = 0.0 # In seconds
-        self.song_time = 0.0 # Current playback time in seconds
         self.time_elapsed = "00:00"
         self.total_time = "00:00"
-        self.update_thread = None
-        self.thread_running = False
+        self.update_loop_running = False # Position/visual updates, driven by root.after while playing
+        self.update_after_id = None
+        self.update_wakeups = 0 # Update loop ticks (for the wake-up measurement)
         self.song_title_var = ctk.StringVar(value="NO SONG LOADED")
 
         # --- Add placeholder for play/pause button reference ---
@@ -272,6 +3350,9 @@ class MN1MusicPlayer:
         self.create_oscilloscope_display()
         self.create_controls()
         self.create_tracklist_area()
+        for fig in (self.fig_wave, self.fig_osc): # Canvas resizes (Tk thread) update the image estimate
+            fig.canvas.mpl_connect('resize_event', lambda event: self._update_image_bytes())
+        self._update_image_bytes()
         self.apply_theme() # Apply default theme
 
         # Draw initial placeholder plots
@@ -280,8 +3361,20 @@ class MN1MusicPlayer:
         self.draw_initial_placeholder(self.ax_wave, self.fig_wave, initial_spine_color, "LOAD A SONG")
         self.draw_initial_placeholder(self.ax_osc, self.fig_osc, initial_spine_color, "")
 
+        # Restore the previous tracklist (rows show immediately, files are checked in the background)
+        self.restore_session()
+
+        if control_socket:
+            self.start_control_server(control_socket)
+
         # Bind close event
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.root.bind("<F2>", self.toggle_perf_overlay)
+        self.root.bind("<F3>", self.dump_perf_stats)
+        self.root.bind("<F4>", self.toggle_profiling)
+        self.root.bind("<Unmap>", self._on_window_unmap)
+        self.root.bind("<Map>", self._on_window_map)
+        self._show_profiling_state()
 
     def _configure_axes(self, ax, fig, spine_color, bg_color):
         """Helper to configure Matplotlib axes appearance."""
@@ -440,7 +3533,7 @@ class MN1MusicPlayer:
                  self.position_indicator_line_wave = None
 
         except Exception as e:
-            print(f"Error drawing placeholder: {e}")
+            log.error("Error drawing placeholder: %s", e)
             # traceback.print_exc() # Optional: for more detailed error
 
 
@@ -506,15 +3599,30 @@ class MN1MusicPlayer:
         self.playlist_label_frame.grid(row=0, column=0, sticky="ew", pady=5)
         self.tracklist_label = ctk.CTkLabel(self.playlist_label_frame, text="TRACKLIST", font=self.title_font)
         self.tracklist_label.pack(anchor="center") # Center the label
+        # Filter box: narrows the tracklist by file name / tags as you type
+        # (No textvariable: CTkEntry only shows its placeholder without one)
+        self.filter_entry = ctk.CTkEntry(self.playlist_label_frame, placeholder_text="FILTER",
+                                         font=self.normal_font, corner_radius=0, border_width=1)
+        self.filter_entry.pack(fill="x", padx=5, pady=(5, 0))
+        self.filter_entry.bind("<KeyRelease>", lambda e: self._apply_filter())
+        self.filter_entry.bind("<Escape>", self._clear_filter)
 
         # Playlist Scrollable Frame
         self.playlist_frame = ctk.CTkFrame(self.right_frame, corner_radius=0)
         self.playlist_frame.grid(row=1, column=0, sticky="nsew", padx=5, pady=0)
         self.playlist_frame.grid_rowconfigure(0, weight=1)
         self.playlist_frame.grid_columnconfigure(0, weight=1)
-        self.playlist_scrollable = ctk.CTkScrollableFrame(self.playlist_frame)
-        self.playlist_scrollable.grid(row=0, column=0, sticky="nsew")
-        self.playlist_entries = [] # List to hold dictionaries for each song entry widget
+        # Virtualized: a fixed pool of row widgets is re-bound to songs_list as it scrolls
+        self.tracklist_view = VirtualTrackList(self.playlist_frame, self.songs_list,
+                                               thumbnail_for=self._thumbnail_for,
+                                               on_visible=self.thumbnailer.set_visible,
+                                               on_select=self.select_song,
+                                               on_activate=self.play_selected_song_by_index,
+                                               font=self.normal_font)
+        self.tracklist_view.frame.grid(row=0, column=0, sticky="nsew")
+        # Any model change just schedules one coalesced re-render of the visible rows
+        self.songs_list.subscribe(lambda event, track_id, index: self.tracklist_view.refresh())
+        self.songs_list.subscribe(self._on_tracklist_changed)
 
         # Playlist Buttons Frame (Load, Remove, Clear)
         self.playlist_buttons_frame = ctk.CTkFrame(self.right_frame, corner_radius=0)
@@ -523,16 +3631,22 @@ class MN1MusicPlayer:
         self.playlist_buttons_frame.grid_columnconfigure(0, weight=1)
         self.playlist_buttons_frame.grid_columnconfigure(1, weight=1)
         self.playlist_buttons_frame.grid_columnconfigure(2, weight=1)
+        self.playlist_buttons_frame.grid_columnconfigure(3, weight=1)
+        self.playlist_buttons_frame.grid_columnconfigure(4, weight=1)
 
         playlist_button_kwargs = {"font": self.normal_font, "border_width": 0, "corner_radius": 0}
         # --- Modified Button Text ---
         self.load_button = ctk.CTkButton(self.playlist_buttons_frame, text="MEDIA", command=self.add_songs, **playlist_button_kwargs)
         # --- End Modification ---
         self.load_button.grid(row=0, column=0, padx=5, pady=5, sticky="ew")
+        self.folder_button = ctk.CTkButton(self.playlist_buttons_frame, text="FOLDER", command=self.add_folder, **playlist_button_kwargs)
+        self.folder_button.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
+        self.save_button = ctk.CTkButton(self.playlist_buttons_frame, text="SAVE", command=self.export_playlist, **playlist_button_kwargs)
+        self.save_button.grid(row=0, column=2, padx=5, pady=5, sticky="ew")
         self.remove_button = ctk.CTkButton(self.playlist_buttons_frame, text="REMOVE", command=self.remove_song, **playlist_button_kwargs)
-        self.remove_button.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
+        self.remove_button.grid(row=0, column=3, padx=5, pady=5, sticky="ew")
         self.clear_button = ctk.CTkButton(self.playlist_buttons_frame, text="CLEAR", command=self.clear_playlist, **playlist_button_kwargs)
-        self.clear_button.grid(row=0, column=2, padx=5, pady=5, sticky="ew")
+        self.clear_button.grid(row=0, column=4, padx=5, pady=5, sticky="ew")
 
     def toggle_sidebar(self):
         """Shows or hides the right sidebar (tracklist)."""
@@ -543,7 +3657,7 @@ class MN1MusicPlayer:
             self.player_frame.grid_columnconfigure(0, weight=1)
             self.player_frame.grid_columnconfigure(1, weight=0)
             self.sidebar_visible = False
-            print("Sidebar hidden")
+            log.debug("Sidebar hidden")
         else:
             # Show sidebar
             self.right_frame.grid(row=0, column=1, sticky="nsew", padx=(5, 0))
@@ -551,7 +3665,7 @@ class MN1MusicPlayer:
             self.player_frame.grid_columnconfigure(0, weight=2)
             self.player_frame.grid_columnconfigure(1, weight=1)
             self.sidebar_visible = True
-            print("Sidebar shown")
+            log.debug("Sidebar shown")
 
         # Update button appearance
         self.apply_sidebar_button_state()
@@ -574,7 +3688,7 @@ class MN1MusicPlayer:
             if self.mpl_canvas_widget_osc and self.mpl_canvas_widget_osc.get_tk_widget().winfo_exists():
                 self.mpl_canvas_widget_osc.get_tk_widget().update_idletasks()
         except Exception as e:
-            print(f"Error redrawing plots after toggle: {e}")
+            log.error("Error redrawing plots after toggle: %s", e)
 
 
     def apply_sidebar_button_state(self):
@@ -600,7 +3714,7 @@ class MN1MusicPlayer:
         except ValueError:
             # Fallback if current theme isn't in the cycle list
             self.current_theme_name = self.theme_cycle[0]
-        print(f"Switching theme to: {self.current_theme_name}")
+        log.debug("Switching theme to: %s", self.current_theme_name)
         self.apply_theme()
 
     def apply_theme(self):
@@ -668,7 +3782,7 @@ class MN1MusicPlayer:
 
             extra_buttons = [self.sidebar_toggle_button, self.mix_button, self.loop_button,
                              self.volume_button, self.theme_toggle_button, self.load_button,
-                             self.remove_button, self.clear_button]
+                             self.folder_button, self.save_button, self.remove_button, self.clear_button]
             for btn in extra_buttons:
                  if btn and btn.winfo_exists():
                      btn.configure(fg_color=extra_button_fg, hover_color=hover_col)
@@ -685,6 +3799,11 @@ class MN1MusicPlayer:
             if self.theme_toggle_button and self.theme_toggle_button.winfo_exists():
                 self.theme_toggle_button.configure(text=theme_button_display_text)
 
+            # Apply theme to the filter box
+            if self.filter_entry and self.filter_entry.winfo_exists():
+                self.filter_entry.configure(fg_color=bg_col, text_color=text_col, border_color=element_dark_col,
+                                            placeholder_text_color=hover_col)
+
             # Apply theme to sliders
             if self.song_slider and self.song_slider.winfo_exists():
                 self.song_slider.configure(fg_color=element_dark_col, progress_color=accent_col,
@@ -693,11 +3812,6 @@ class MN1MusicPlayer:
                 self.volume_slider.configure(fg_color=element_dark_col, progress_color=accent_col,
                                              button_color=slider_button_col, button_hover_color=slider_button_hover_col)
 
-            # Apply theme to scrollable frame scrollbar
-            if self.playlist_scrollable and self.playlist_scrollable.winfo_exists():
-                 self.playlist_scrollable.configure(fg_color=bg_col, scrollbar_button_color=list_scrollbar_col,
-                                                    scrollbar_button_hover_color=list_scrollbar_hover_col)
-
             # Update stateful button appearances
             # Mute button
             mute_color = accent_col if self.muted else extra_button_text
@@ -713,26 +3827,11 @@ class MN1MusicPlayer:
             # Sidebar button (handled earlier and in its own function)
             self.apply_sidebar_button_state()
 
-            # Update tracklist item colors (selected/deselected)
-            selected_idx = -1
-            for i, entry in enumerate(self.playlist_entries):
-                 if entry and entry.get("frame") and entry["frame"].winfo_exists() and entry.get("selected"):
-                     selected_idx = i
-                     break
-            if selected_idx != -1:
-                self.select_song(selected_idx) # Re-apply selection styling with new theme
-            else:
-                 # Ensure non-selected items have default theme colors
-                 bg_color_default = theme["L1_bg"]
-                 text_color_default = theme["L6_text_light"]
-                 for entry in self.playlist_entries:
-                    try:
-                        if entry and not entry.get("selected"):
-                            if entry.get("frame") and entry["frame"].winfo_exists():
-                                entry["frame"].configure(fg_color=bg_color_default)
-                            if entry.get("label") and entry["label"].winfo_exists():
-                                entry["label"].configure(fg_color="transparent", text_color=text_color_default)
-                    except Exception: pass # Ignore errors on potentially destroyed widgets
+            # Update tracklist item colors (only the pooled rows exist, so this is cheap)
+            self.thumbnail_images.clear() # Thumbnails use the accent colour; visible ones are re-rendered
+            self._update_image_bytes()
+            if self.tracklist_view and self.tracklist_view.frame.winfo_exists():
+                self.tracklist_view.set_colors(bg_col, text_col, accent_col, list_scrollbar_col, list_scrollbar_hover_col)
 
             # Re-draw plots with new theme colors
             # Waveform
@@ -755,8 +3854,7 @@ class MN1MusicPlayer:
                      self.draw_initial_placeholder(self.ax_osc, self.fig_osc, plot_spine_col, "", plot_text_col)
 
         except Exception as e:
-            print(f"Error applying theme '{self.current_theme_name}': {e}")
-            traceback.print_exc()
+            log.exception("Error applying theme '%s': %s", self.current_theme_name, e)
 
     def _update_display_title(self, base_title=""):
         """Updates the song title label with state prefixes."""
@@ -797,162 +3895,353 @@ class MN1MusicPlayer:
         songs = filedialog.askopenfilenames(
             initialdir=os.path.expanduser("~"), # Start in user's home directory
             title="Select Audio Files",
-            filetypes=(("Audio Files", "*.mp3 *.flac *.ogg *.wav"),
+            filetypes=(("Audio Files", "*.mp3 *.flac *.ogg *.wav *.m3u *.m3u8"),
                        ("MP3 Files", "*.mp3"),
                        ("FLAC Files", "*.flac"),
                        ("Ogg Files", "*.ogg"),
                        ("WAV Files", "*.wav"),
+                       ("Playlists", "*.m3u *.m3u8"),
                        ("All Files", "*.*"))
         )
         # --- End Modification ---
-        added_count = 0
         if not songs: # User cancelled dialog
              return
+        if any(song.lower().endswith(PLAYLIST_EXTENSIONS) for song in songs):
+            self.import_paths(iter_import_candidates(songs)) # Playlists expand lazily into their tracks
+        else:
+            self.import_paths(songs)
+
+    def add_folder(self):
+        """Opens a folder dialog and imports every supported file below it (recursively)."""
+        folder = filedialog.askdirectory(initialdir=os.path.expanduser("~"), title="Select Music Folder")
+        if not folder: # User cancelled dialog
+            return
+        log.info("Scanning folder: %s", folder)
+        self.import_paths(iter_audio_files(folder)) # Generator: files are discovered while earlier ones are probed
+
+    def export_playlist(self):
+        """Saves the tracklist as an M3U8 playlist."""
+        if not self.songs_list:
+            log.info("Tracklist is empty, nothing to save.")
+            return
+        playlist_path = filedialog.asksaveasfilename(
+            initialdir=os.path.expanduser("~"), title="Save Tracklist As Playlist",
+            defaultextension=".m3u8", filetypes=(("M3U8 Playlist", "*.m3u8"), ("M3U Playlist", "*.m3u")))
+        if not playlist_path: # User cancelled dialog
+            return
+        try:
+            write_m3u(playlist_path, self.songs_list, self.library)
+            log.info("Saved %s tracks to %s", len(self.songs_list), playlist_path)
+        except OSError as e:
+            log.error("Error saving playlist: %s", e)
+
+    def import_paths(self, candidates, revalidate=False):
+        """Starts probing candidate files in the background; valid rows appear as they are confirmed."""
+        if self.import_job and not self.import_job.finished:
+            self.cancel_import() # One import at a time
+        self.import_job = TrackImportJob(candidates, self.tasks, library=self.library, revalidate=revalidate)
+        self.import_job.started_empty = not self.songs_list
+        if self.load_button and self.load_button.winfo_exists():
+            self.load_button.configure(text="STOP", command=self.cancel_import)
+        if self.folder_button and self.folder_button.winfo_exists():
+            self.folder_button.configure(state="disabled")
+        self._update_import_progress()
+        self.root.after(IMPORT_POLL_INTERVAL_MS, self._poll_import_job, self.import_job)
+
+    def cancel_import(self):
+        """Cancels the running import; rows already added stay in the tracklist."""
+        if self.import_job and not self.import_job.cancelled:
+            self.import_job.cancel()
+            log.info("Import cancelled.")
+
+    def _poll_import_job(self, job):
+        """Tk-thread side of the import: adds a batch of validated rows and reschedules itself."""
+        if job is not self.import_job:
+            return # Superseded by a newer import
+        # Apply results until this slice's time budget is used up; leftovers wait for the next slice
+        deadline = time.perf_counter() + UI_SLICE_BUDGET_MS / 1000.0
+        backlog = False
+        while time.perf_counter() < deadline:
+            batch = job.drain(IMPORT_MAX_BATCH)
+            if not batch:
+                break
+            self._apply_import_batch(job, batch)
+            backlog = len(batch) == IMPORT_MAX_BATCH
+        else:
+            backlog = True
 
-        for song_path in songs:
-            if os.path.exists(song_path):
-                 try:
-                    # Basic validation using Mutagen to check if readable
-                    file_ext = os.path.splitext(song_path)[1].lower()
-                    # --- Modified validation to include OGG and WAV ---
-                    if file_ext == ".mp3": MP3(song_path)
-                    elif file_ext == ".flac": FLAC_MUTAGEN(song_path)
-                    elif file_ext == ".ogg": OggVorbis(song_path)
-                    elif file_ext == ".wav": WAVE(song_path)
-                    # --- End Modification ---
-                    else:
-                        print(f"Skipping unsupported file type: {os.path.basename(song_path)}")
-                        continue # Skip unsupported types
-
-                    song_name = os.path.basename(song_path)
-                    # Add if not already in the list
-                    if song_path not in self.songs_list:
-                        self.add_song_to_playlist(song_name, song_path)
-                        self.songs_list.append(song_path)
-                        added_count += 1
-                    else:
-                        print(f"Song already in tracklist: {song_name}")
-                 except Exception as e:
-                     # Catch errors during file validation (corrupt, permission denied etc.)
-                     print(f"Skipping invalid/unreadable file: {os.path.basename(song_path)} - Error: {e}")
+        if job.finished:
+            self._finish_import(job)
+        else:
+            self._update_import_progress()
+            # Results still queued: come back right after pending events; otherwise poll at the normal rate
+            self.root.after(UI_SLICE_GAP_MS if backlog else IMPORT_POLL_INTERVAL_MS, self._poll_import_job, job)
+
+    @PERF.timed("import_batch")
+    def _apply_import_batch(self, job, batch):
+        """Adds (or, when revalidating, checks) one drained batch of probe results."""
+        # Write newly probed files back to the index in one transaction
+        try:
+            self.library.store_many([(path, info) for path, info, error in batch if info and not info["indexed"]])
+        except sqlite3.Error as e:
+            log.error("Library index write failed: %s", e)
+        for song_path, info, error in batch:
+            song_name = os.path.basename(song_path)
+            if job.revalidate:
+                # Restored tracks are already listed; only drop the ones that are gone or unreadable
+                if error is not None or info is None:
+                    log.info("Removing unavailable track: %s - %s", song_name, error or 'unsupported file type')
+                    self._drop_track(song_path)
+                elif info.get("tags"):
+                    track_id = self.songs_list.id_of(song_path)
+                    if track_id is not None: # Restored rows were indexed by name only; add the tags now
+                        self.search_index.add(track_id, self.songs_list.name_of(track_id), info["tags"])
+                continue
+            if error is not None:
+                # Errors during file validation (missing, corrupt, permission denied etc.)
+                if isinstance(error, FileNotFoundError):
+                    log.info("Skipping non-existent file: %s", song_path)
+                else:
+                    log.info("Skipping invalid/unreadable file: %s - Error: %s", song_name, error)
+            elif info is None:
+                log.info("Skipping unsupported file type: %s", song_name)
+            elif song_path in self.songs_list:
+                log.debug("Song already in tracklist: %s", song_name)
             else:
-                 print(f"Skipping non-existent file: {song_path}")
+                self._append_track(song_path, info.get("tags"))
+                job.added_count += 1
+                # If these are the first songs added, select the first one right away
+                if job.started_empty and len(self.songs_list) == 1:
+                    if self.song_title_var.get() == "TRACKLIST EMPTY":
+                        self._update_display_title(base_title="SELECT A TRACK")
+                    if not self.current_song and not self.playing_state and not self.paused:
+                        self.select_song(0)
+
+    def _finish_import(self, job):
+        """Restores the import UI once a job completes or is cancelled."""
+        self.import_job = None
+        self._schedule_status_publish()
+        if job.revalidate:
+            log.info("Checked %s restored track(s)", job.completed)
+        elif job.added_count > 0:
+            log.info("%s TRACK(S) ADDED", job.added_count)
+        else: # Files were selected, but none were new/valid
+            log.info("NO NEW TRACKS ADDED")
+        if self.load_button and self.load_button.winfo_exists():
+            self.load_button.configure(text="MEDIA", command=self.add_songs)
+        if self.folder_button and self.folder_button.winfo_exists():
+            self.folder_button.configure(state="normal")
+        self._update_import_progress()
+
+    def _update_import_progress(self):
+        """Shows import progress in the tracklist header."""
+        if not (self.tracklist_label and self.tracklist_label.winfo_exists()):
+            return
+        job = self.import_job
+        if job is None:
+            self.tracklist_label.configure(text="TRACKLIST")
+        elif job.total is None:
+            self.tracklist_label.configure(text=f"TRACKLIST {job.completed}/…") # Still discovering files
+        else:
+            self.tracklist_label.configure(text=f"TRACKLIST {job.completed}/{job.total}")
 
-        if added_count > 0:
-            print(f"{added_count} TRACK(S) ADDED")
-        elif added_count == 0 and songs: # Files were selected, but none were new/valid
-            print("NO NEW TRACKS ADDED")
 
-        # If this is the first song added, select it automatically
-        if added_count > 0 and len(self.songs_list) == added_count:
-            if self.song_title_var.get() == "TRACKLIST EMPTY":
-                self._update_display_title(base_title="SELECT A TRACK")
-            if not self.current_song and not self.playing_state and not self.paused:
-                self.select_song(0) # Select the first added song
+    def _drop_track(self, song_path):
+        """Removes a track without touching the selection flow of remove_song (used by revalidation)."""
+        index = self.songs_list.index_of_path(song_path)
+        if index is None:
+            return
+        if song_path == self.current_song and (self.playing_state or self.paused):
+            return # Already playing, so it's readable enough; playback reports its own errors
+        self.songs_list.remove_at(index)
+        self.shuffle_order.remove(song_path)
+        if song_path == self.current_song:
+            self.current_song = ""
+            self.stopped_position = 0.0
+            self.has_error = False # The error came from the file that is now gone
+            self.current_song_index = min(index, max(0, len(self.songs_list) - 1))
+        elif self.current_song_index > index:
+            self.current_song_index -= 1
+        self._update_display_title()
+
+    # --- Session ---
+
+    def save_session(self):
+        """Saves the tracklist, current track/position and MIX/LOOP state for the next launch."""
+        if not self.session_path:
+            return
+        position = self.song_time if (self.playing_state or self.paused) else self.stopped_position
+        state = {
+            "current": self.current_song_index if self.current_song else -1,
+            "position": round(float(position or 0.0), 2),
+            "shuffle": self.shuffle_state,
+            "loop": self.loop_state,
+        }
+        try:
+            save_session(self.session_path, self.songs_list, state)
+            log.info("Session saved (%s tracks)", len(self.songs_list))
+        except (OSError, TypeError, ValueError) as e:
+            log.error("Could not save session: %s", e)
 
+    def restore_session(self):
+        """
+        Restores the last session without touching the audio files: rows are built from the
+        stored paths, then existence/metadata are revalidated by a background import job.
+        """
+        if not self.session_path:
+            return
+        restored = load_session(self.session_path)
+        if not restored:
+            return
+        song_paths, state = restored
+        if not song_paths:
+            return
+        # Rows are added in time-budgeted slices, so the window is usable while a big session loads
+        self.restore_work = SlicedWork(self.root, song_paths, self._restore_track,
+                                       on_complete=lambda work: self._finish_restore(state),
+                                       on_progress=lambda work: self._show_restore_progress(work, len(song_paths)))
+        self.restore_work.start()
+
+    def _restore_track(self, song_path):
+        if song_path not in self.songs_list:
+            self._append_track(song_path)
+
+    def _show_restore_progress(self, work, total):
+        if self.tracklist_label and self.tracklist_label.winfo_exists() and not self.import_job:
+            self.tracklist_label.configure(text="TRACKLIST" if work.finished else f"TRACKLIST {work.applied}/{total}")
+
+    def _finish_restore(self, state):
+        """Applies the saved player state once every restored row exists, then starts revalidation."""
+        self.restore_work = None
+        if not self.songs_list:
+            return
+        log.info("Restored session: %s tracks", len(self.songs_list))
+
+        self.loop_state = int(state.get("loop", 0)) % 3
+        self.apply_loop_button_state()
+        current = state.get("current", -1)
+        if 0 <= current < len(self.songs_list):
+            # Load it as "stopped at position", so PLAY resumes where the last session ended
+            self.current_song_index = current
+            self.current_song = self.songs_list[current]
+            self.stopped_position = max(0.0, float(state.get("position", 0.0)))
+            self.select_song(current)
+            self.update_song_info() # Library index lookup (no parse if the file is unchanged)
+            if self.song_slider and self.song_slider.winfo_exists(): self.song_slider.set(min(self.stopped_position, max(1.0, self.song_length)))
+            mins, secs = divmod(int(self.stopped_position), 60)
+            if self.current_time_label and self.current_time_label.winfo_exists(): self.current_time_label.configure(text=f"{mins:02d}:{secs:02d}")
+        else:
+            self.select_song(0)
+        if state.get("shuffle") and not self.shuffle_state:
+            self.toggle_mix() # Builds the permutation around the restored current track
+        self._update_display_title()
+
+        self.import_paths(list(self.songs_list), revalidate=True)
+
+    def _append_track(self, song_path, tags=None):
+        """Appends an already validated track to the tracklist and its lookups."""
+        track_id = self.songs_list.append(song_path) # The tracklist view is notified by the model
+        self.shuffle_order.add(song_path)
+        self.search_index.add(track_id, self.songs_list.name_of(track_id), tags)
+
+    # --- Tracklist Thumbnails ---
+
+    def _thumbnail_color(self):
+        return self.themes[self.current_theme_name]["L5_accent_secondary"]
+
+    def _thumbnail_for(self, track_id):
+        """Returns the cached thumbnail for a visible row, or requests it and returns None for now."""
+        song_path = self.songs_list.path_of(track_id)
+        if song_path is None:
+            return None
+        key = (song_path, self._thumbnail_color())
+        image = self.thumbnail_images.get(key)
+        if image is not None:
+            self.thumbnail_images.move_to_end(key)
+            return image or None
+        self.thumbnailer.request(track_id, song_path, key[1])
+        return None
+
+    def _on_thumbnail_ready(self, track_id, song_path, color, pil_image):
+        """Wraps a finished thumbnail as a CTkImage (Tk thread) and shows it on its row."""
+        if color != self._thumbnail_color():
+            return # Theme changed while it was rendering
+        image = ctk.CTkImage(light_image=pil_image, dark_image=pil_image, size=THUMB_SIZE) if pil_image else False
+        self.thumbnail_images[(song_path, color)] = image
+        while len(self.thumbnail_images) > THUMB_CACHE_ENTRIES:
+            self.thumbnail_images.popitem(last=False)
+        self._update_image_bytes()
+        self.tracklist_view.update_thumbnail(track_id)
+
+    def _store_thumbnail_peaks(self, song_path, peak_data):
+        """Saves coarse peaks from a full waveform analysis (background thread), so its thumbnail needs no scan."""
+        try:
+            self.library.store_peaks(song_path, os.stat(song_path), coarse_peaks(peak_data))
+        except (OSError, sqlite3.Error, ValueError) as e:
+            log.warning("Could not store thumbnail peaks for %s: %s", os.path.basename(song_path), e)
+
+    # --- Tracklist Filter ---
+
+    def _on_tracklist_changed(self, event, track_id, index):
+        """Keeps the search index in step with the model (additions are indexed by _append_track with their tags)."""
+        if event == "removed":
+            self.search_index.remove(track_id)
+        elif event == "cleared":
+            self.search_index.clear()
+        if event != "added" or self._filter_text():
+            self._schedule_filter_update()
+        self._schedule_status_publish()
+
+    def _schedule_filter_update(self):
+        """Re-applies an active filter once after a burst of tracklist changes."""
+        if self.filter_update_pending is None:
+            self.filter_update_pending = self.root.after_idle(lambda: self._apply_filter(force=True))
+
+    def _filter_text(self):
+        return self.filter_entry.get().strip() if self.filter_entry and self.filter_entry.winfo_exists() else ""
+
+    def _apply_filter(self, force=False):
+        """Narrows the tracklist view to the tracks matching the filter box."""
+        self.filter_update_pending = None
+        if not (self.tracklist_view and self.tracklist_view.frame.winfo_exists()):
+            return
+        query = self._filter_text()
+        if query == self.applied_filter and not force:
+            return # Navigation keys, modifiers etc. don't change the result
+        self.applied_filter = query
+        self.tracklist_view.set_filter(self.search_index.search(query))
 
-    def add_song_to_playlist(self, song_name, song_path):
-        """Adds a single song entry to the visual tracklist."""
-        index = len(self.playlist_entries)
-        theme = self.themes[self.current_theme_name]
-        list_item_bg = theme["L1_bg"] # Use main background for items initially
-        list_item_fg = theme["L6_text_light"]
-
-        # Create frame for the list item
-        song_frame = ctk.CTkFrame(self.playlist_scrollable, fg_color=list_item_bg, corner_radius=0)
-        song_frame.pack(fill="x", pady=1, ipady=1) # Fill horizontally, small vertical padding
-
-        # Create label for the song name
-        song_label = ctk.CTkLabel(song_frame, text=song_name, font=self.normal_font,
-                                  fg_color="transparent", text_color=list_item_fg, # Label bg transparent
-                                  anchor="w", justify="left", cursor="hand2") # Left aligned text
-        song_label.pack(fill="x", padx=5) # Pad text inside frame
-
-        # Bind mouse clicks to the label
-        song_label.bind("<Button-1>", lambda e, idx=index: self.select_song(idx))
-        song_label.bind("<Double-Button-1>", lambda e, idx=index: self.play_selected_song_by_index(idx))
-        # Also bind to frame in case user clicks padding
-        song_frame.bind("<Button-1>", lambda e, idx=index: self.select_song(idx))
-        song_frame.bind("<Double-Button-1>", lambda e, idx=index: self.play_selected_song_by_index(idx))
-
-        # Store references to the widgets and state
-        self.playlist_entries.append({
-            "frame": song_frame,
-            "label": song_label,
-            "selected": False,
-            "index": index # Store original index for rebinding if needed
-        })
+    def _clear_filter(self, event=None):
+        self.filter_entry.delete(0, "end")
+        self._apply_filter()
 
     def select_song(self, index):
         """Highlights the selected song in the tracklist."""
-        if not (0 <= index < len(self.playlist_entries)):
+        if not (0 <= index < len(self.songs_list)):
              # print(f"Warning: select_song index {index} out of range.")
              return # Invalid index
-
-        theme = self.themes[self.current_theme_name]
-        # Use accent color for selected text, main bg for frame
-        selected_text_color = theme["L3_accent_primary"]
-        # Use theme text/bg colors for deselected items
-        default_text_color = theme["L6_text_light"]
-        default_bg_color = theme["L1_bg"]
-
-        for i, entry in enumerate(self.playlist_entries):
-            if not (entry and entry.get("frame") and entry.get("label")):
-                continue # Skip if entry is somehow invalid
-
-            is_selected = (i == index)
-
-            # Determine colors based on selection state
-            # Frame background ALWAYS default in this version
-            frame_bg = default_bg_color
-            # Text color changes based on selection
-            text_color = selected_text_color if is_selected else default_text_color
-
-            try:
-                # Configure Frame background (always default)
-                if entry["frame"].winfo_exists():
-                    entry["frame"].configure(fg_color=frame_bg)
-
-                # Configure Label text color (changes) and ensure label background is transparent
-                if entry["label"].winfo_exists():
-                    entry["label"].configure(fg_color="transparent", text_color=text_color)
-
-            except Exception as e:
-                # Avoid spamming console with errors if widgets are destroyed during rapid changes
-                if "invalid command name" not in str(e).lower():
-                    print(f"Warning: Error configuring tracklist entry {i} during select: {e}")
-
-            entry["selected"] = is_selected # Update selection state in our tracking list
+        self.tracklist_view.set_selected(index)
+        self.tracklist_view.scroll_to(index) # Keep the playing/selected track in view in long tracklists
 
 
     def play_selected_song_by_index(self, index):
         """Plays the song at the specified index."""
         if 0 <= index < len(self.songs_list):
-             # Abort any ongoing waveform generation for the *previous* song first
-             self.abort_waveform_generation()
-             # Set the index and select visually
-             self.current_song_index = index
-             self.select_song(index)
-             # Play the music (this will handle loading, info update, waveform trigger)
-             self.play_music()
+             # Debounced: rapid double-clicks through the list only load the last one
+             self.switch_to_track(index)
         else:
-             print(f"Warning: play_selected_song_by_index index {index} out of range.")
+             log.warning("play_selected_song_by_index index %s out of range.", index)
 
 
     def play_selected_song(self, event=None):
         """Plays the currently selected song in the tracklist."""
-        selected_index = -1
-        # Find the currently selected index
-        for index, entry in enumerate(self.playlist_entries):
-            if entry and entry.get("frame") and entry["frame"].winfo_exists() and entry.get("selected"):
-                selected_index = index
-                break
+        selected_index = self.tracklist_view.selected_index
 
-        if selected_index != -1:
+        if 0 <= selected_index < len(self.songs_list):
             self.play_selected_song_by_index(selected_index)
-        elif self.playlist_entries:
+        elif self.songs_list:
             # If nothing is selected, play the first song
-            print("Nothing selected, playing first track.")
+            log.debug("Nothing selected, playing first track.")
             self.play_selected_song_by_index(0)
         else:
             # No songs in the list
@@ -963,16 +4252,10 @@ class MN1MusicPlayer:
         """Removes the currently selected song from the tracklist."""
         removed_index = -1
         is_current_song_removed = False
-        current_selected_index = -1
+        current_selected_index = self.tracklist_view.selected_index
 
-        # Find the selected index
-        for i, entry in enumerate(self.playlist_entries):
-             if entry and entry.get("frame") and entry["frame"].winfo_exists() and entry.get("selected"):
-                 current_selected_index = i
-                 break
-
-        if current_selected_index == -1:
-            print("NO TRACK SELECTED")
+        if not (0 <= current_selected_index < len(self.songs_list)):
+            log.info("NO TRACK SELECTED")
             return # Nothing to remove
 
         removed_index = current_selected_index
@@ -982,23 +4265,14 @@ class MN1MusicPlayer:
         if current_song_path and removed_index == self.current_song_index and self.current_song == current_song_path:
             is_current_song_removed = True
 
-        # Remove from visual playlist (destroy widgets)
-        if removed_index < len(self.playlist_entries):
-             try:
-                 if self.playlist_entries[removed_index]["frame"].winfo_exists():
-                     self.playlist_entries[removed_index]["frame"].destroy()
-             except Exception: pass # Ignore errors destroying widgets
-             removed_entry_data = self.playlist_entries.pop(removed_index) # Remove dict from list
-        else:
-             print("Warning: Playlist entry index mismatch during remove.")
-             return # Should not happen
-
         # Remove from internal song list
         if removed_index < len(self.songs_list):
-             removed_song_path = self.songs_list.pop(removed_index)
-             print(f"Removed: {os.path.basename(removed_song_path)}")
+             removed_song_path = self.songs_list.remove_at(removed_index) # O(log n), later rows aren't touched
+             self.shuffle_order.remove(removed_song_path)
+             log.info("Removed: %s", os.path.basename(removed_song_path))
+             self.tracklist_view.selected_id = None # Re-selected below once indices are adjusted
         else:
-            print("Warning: Song list index mismatch during remove.")
+            log.warning("Song list index mismatch during remove.")
             # Consistency issue, might need to rebuild lists? For now, just return.
             return
 
@@ -1007,7 +4281,7 @@ class MN1MusicPlayer:
 
         if is_current_song_removed:
              # If the playing song was removed, select the next one (or previous if it was last)
-             new_selected_index = removed_index if removed_index < len(self.playlist_entries) else removed_index - 1
+             new_selected_index = removed_index if removed_index < len(self.songs_list) else removed_index - 1
         else:
             # If a different song was removed, adjust the current_song_index if needed
             if self.current_song_index > removed_index:
@@ -1015,29 +4289,9 @@ class MN1MusicPlayer:
             # Keep the selection on the (now potentially shifted) currently playing song
             new_selected_index = self.current_song_index
 
-        # Re-index and re-bind remaining playlist entries
-        for i in range(len(self.playlist_entries)):
-            entry = self.playlist_entries[i]
-            if entry:
-                entry["index"] = i # Update index stored in dict
-                try:
-                    # Re-bind click events with the new index 'i'
-                    if entry.get("label") and entry["label"].winfo_exists():
-                        entry["label"].unbind("<Button-1>")
-                        entry["label"].unbind("<Double-Button-1>")
-                        entry["label"].bind("<Button-1>", lambda e, idx=i: self.select_song(idx))
-                        entry["label"].bind("<Double-Button-1>", lambda e, idx=i: self.play_selected_song_by_index(idx))
-                    if entry.get("frame") and entry["frame"].winfo_exists():
-                        entry["frame"].unbind("<Button-1>")
-                        entry["frame"].unbind("<Double-Button-1>")
-                        entry["frame"].bind("<Button-1>", lambda e, idx=i: self.select_song(idx))
-                        entry["frame"].bind("<Double-Button-1>", lambda e, idx=i: self.play_selected_song_by_index(idx))
-                except Exception as e:
-                    print(f"Error re-binding tracklist entry {i}: {e}")
-
-
         # --- Handle player state if the current song was removed ---
         if is_current_song_removed:
+            self._cancel_pending_track_switch() # Don't load a track that no longer exists
             self.stop() # Stop playback
             self.current_song = "" # Clear current song path
             self.has_error = False; self.is_loading = False; self.is_generating_waveform = False;
@@ -1051,6 +4305,7 @@ class MN1MusicPlayer:
             self.draw_initial_placeholder(self.ax_wave, self.fig_wave, spine_color, "TRACK REMOVED")
             self.draw_initial_placeholder(self.ax_osc, self.fig_osc, spine_color, "")
             self.raw_sample_data = None; self.waveform_peak_data = None; self.sample_rate = None; self.song_length = 0;
+            self.release_buffers("track removed")
 
             # Reset time/slider
             if self.total_time_label and self.total_time_label.winfo_exists(): self.total_time_label.configure(text="00:00")
@@ -1058,11 +4313,11 @@ class MN1MusicPlayer:
             if self.song_slider and self.song_slider.winfo_exists(): self.song_slider.set(0); self.song_slider.configure(to=100) # Reset slider
 
             # Select the new index if playlist is not empty
-            if len(self.playlist_entries) > 0:
-                 select_idx = max(0, min(new_selected_index, len(self.playlist_entries) - 1)) # Ensure valid index
+            if len(self.songs_list) > 0:
+                 select_idx = max(0, min(new_selected_index, len(self.songs_list) - 1)) # Ensure valid index
                  self.select_song(select_idx)
                  self.current_song_index = select_idx # Update index tracking the logical current song
-            elif len(self.songs_list) == 0: # Check songs_list as playlist_entries might be briefly out of sync
+            else:
                  self._update_display_title(base_title="TRACKLIST EMPTY")
 
         # --- Handle state if playlist becomes empty ---
@@ -1082,23 +4337,21 @@ class MN1MusicPlayer:
              if self.song_slider and self.song_slider.winfo_exists(): self.song_slider.set(0); self.song_slider.configure(to=100)
         else:
              # If a different song was removed, just ensure the correct song remains selected
-             if 0 <= new_selected_index < len(self.playlist_entries):
+             if 0 <= new_selected_index < len(self.songs_list):
                  self.select_song(new_selected_index)
 
     def clear_playlist(self):
         """Removes all songs from the tracklist and stops playback."""
+        self._cancel_pending_track_switch()
         self.stop() # Stop any playback
-
-        # Destroy all visual playlist entries
-        for entry in self.playlist_entries:
-            try:
-                 if entry and entry.get("frame") and entry["frame"].winfo_exists():
-                     entry["frame"].destroy()
-            except Exception: pass # Ignore errors
+        if self.restore_work:
+            self.restore_work.cancel() # Don't keep adding restored rows to a cleared tracklist
+            self.restore_work = None
 
         # Clear internal lists and reset state
-        self.playlist_entries.clear()
         self.songs_list.clear()
+        self.shuffle_order.clear()
+        self.tracklist_view.reset() # Hides the pooled rows (they're kept for reuse)
         self.current_song_index = 0
         self.current_song = ""
         self.has_error = False; self.is_loading = False; self.is_generating_waveform = False;
@@ -1110,6 +4363,7 @@ class MN1MusicPlayer:
         self.waveform_peak_data = None
         self.raw_sample_data = None
         self.sample_rate = None
+        self.release_buffers("tracklist cleared")
 
         # Reset visuals
         theme = self.themes[self.current_theme_name]; spine_color = theme['plot_spine']
@@ -1133,11 +4387,14 @@ class MN1MusicPlayer:
                 self.play_pause_button.configure(text="▶") # Ensure button shows play symbol
             return
 
+        # A debounced track change is waiting: pressing play loads it now
+        if self._cancel_pending_track_switch():
+            self.play_music()
+            return
+
         self.has_error = False # Clear any previous error state on interaction
         theme = self.themes[self.current_theme_name]
         active_button_color = theme["L4_hover_bg"] # Use hover color for feedback
-        default_button_color = COLOR_WHITE if self.current_theme_name == "light" else theme["L1_bg"]
-        spine_color = theme['plot_spine'] # For placeholder drawing
 
         # --- Button press visual feedback ---
         if self.play_pause_button and self.play_pause_button.winfo_exists():
@@ -1147,168 +4404,8 @@ class MN1MusicPlayer:
             self.root.after(100, lambda: self.play_pause_button.configure(fg_color=original_color) if self.play_pause_button and self.play_pause_button.winfo_exists() else None)
         # ---
 
-        # --- Logic based on current state ---
-        if self.playing_state:
-            # --- PAUSE ---
-            if not self.paused: # Should always be true if playing_state is true, but check anyway
-                try:
-                    current_pos_ms = 0
-                    # Get current position before pausing
-                    if pygame.mixer.get_init() and pygame.mixer.music.get_busy():
-                         current_pos_ms = pygame.mixer.music.get_pos() # Returns time since last play/start in ms
-                         if current_pos_ms != -1:
-                             # Update the stopped position based on elapsed time
-                             time_since_last_play_sec = current_pos_ms / 1000.0
-                             self.stopped_position = self.stopped_position + time_since_last_play_sec
-                             self.song_time = self.stopped_position # Sync internal time tracker
-                         # else: Error getting position, might happen briefly at end
-
-                    pygame.mixer.music.pause()
-                    self.paused = True
-                    self.playing_state = False # Not actively playing anymore
-                    self.thread_running = False # Stop background updates
-                    if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="▶") # Show play symbol
-                    self._update_display_title()
-                    print(f"Playback Paused at {self.stopped_position:.2f}s (Raw mixer pos: {current_pos_ms}ms)")
-                except pygame.error as e:
-                    print(f"Pygame error during pause: {e}")
-                    self.has_error = True; self._update_display_title()
-
-        elif self.paused:
-            # --- UNPAUSE / RESUME ---
-             try:
-                 pygame.mixer.music.unpause()
-                 self.paused = False
-                 self.playing_state = True
-                 if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="II") # Show pause symbol
-                 self._update_display_title()
-                 self.start_update_thread() # Restart background updates
-                 # Note: stopped_position already holds the correct resume time
-                 print(f"Resumed playback from {self.stopped_position:.2f}s")
-             except pygame.error as e:
-                 print(f"Pygame error during unpause: {e}")
-                 self.has_error = True; self._update_display_title()
-
-        else: # Neither playing nor paused: Start playback
-            # --- PLAY (from beginning or stopped position) ---
-            song_to_play_index = -1
-            selected_idx = -1
-            is_resuming = False
-
-            # Determine which song to play:
-            # 1. Check if a song is selected in the list
-            for i, entry in enumerate(self.playlist_entries):
-                 if entry and entry.get("frame") and entry["frame"].winfo_exists() and entry.get("selected"):
-                     selected_idx = i
-                     break
-
-            if selected_idx != -1 and 0 <= selected_idx < len(self.songs_list):
-                 # Play the selected song
-                 song_to_play_index = selected_idx
-                 # Check if we are resuming the *same* selected song from a non-zero position
-                 is_resuming = (song_to_play_index == self.current_song_index and
-                                self.stopped_position > 0 and
-                                self.current_song == self.songs_list[song_to_play_index])
-            elif self.current_song and self.stopped_position > 0 and \
-                 0 <= self.current_song_index < len(self.songs_list) and \
-                 self.songs_list[self.current_song_index] == self.current_song:
-                 # If nothing is selected, but a song was previously loaded and stopped mid-way, resume it
-                 song_to_play_index = self.current_song_index
-                 is_resuming = True
-            elif self.songs_list:
-                 # Fallback: Play the logically current song (or first if index is invalid)
-                 # Check if there's a selected song first (covers case where selection exists but isn't current_song_index)
-                 current_selected_index = -1
-                 for i, entry in enumerate(self.playlist_entries):
-                     if entry and entry.get("frame") and entry["frame"].winfo_exists() and entry.get("selected"):
-                         current_selected_index = i
-                         break
-                 if 0 <= current_selected_index < len(self.songs_list):
-                     song_to_play_index = current_selected_index
-                 elif 0 <= self.current_song_index < len(self.songs_list):
-                     song_to_play_index = self.current_song_index
-                 else:
-                     song_to_play_index = 0 # Default to first song
-
-                 # Check if resuming *this* fallback song
-                 is_resuming = (song_to_play_index == self.current_song_index and
-                                self.stopped_position > 0 and
-                                self.current_song == self.songs_list[song_to_play_index])
-            # else: songs_list is empty, handled at the start of the function
-
-            # --- Load and play the determined song ---
-            if song_to_play_index != -1:
-                new_song_path = self.songs_list[song_to_play_index]
-                song_changed = (new_song_path != self.current_song)
-
-                # Update internal state
-                self.current_song_index = song_to_play_index
-                self.current_song = new_song_path
-                self.select_song(self.current_song_index) # Visually select the song
-
-                try:
-                    self.is_loading = True; self._update_display_title() # Show loading state
-
-                    if song_changed or not is_resuming:
-                         # Load song from beginning if it's new or we weren't resuming
-                         self.abort_waveform_generation() # Abort previous waveform gen if any
-                         self.update_song_info() # Get length, update slider range etc.
-                         # Show loading placeholders immediately
-                         self.draw_initial_placeholder(self.ax_wave, self.fig_wave, spine_color, "LOADING...")
-                         self.draw_initial_placeholder(self.ax_osc, self.fig_osc, spine_color, "")
-
-                         pygame.mixer.music.load(self.current_song)
-                         start_pos = 0.0
-                         self.stopped_position = 0.0 # Reset position for new song
-                         self.song_time = 0.0
-                         print(f"Starting new playback: {os.path.basename(self.current_song)}")
-                    else:
-                         # Resuming the same song, start from stopped_position
-                         # Need to re-load the song before playing from a specific point with Pygame
-                         pygame.mixer.music.load(self.current_song)
-                         start_pos = self.stopped_position
-                         # Ensure song info (length etc.) is current if resuming
-                         self.update_song_info()
-                         print(f"Resuming stopped playback: {os.path.basename(self.current_song)} at {start_pos:.2f}s")
-
-                    # Play the loaded song
-                    pygame.mixer.music.play(start=start_pos)
-                    self.playing_state = True
-                    self.paused = False
-                    self.is_loading = False # Done loading
-
-                    if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="II") # Show pause symbol
-                    self._update_display_title() # Update title to playing state
-                    self.start_update_thread() # Start updates
-
-                    # Trigger waveform generation if it's a new song or wasn't resuming
-                    if song_changed or not is_resuming:
-                        self.trigger_waveform_generation()
-                    # If resuming, ensure visuals are up-to-date for the current position
-                    elif self.waveform_peak_data is not None:
-                        pos_ratio = np.clip(self.stopped_position / self.song_length, 0.0, 1.0) if self.song_length > 0 else 0.0
-                        self.draw_waveform_position_indicator(pos_ratio)
-                        if self.fig_wave and self.fig_wave.canvas: self.fig_wave.canvas.draw_idle()
-                        self.update_oscilloscope() # Draw initial oscilloscope frame
-
-
-                except pygame.error as e:
-                    print(f"Pygame Error loading/playing: {e}")
-                    self.has_error = True; self.is_loading = False;
-                    self._update_display_title(base_title=f"{os.path.basename(self.current_song)}")
-                    self.playing_state = False; self.paused = False; self.current_song = "" # Reset state
-                    if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="▶")
-                except Exception as e:
-                    print(f"Error loading/playing song: {e}")
-                    traceback.print_exc()
-                    self.has_error = True; self.is_loading = False;
-                    self._update_display_title(base_title=f"{os.path.basename(self.current_song)}")
-                    self.playing_state = False; self.paused = False; self.current_song = "" # Reset state
-                    if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="▶")
-            else:
-                 # This case should ideally not be reached if the initial check for songs_list works
-                 self._update_display_title(base_title="TRACKLIST EMPTY?") # Should show empty earlier
-                 if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="▶")
+        # Pause, resume, or start the selected (else stopped/current) track; the widgets follow the engine's events
+        self.engine.toggle_play_pause(self.tracklist_view.selected_index)
 
 
     def play_music(self):
@@ -1320,190 +4417,384 @@ class MN1MusicPlayer:
             return
 
         self.has_error = False # Clear previous errors
-        self.current_song = self.songs_list[self.current_song_index]
-        self.stopped_position = 0.0 # Start from beginning
-        self.song_time = 0.0
-        theme = self.themes[self.current_theme_name]
-        spine_color = theme['plot_spine']
+        log.debug("play_music: Loading %s", os.path.basename(self.songs_list[self.current_song_index]))
+        self.engine.play_index(self.current_song_index) # Stop previous, load new, get info, play
+
+    # --- Control Socket ---
 
+    def start_control_server(self, socket_path):
+        """Accepts play/pause/seek/next/enqueue/status commands on a local Unix socket (see ControlServer)."""
+        server = ControlServer(socket_path, self._handle_control_command)
         try:
-            self.abort_waveform_generation() # Stop any previous waveform generation
-            print(f"play_music: Loading {os.path.basename(self.current_song)}")
-            self.is_loading = True; self._update_display_title()
+            server.start()
+            # Tk wakes up when a command is queued; nothing polls while the socket is idle
+            self.root.tk.createfilehandler(server.fileno(), TK_READABLE, server.process_pending)
+        except (OSError, AttributeError) as e: # AttributeError: Tk without file handlers (Windows)
+            log.warning("Control socket disabled: %s", e)
+            server.close()
+            return
+        self.control_server = server
+        self._publish_status()
+        log.info("Control socket listening on %s", socket_path)
 
-            # Stop previous, load new, get info, play
-            pygame.mixer.music.stop() # Stop potential previous playback cleanly
-            pygame.mixer.music.load(self.current_song)
-            self.update_song_info() # Get length, update slider/labels
-            pygame.mixer.music.play() # Start from beginning (default)
+    def stop_control_server(self):
+        if self.control_server is None:
+            return
+        try: self.root.tk.deletefilehandler(self.control_server.fileno())
+        except Exception: pass
+        self.control_server.close()
+        log.info("Control socket: %s commands, %s status queries", self.control_server.handled, self.control_server.status_queries)
+        self.control_server = None
+
+    def _handle_control_command(self, request):
+        """Runs one control command on the Tk thread, like the matching button. Returns the resulting status."""
+        cmd = request["cmd"]
+        if cmd == "play":
+            index = request.get("index")
+            if index is not None:
+                if not isinstance(index, int) or not 0 <= index < len(self.songs_list):
+                    raise ValueError(f"index must be an integer from 0 to {len(self.songs_list) - 1}")
+                self.switch_to_track(index, immediate=True) # A script asked for it: no debounce
+            elif not self.playing_state:
+                self.toggle_play_pause()
+        elif cmd == "pause":
+            if self.playing_state:
+                self.toggle_play_pause()
+        elif cmd == "seek":
+            position = request.get("position")
+            if isinstance(position, bool) or not isinstance(position, (int, float)):
+                raise ValueError("position must be a number of seconds")
+            if not self.current_song or self.song_length <= 0:
+                raise ValueError("no track loaded")
+            self.seek_song(float(position))
+        elif cmd == "next":
+            self.next_song(immediate=True)
+        elif cmd == "enqueue":
+            paths = request.get("paths")
+            if isinstance(paths, str):
+                paths = [paths]
+            if not paths or not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+                raise ValueError("paths must be a file path or a list of them")
+            if self.import_job and not self.import_job.finished:
+                raise ValueError("an import is already running, try again when it has finished")
+            self.import_paths(iter_import_candidates(paths)) # Valid files are appended as they are probed
+        self._publish_status()
+        return self.control_server.status()
+
+    def _schedule_status_publish(self):
+        """Publishes the status once after a burst of changes (e.g. an import adding rows)."""
+        if self.control_server is not None and self.status_publish_pending is None:
+            self.status_publish_pending = self.root.after_idle(self._publish_status)
+
+    def _publish_status(self):
+        """Hands the control server a fresh status snapshot; status queries never touch the player or widgets."""
+        self.status_publish_pending = None
+        if self.control_server is None:
+            return
+        self.control_server.publish({
+            "state": "playing" if self.playing_state else "paused" if self.paused else "stopped",
+            "track": self.current_song,
+            "index": self.current_song_index if self.current_song else None,
+            "position": round(self.engine.position(), 3),
+            "length": round(self.song_length, 3),
+            "mix": self.shuffle_state,
+            "loop": ("off", "all", "one")[self.loop_state],
+            "tracks": len(self.songs_list),
+            "importing": bool(self.import_job and not self.import_job.finished),
+            "error": self.has_error,
+        })
 
-            self.playing_state = True
-            self.paused = False
-            self.is_loading = False # Done loading
+    # --- Performance Overlay ---
 
-            # Update UI state
-            if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="II") # Show pause symbol
-            self.select_song(self.current_song_index) # Ensure correct song is highlighted
-            self._update_display_title() # Show playing state
+    def toggle_perf_overlay(self, event=None):
+        """Shows or hides the hot-path timing table over the player; showing it turns the timers on."""
+        if self.perf_overlay is not None:
+            if self.perf_overlay_after_id is not None:
+                try: self.root.after_cancel(self.perf_overlay_after_id)
+                except Exception: pass
+                self.perf_overlay_after_id = None
+            if self.perf_overlay.winfo_exists(): self.perf_overlay.destroy()
+            self.perf_overlay = None
+            return
+        PERF.enabled = True
+        theme = self.themes[self.current_theme_name]
+        self.perf_overlay = ctk.CTkLabel(self.root, text="", font=("SF Mono", 10), justify="left", anchor="nw",
+                                         fg_color=theme["L2_element_dark"], text_color=theme["L6_text_light"], corner_radius=0)
+        self.perf_overlay.place(x=12, y=8)
+        self._refresh_perf_overlay()
+
+    def _refresh_perf_overlay(self):
+        self.perf_overlay_after_id = None
+        if not (self.perf_overlay and self.perf_overlay.winfo_exists()):
+            return
+        self.perf_overlay.configure(text=PERF.format_table())
+        self.perf_overlay.lift()
+        self.perf_overlay_after_id = self.root.after(PERF_OVERLAY_REFRESH_MS, self._refresh_perf_overlay)
+
+    def dump_perf_stats(self, event=None, path=None):
+        """Writes the timing histograms as JSON (default: a timestamped file in the data directory)."""
+        if not PERF.sections:
+            log.info("Performance timers: nothing recorded (press F2 or start with --perf).")
+            return
+        path = path or os.path.join(MN1_DATA_DIR, time.strftime("perf-%Y%m%d-%H%M%S.json"))
+        try:
+            PERF.dump_json(path)
+            log.info("Performance timings written to %s", path)
+        except OSError as e:
+            log.error("Could not write performance timings: %s", e)
+
+    def toggle_profiling(self, event=None):
+        """Starts or pauses cProfile/tracemalloc recording; whatever was recorded is saved on close."""
+        if PROFILER.active:
+            PROFILER.pause()
+            log.info("Profiling paused")
+        else:
+            PROFILER.start()
+            log.info("Profiling started")
+        self._show_profiling_state()
+
+    def _show_profiling_state(self):
+        self.root.title("MN-1 [PROFILING]" if PROFILER.active else "MN-1")
+
+    def save_profile(self):
+        """Writes the recorded profiles and allocation snapshots (see ProfileSession.save)."""
+        try:
+            out_dir = PROFILER.save()
+        except (OSError, ValueError) as e:
+            log.error("Could not save profile: %s", e)
+            return
+        if out_dir:
+            log.warning("Profile written to %s (open all.prof with snakeviz or pstats)", out_dir) # Shown at the default level
+
+    # --- Engine Events ---
+
+    def _on_engine_event(self, event, detail):
+        """Mirrors PlayerEngine events in the widgets (all engine calls happen on the Tk thread)."""
+        if event == "loading":
+            self._on_track_loading(detail)
+        elif event == "track":
+            self._on_track_started(detail)
+        elif event == "load_failed":
+            self._on_track_load_failed(*detail)
+        elif event == "state":
+            self._on_playback_state(detail)
+        elif event == "seek":
+            self._show_position(detail, redraw_oscilloscope=True)
+        elif event == "ended":
+            self._on_track_ended()
+        elif event == "finished":
+            self._on_tracklist_finished(detail)
+        elif event == "error":
+            log.error("Playback error: %s", detail)
+            self.has_error = True
+            self._update_display_title()
+            if not self.playing_state and self.play_pause_button and self.play_pause_button.winfo_exists():
+                self.play_pause_button.configure(text="▶")
+        if self.control_server is not None:
+            self._publish_status() # Synchronous, so a command's reply already reflects its effect
+
+    def _on_track_loading(self, resumed):
+        self.is_loading = True; self._update_display_title() # Show loading state
+        if not resumed:
+            self.abort_waveform_generation() # Abort previous waveform gen if any
+            # Show loading placeholders immediately
+            spine_color = self.themes[self.current_theme_name]['plot_spine']
+            self.draw_initial_placeholder(self.ax_wave, self.fig_wave, spine_color, "LOADING...")
+            self.draw_initial_placeholder(self.ax_osc, self.fig_osc, spine_color, "")
 
+    def _on_track_started(self, resumed):
+        self.is_loading = False # Done loading
+        if not resumed and PROFILER.active:
+            PROFILER.snapshot(os.path.basename(self.current_song)) # Allocations at each track load
+        self._show_song_length() # The engine read the length before playing
+        self.select_song(self.current_song_index) # Ensure correct song is highlighted
+        if not resumed:
             # Reset slider and time display for new song
             if self.song_slider and self.song_slider.winfo_exists(): self.song_slider.set(0)
             if self.current_time_label and self.current_time_label.winfo_exists(): self.current_time_label.configure(text="00:00")
+        # Trigger waveform generation if it's a new song, wasn't resuming or was never decoded (restored session)
+        if not resumed or self.waveform_peak_data is None:
+            self.trigger_waveform_generation()
+        else:
+            if self.raw_sample_data is None and self.waveform_token is None:
+                self.trigger_waveform_generation(reload=True) # Samples were released when playback stopped
+            # If resuming, ensure visuals are up-to-date for the current position
+            pos_ratio = np.clip(self.stopped_position / self.song_length, 0.0, 1.0) if self.song_length > 0 else 0.0
+            self.draw_waveform_position_indicator(pos_ratio)
+            if self.fig_wave and self.fig_wave.canvas: self.fig_wave.canvas.draw_idle()
+            self.update_oscilloscope() # Draw initial oscilloscope frame
 
-            # Show placeholders while waveform generates
-            self.draw_initial_placeholder(self.ax_wave, self.fig_wave, spine_color,"GENERATING...")
-            self.draw_initial_placeholder(self.ax_osc, self.fig_osc, spine_color,"") # Clear oscilloscope
+    def _on_track_load_failed(self, song_path, error):
+        if isinstance(error, pygame.error):
+            log.error("Pygame Error loading/playing: %s", error)
+        else:
+            log.error("Error loading/playing song: %s", error, exc_info=error)
+        self.has_error = True; self.is_loading = False;
+        self._update_display_title(base_title=os.path.basename(song_path))
+        if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="▶")
+        # Show error on plots
+        spine_color = self.themes[self.current_theme_name]['plot_spine']
+        self.draw_initial_placeholder(self.ax_wave, self.fig_wave, spine_color, "LOAD ERROR" if isinstance(error, pygame.error) else "ERROR")
+        self.draw_initial_placeholder(self.ax_osc, self.fig_osc, spine_color, "")
 
-            # Start waveform generation and position updates in background
-            self.trigger_waveform_generation()
-            self.start_update_thread()
+    def _on_playback_state(self, change):
+        """Play/pause button, title and update loop for a playing/paused/resumed/stopped transition."""
+        if self.play_pause_button and self.play_pause_button.winfo_exists():
+            self.play_pause_button.configure(text="II" if self.playing_state else "▶") # Pause symbol while playing
+        if self.playing_state:
+            self.start_update_loop()
+        else:
+            self.update_loop_running = False # Stop the update loop
+        self._update_display_title()
+        if change == "stopped":
+            # Reflect the stopped position and clear the oscilloscope
+            self._show_position(self.stopped_position)
+            self.draw_initial_placeholder(self.ax_osc, self.fig_osc, self.themes[self.current_theme_name]['plot_spine'], "")
+
+    def _show_position(self, position, redraw_oscilloscope=False):
+        """Moves the slider, time label and waveform indicator to position (seconds)."""
+        if self.song_slider and self.song_slider.winfo_exists():
+            # Ensure slider value doesn't exceed its 'to' value
+            self.song_slider.set(min(position, self.song_slider.cget("to")))
+        if self.current_time_label and self.current_time_label.winfo_exists():
+            display_time = np.clip(position, 0.0, self.song_length if self.song_length > 0 else position)
+            mins, secs = divmod(int(display_time), 60)
+            self.current_time_label.configure(text=f"{mins:02d}:{secs:02d}")
+        pos_ratio = np.clip(position / self.song_length, 0.0, 1.0) if self.song_length > 0 else 0.0
+        self.draw_waveform_position_indicator(pos_ratio)
+        if self.fig_wave and self.fig_wave.canvas:
+            try: self.fig_wave.canvas.draw_idle()
+            except Exception: pass
+        # Update oscilloscope (optional, can show discontinuity)
+        if redraw_oscilloscope and self.raw_sample_data is not None:
+            self.update_oscilloscope()
+
+    def _on_track_ended(self):
+        """The engine stopped at the end of the track; the next action follows shortly."""
+        self.update_loop_running = False # Stop the update loop
+        self._show_position(self.song_length) # Slider/time/indicator to the very end (start if length is unknown)
+        if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="▶")
+        self.draw_initial_placeholder(self.ax_osc, self.fig_osc, self.themes[self.current_theme_name]['plot_spine'], "")
+        self._update_display_title() # Remove playing prefix
+
+    def _on_tracklist_finished(self, last_song):
+        """End of tracklist without looping: keep the last title, reset to the first track."""
+        if self.songs_list: self.select_song(self.current_song_index) # Select first song
+        self._show_position(0.0)
+        self.draw_initial_placeholder(self.ax_osc, self.fig_osc, self.themes[self.current_theme_name]['plot_spine'], "") # Clear osc
+        self._update_display_title(base_title=os.path.basename(last_song) if last_song else "TRACKLIST END")
+        if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="▶")
+        self.release_buffers("tracklist finished")
+
+    def _ensure_output_rate(self, song_path):
+        """In native rate mode, re-opens the mixer at the track's sample rate if it differs."""
+        if not self.native_rate_output:
+            return
+        sample_rate = self.native_rate_by_path.get(song_path)
+        if sample_rate is None:
+            try:
+                # Header read only, no decoding
+                sample_rate = sf.info(song_path).samplerate
+            except Exception as e:
+                log.warning("Native rate: could not read sample rate of %s: %s", os.path.basename(song_path), e)
+                return # Keep the current output configuration
+            self.native_rate_by_path[song_path] = sample_rate
+        if reopen_mixer_at_rate(sample_rate):
+            self.output_reopen_count += 1
+            log.info("Audio output re-opened at %s Hz", sample_rate)
 
-        except pygame.error as e:
-             print(f"Pygame Error in play_music: {e}")
-             self.has_error = True; self.is_loading = False;
-             self._update_display_title(base_title=f"{os.path.basename(self.current_song)}")
-             self.playing_state = False; self.paused = False; self.current_song = ""; # Reset state
-             if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="▶")
-             # Show error on plots
-             self.draw_initial_placeholder(self.ax_wave, self.fig_wave, spine_color,"LOAD ERROR")
-             self.draw_initial_placeholder(self.ax_osc, self.fig_osc, spine_color,"")
+    # --- Debounced Track Switching ---
 
-        except Exception as e:
-             print(f"Error in play_music: {e}")
-             traceback.print_exc()
-             self.has_error = True; self.is_loading = False;
-             self._update_display_title(base_title=f"{os.path.basename(self.current_song)}")
-             self.playing_state = False; self.paused = False; self.current_song = ""; # Reset state
-             if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="▶")
-             # Show error on plots
-             self.draw_initial_placeholder(self.ax_wave, self.fig_wave, spine_color,"ERROR")
-             self.draw_initial_placeholder(self.ax_osc, self.fig_osc, spine_color,"")
+    def switch_to_track(self, index, immediate=False):
+        """
+        Changes to the track at index. The tracklist and title update right away; the
+        expensive part (audio load, metadata parse, waveform decode) runs in play_music()
+        once no further change has arrived for TRACK_SWITCH_DEBOUNCE_MS.
+        """
+        if not (0 <= index < len(self.songs_list)):
+            return
+        self.current_song_index = index
+        if immediate:
+            self._cancel_pending_track_switch()
+            self.play_music()
+            return
 
-    def stop(self):
-        """Stops playback and records the current position."""
+        # Silence the old track and stop its background work now
         if self.playing_state or self.paused:
-            final_pos = 0.0
-            try:
-                # Determine the final position accurately
-                if self.paused:
-                    # If paused, the stopped_position is already accurate
-                    final_pos = self.stopped_position
-                elif self.playing_state and pygame.mixer.get_init() and pygame.mixer.music.get_busy():
-                    # If playing, calculate position based on last start time and elapsed time
-                    current_pos_ms = pygame.mixer.music.get_pos()
-                    if current_pos_ms != -1:
-                        final_pos = self.stopped_position + (current_pos_ms / 1000.0)
-                    else:
-                        # Fallback if get_pos fails (e.g., right at the end)
-                        final_pos = self.song_time # Use the last known time from update loop
-                else:
-                     # Fallback if not playing/paused but stop was called (e.g., from clear playlist)
-                     final_pos = self.song_time
-
-                # print(f"Stop called, final calculated pos: {final_pos:.2f}s") # Debugging log
-                pygame.mixer.music.stop()
-
-            except pygame.error as e:
-                print(f"Pygame error during stop: {e}")
-            finally:
-                was_playing_or_paused = self.playing_state or self.paused # Record if state changed
-                # Update state variables
-                self.playing_state = False
-                self.paused = False
-                # Store the final position accurately, clipping to song length if known
-                self.stopped_position = np.clip(final_pos, 0.0, self.song_length if self.song_length > 0 else final_pos + 1.0) # Clip to length or allow slight over if length unknown
-                self.song_time = self.stopped_position # Sync internal timer
-
-                # Stop the update thread
-                self.thread_running = False
-
-                # Update UI
-                self._update_display_title()
-                if self.play_pause_button and self.play_pause_button.winfo_exists():
-                    self.play_pause_button.configure(text="▶")
-
-                # Update visuals to reflect the stopped position only if playback was active
-                if was_playing_or_paused:
-                    slider_val = self.stopped_position
-                    if self.song_slider and self.song_slider.winfo_exists():
-                         # Ensure slider value doesn't exceed its 'to' value
-                         max_slider_val = self.song_slider.cget("to")
-                         self.song_slider.set(min(slider_val, max_slider_val))
-
-                    if self.current_time_label and self.current_time_label.winfo_exists():
-                         display_time = np.clip(self.stopped_position, 0.0, self.song_length if self.song_length > 0 else self.stopped_position)
-                         mins, secs = divmod(int(display_time), 60)
-                         self.current_time_label.configure(text=f"{mins:02d}:{secs:02d}")
-
-                    # Update waveform indicator to final position
-                    theme = self.themes[self.current_theme_name]
-                    spine_color = theme['plot_spine']
-                    pos_ratio = np.clip(self.stopped_position / self.song_length, 0.0, 1.0) if self.song_length > 0 else 0.0
-                    self.draw_waveform_position_indicator(pos_ratio)
-                    if self.fig_wave and self.fig_wave.canvas:
-                         try: self.fig_wave.canvas.draw_idle()
-                         except Exception: pass
+            self.stop()
+        self.abort_waveform_generation()
+        self.abort_prefetch()
+        self._show_pending_track()
 
-                    # Clear oscilloscope as playback stopped
-                    self.draw_initial_placeholder(self.ax_osc, self.fig_osc, spine_color,"")
+        # Restart the quiet period
+        self._cancel_pending_track_switch()
+        self.pending_track_switch = self.root.after(TRACK_SWITCH_DEBOUNCE_MS, self._commit_track_switch)
 
-                    print(f"Stopped. Recorded pos: {self.stopped_position:.2f}s")
-        else:
-             # If already stopped, just ensure thread is stopped and UI is correct
-             self.thread_running = False
+    def _show_pending_track(self):
+        """Immediate, cheap UI feedback for a track whose load is still pending."""
+        self.current_song = self.songs_list[self.current_song_index]
+        self.stopped_position = 0.0; self.song_time = 0.0; self.song_length = 0.0 # Blocks seeking until loaded
+        self.waveform_peak_data = None; self.raw_sample_data = None; self.sample_rate = None
+        self.has_error = False; self.is_loading = True
+        self.select_song(self.current_song_index)
+        self._update_display_title()
+        if self.song_slider and self.song_slider.winfo_exists(): self.song_slider.set(0)
+        if self.current_time_label and self.current_time_label.winfo_exists(): self.current_time_label.configure(text="00:00")
+        if self.total_time_label and self.total_time_label.winfo_exists(): self.total_time_label.configure(text="00:00")
+        theme = self.themes[self.current_theme_name]
+        self.draw_initial_placeholder(self.ax_wave, self.fig_wave, theme['plot_spine'], "LOADING...")
+        self._schedule_status_publish()
+
+    def _commit_track_switch(self):
+        """Runs the deferred load for the track the user settled on."""
+        self.pending_track_switch = None
+        self.play_music()
+
+    def _cancel_pending_track_switch(self):
+        """Drops a pending debounced load (returns True if one was pending)."""
+        if self.pending_track_switch is None:
+            return False
+        try: self.root.after_cancel(self.pending_track_switch)
+        except Exception: pass
+        self.pending_track_switch = None
+        return True
+
+    def stop(self):
+        """Stops playback and records the current position."""
+        if not self.engine.stop(): # The engine's "stopped" event updates the widgets
+             # If already stopped, just ensure the update loop is stopped and UI is correct
+             self.update_loop_running = False
              self._update_display_title()
              if self.play_pause_button and self.play_pause_button.winfo_exists():
                  self.play_pause_button.configure(text="▶")
 
 
     def previous_song(self):
-        """Stops current song and plays the previous one in the list."""
+        """Stops current song and plays the previous one (back through the shuffle history when MIX is on)."""
         if not self.songs_list:
             self._update_display_title(base_title="TRACKLIST EMPTY")
             return
 
-        original_index = self.current_song_index
         self.stop() # Stop current song first
-
-        if len(self.songs_list) > 0:
-            # Decrement index, wrapping around
-            self.current_song_index = (original_index - 1 + len(self.songs_list)) % len(self.songs_list)
-            self.play_music() # Play the new song
+        self.switch_to_track(self.engine.previous_track_index())
 
 
-    def next_song(self, auto_advance=False):
-        """Stops current song (unless auto-advancing) and plays the next one."""
+    def next_song(self, immediate=False):
+        """Stops current song and plays the next one (the shuffle order when MIX is on)."""
         if not self.songs_list:
             self._update_display_title(base_title="TRACKLIST EMPTY")
             return
 
-        original_index = self.current_song_index
-
-        # Stop current song only if manually triggered
-        if not auto_advance:
-            self.stop()
-        else:
-            # If auto-advancing (song ended), reset state without explicit stop() call
-            self.playing_state = False
-            self.paused = False
-            self.thread_running = False
-            self.abort_waveform_generation() # Abort potential gen from previous song
-            self.stopped_position = 0.0 # Next song starts at 0
-            self.song_time = 0.0
-            print("Auto-advancing to next song.")
-
-        if len(self.songs_list) > 0:
-             # Increment index, wrapping around
-             self.current_song_index = (original_index + 1) % len(self.songs_list)
-             self.play_music() # Play the new song
+        self.stop()
+        self.switch_to_track(self.engine.next_track_index(), immediate=immediate) # Manual skips are debounced
 
     def volume_adjust(self, value):
         """Adjusts the playback volume based on the volume slider."""
         volume = float(value)
         try:
-            pygame.mixer.music.set_volume(volume)
+            self.audio_output.set_volume(volume)
         except Exception as e:
-            print(f"Warning: Could not set volume: {e}")
+            log.warning("Could not set volume: %s", e)
             return # Don't update UI if setting volume failed
 
         # Update Mute button state/text if volume changes
@@ -1537,7 +4828,7 @@ class MN1MusicPlayer:
              # --- UNMUTE ---
              try:
                  # Restore previous volume
-                 pygame.mixer.music.set_volume(self.previous_volume)
+                 self.audio_output.set_volume(self.previous_volume)
                  # Update slider to match
                  if self.volume_slider and self.volume_slider.winfo_exists():
                      self.volume_slider.set(self.previous_volume)
@@ -1546,16 +4837,16 @@ class MN1MusicPlayer:
                  if self.volume_button and self.volume_button.winfo_exists():
                      self.volume_button.configure(text="VOL", text_color=base_text_col)
              except Exception as e:
-                 print(f"Warning: Could not set volume on unmute: {e}")
+                 log.warning("Could not set volume on unmute: %s", e)
         else:
              # --- MUTE ---
              try:
                  # Store current volume before muting (if > 0)
-                 current_vol = pygame.mixer.music.get_volume()
+                 current_vol = self.audio_output.get_volume()
                  if current_vol > 0:
                      self.previous_volume = current_vol
                  # Set volume to 0
-                 pygame.mixer.music.set_volume(0)
+                 self.audio_output.set_volume(0)
                  # Update slider to 0
                  if self.volume_slider and self.volume_slider.winfo_exists():
                      self.volume_slider.set(0)
@@ -1564,12 +4855,13 @@ class MN1MusicPlayer:
                  if self.volume_button and self.volume_button.winfo_exists():
                      self.volume_button.configure(text="MUTED", text_color=accent_col)
              except Exception as e:
-                 print(f"Warning: Could not set volume on mute: {e}")
+                 log.warning("Could not set volume on mute: %s", e)
 
     def toggle_mix(self):
         """Toggles shuffle/mix mode."""
-        self.shuffle_state = not self.shuffle_state
-        print(f"Mix toggled: {'ON' if self.shuffle_state else 'OFF'}")
+        self.engine.set_shuffle(not self.shuffle_state) # A fresh permutation starts at the current track
+        self._schedule_status_publish()
+        log.debug("Mix toggled: %s", "ON" if self.shuffle_state else "OFF")
         # Update button appearance
         theme = self.themes[self.current_theme_name]
         base_text_col = COLOR_BLACK if self.current_theme_name == "light" else theme["L6_text_light"]
@@ -1580,8 +4872,9 @@ class MN1MusicPlayer:
 
     def toggle_loop(self):
         """Cycles through loop modes: OFF -> ALL -> ONE -> OFF."""
-        self.loop_state = (self.loop_state + 1) % 3 # Cycle 0, 1, 2
-        print(f"Loop toggled: State {self.loop_state}") # 0=Off, 1=All, 2=One
+        self.engine.cycle_loop() # Cycle 0, 1, 2
+        self._schedule_status_publish()
+        log.debug("Loop toggled: State %s", self.loop_state) # 0=Off, 1=All, 2=One
         self.apply_loop_button_state() # Update button appearance
 
     def apply_loop_button_state(self):
@@ -1710,7 +5003,7 @@ class MN1MusicPlayer:
         """Called when the mouse leaves the waveform plot area."""
         # If the user was dragging and leaves the canvas, treat it as a release
         if self.waveform_dragging:
-            print("Waveform leave while dragging - treating as release") # Debug log
+            log.debug("Waveform leave while dragging - treating as release") # Debug log
             self.on_waveform_release(event) # Trigger the seek
 
 
@@ -1750,103 +5043,22 @@ class MN1MusicPlayer:
                 self.fig_wave.canvas.draw_idle() # Redraw waveform plot
 
         except Exception as e:
-            print(f"Error updating position from waveform event: {e}")
+            log.error("Error updating position from waveform event: %s", e)
             # traceback.print_exc()
 
 
+    @PERF.timed("seek")
     def seek_song(self, position_seconds):
         """Seeks to the specified position in the current song."""
-        # Check prerequisites
-        if not (self.current_song and self.song_length > 0 and pygame.mixer.get_init()):
-            print("Seek ignored: No song, zero length, or mixer not initialized.")
-            # Ensure flags are reset if seek fails early
-            self.is_seeking = False; self.slider_active = False; self.waveform_dragging = False
-            return
-
-        self.is_seeking = True # Set flag to block updates during seek operation
-        try:
-            self.has_error = False # Clear previous error
-            # Clamp requested position to valid range (slightly before end)
-            # Subtracting a small amount helps prevent issues seeking exactly to the end
-            seek_pos = np.clip(position_seconds, 0.0, self.song_length - 0.1 if self.song_length > 0.1 else 0.0)
-
-            print(f"Seeking to: {seek_pos:.2f}s (requested: {position_seconds:.2f}s)")
-
-            # --- Update internal time immediately ---
-            # This is crucial: update the base position before starting playback
-            self.stopped_position = seek_pos
-            self.song_time = seek_pos # Sync internal timer
-
-            # --- Update UI to reflect seek position ---
-            # Slider
-            if self.song_slider and self.song_slider.winfo_exists():
-                 max_slider_val = self.song_slider.cget("to")
-                 self.song_slider.set(min(seek_pos, max_slider_val))
-            # Time label
-            if self.current_time_label and self.current_time_label.winfo_exists():
-                mins, secs = divmod(int(seek_pos), 60)
-                self.current_time_label.configure(text=f"{mins:02d}:{secs:02d}")
-            # Waveform indicator
-            pos_ratio = np.clip(seek_pos / self.song_length, 0.0, 1.0) if self.song_length > 0 else 0.0
-            self.draw_waveform_position_indicator(pos_ratio)
-            if self.fig_wave and self.fig_wave.canvas:
-                try: self.fig_wave.canvas.draw_idle()
-                except Exception: pass
-            # Update oscilloscope (optional, can show discontinuity)
-            if self.raw_sample_data is not None:
-                self.update_oscilloscope()
-
-            # --- Perform the actual seek using Pygame ---
-            # Note: Pygame requires loading the song again to seek reliably with play(start=...)
-            # This might cause a slight delay/hiccup but is safer.
-            try:
-                # Only call play if music was playing or paused. If stopped, just set the position.
-                if self.playing_state or self.paused:
-                    was_paused = self.paused # Store state before playing
-                    # Reload and play from the seek position
-                    # It seems pygame.mixer.music.set_pos() is unreliable/deprecated.
-                    # Using stop/load/play(start=...) is the recommended way.
-                    pygame.mixer.music.stop() # Stop first
-                    pygame.mixer.music.load(self.current_song) # Reload
-                    pygame.mixer.music.play(start=seek_pos) # Play from new position
-
-                    # Restore paused state if necessary
-                    if was_paused:
-                        pygame.mixer.music.pause()
-                        self.playing_state = False # Ensure state is consistent
-                        self.paused = True
-                        if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="▶") # Show play symbol
-                    else:
-                        self.playing_state = True # Playback is now active
-                        self.paused = False
-                        if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="II") # Show pause symbol
-                        # Restart the update thread only if playback is active
-                        self.start_update_thread()
-
-                    self._update_display_title() # Update title based on new state
-                else:
-                    # If player was stopped, we've already updated stopped_position.
-                    # No need to call play(). The next time play is pressed, it will use it.
-                     self._update_display_title() # Ensure title is correct (not playing/paused)
-                     if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="▶") # Ensure play symbol
-                     print(f"Player stopped, updated next start pos to {seek_pos:.2f}s")
-
-            except pygame.error as e:
-                print(f"Pygame error on seek's play/pause: {e}")
-                self.has_error = True; self._update_display_title()
-                # Attempt to reset state cleanly
-                self.playing_state = False; self.paused = False;
-                if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="▶")
-            except Exception as e:
-                print(f"General error during seek's play/pause: {e}")
-                traceback.print_exc()
-                self.has_error = True; self._update_display_title()
-                self.playing_state = False; self.paused = False;
-                if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="▶")
-
-        finally:
-            # Schedule clearing the seeking flag slightly later to allow Pygame to process
-            self.root.after(50, self._clear_seeking_flag)
+        self.is_seeking = True # Set flag to block updates while the output restarts
+        self.has_error = False # Clear previous error
+        # Widgets follow the engine's "seek" (and "state"/"error") events
+        if self.engine.seek(position_seconds) and not (self.playing_state or self.paused):
+            # Player stopped: the next PLAY starts from here
+            self._update_display_title()
+            if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="▶")
+        # Schedule clearing the seeking flag slightly later to allow Pygame to process
+        self.root.after(50, self._clear_seeking_flag)
 
 
     def _clear_seeking_flag(self):
@@ -1855,7 +5067,7 @@ class MN1MusicPlayer:
         # print("Seek flag cleared") # Debug log
 
     def update_song_info(self):
-        """Updates song length, total time display, and slider range using Mutagen."""
+        """Updates song length, total time display, and slider range from the library index."""
         if not self.current_song:
             # Reset if no song is loaded
             self._update_display_title(base_title="NO SONG LOADED")
@@ -1863,276 +5075,191 @@ class MN1MusicPlayer:
             if self.song_slider and self.song_slider.winfo_exists(): self.song_slider.configure(to=100, number_of_steps=100); self.song_slider.set(0)
             self.song_length = 0.0
             return
+        self.song_length = self._track_length(self.current_song)
+        self._show_song_length()
 
-        song_name = os.path.basename(self.current_song)
+    @PERF.timed("song_info")
+    def _track_length(self, song_path):
+        """Track length in seconds from the library index (0.0 and an error state if unreadable)."""
+        song_name = os.path.basename(song_path)
         try:
-            file_extension = os.path.splitext(self.current_song)[1].lower()
-            audio = None
-            # --- Modified file type check for metadata ---
-            if file_extension == '.mp3':
-                audio = MP3(self.current_song)
-            elif file_extension == '.flac':
-                audio = FLAC_MUTAGEN(self.current_song)
-            elif file_extension == '.ogg':
-                 audio = OggVorbis(self.current_song)
-            elif file_extension == '.wav':
-                 audio = WAVE(self.current_song)
-            # --- End Modification ---
-            else:
+            # Read from the library index; the file is only parsed again if its size/mtime changed
+            info = self.library.get_info(song_path)
+            if info is None:
                  # Should ideally not happen if add_songs filters, but handle defensively
-                 raise ValueError(f"Unsupported file type for info: {file_extension}")
-
-            # Get length from mutagen info
-            if audio and hasattr(audio, 'info') and hasattr(audio.info, 'length'):
-                self.song_length = audio.info.length
-                # Validate length
-                if not isinstance(self.song_length, (int, float)) or self.song_length <= 0:
-                     print(f"Warning: Mutagen reported invalid length ({self.song_length}) for {song_name}. Falling back to 0.")
-                     self.song_length = 0.0
-
-                # Format total time string
-                mins, secs = divmod(int(self.song_length), 60)
-                self.total_time = f"{mins:02d}:{secs:02d}"
-                if self.total_time_label and self.total_time_label.winfo_exists():
-                    self.total_time_label.configure(text=self.total_time)
-
-                # Configure slider range based on song length
-                # Use max(1.0, ...) to prevent slider having zero range
-                slider_max = max(1.0, self.song_length)
-                # More steps for longer songs can feel smoother (optional)
-                num_steps = max(100, int(slider_max * 10))
-                if self.song_slider and self.song_slider.winfo_exists():
-                    self.song_slider.configure(to=slider_max, number_of_steps=num_steps)
-
-                # Reset slider position only if starting fresh (not resuming)
-                if self.stopped_position == 0 and not self.playing_state and not self.paused:
-                    if self.song_slider and self.song_slider.winfo_exists():
-                        self.song_slider.set(0)
-                    if self.current_time_label and self.current_time_label.winfo_exists():
-                        self.current_time_label.configure(text="00:00")
-
-            else:
+                 raise ValueError(f"Unsupported file type for info: {os.path.splitext(song_path)[1].lower()}")
+            if info.get("length") is None:
                 raise ValueError(f"Mutagen could not read info/length for {song_name}")
-
+            song_length = info["length"]
+            # Validate length
+            if not isinstance(song_length, (int, float)) or song_length <= 0:
+                 log.warning("Mutagen reported invalid length (%s) for %s. Falling back to 0.", song_length, song_name)
+                 song_length = 0.0
+            return song_length
         except Exception as e:
             # Handle errors reading metadata
-            print(f"Error getting song info for {song_name}: {e}")
+            log.error("Error getting song info for %s: %s", song_name, e)
             self.has_error = True # Indicate error state
             self._update_display_title(base_title=song_name) # Show filename with error prefix
-            self.song_length = 0.0
-            self.total_time = "00:00"
-            # Reset UI elements
-            if self.total_time_label and self.total_time_label.winfo_exists(): self.total_time_label.configure(text=self.total_time)
-            if self.song_slider and self.song_slider.winfo_exists(): self.song_slider.configure(to=100, number_of_steps=100); self.song_slider.set(0)
-            if self.current_time_label and self.current_time_label.winfo_exists(): self.current_time_label.configure(text="00:00")
+            return 0.0
+
+    def _show_song_length(self):
+        """Shows song_length in the total time label and the slider range."""
+        # Format total time string
+        mins, secs = divmod(int(self.song_length), 60)
+        self.total_time = f"{mins:02d}:{secs:02d}"
+        if self.total_time_label and self.total_time_label.winfo_exists():
+            self.total_time_label.configure(text=self.total_time)
+
+        # Configure slider range based on song length
+        # Use max(1.0, ...) to prevent slider having zero range
+        slider_max = max(1.0, self.song_length)
+        # More steps for longer songs can feel smoother (optional)
+        num_steps = max(100, int(slider_max * 10)) if self.song_length > 0 else 100
+        if self.song_slider and self.song_slider.winfo_exists():
+            self.song_slider.configure(to=slider_max, number_of_steps=num_steps)
+
+        # Reset slider position only if starting fresh (not resuming)
+        if self.stopped_position == 0 and not self.playing_state and not self.paused:
+            if self.song_slider and self.song_slider.winfo_exists():
+                self.song_slider.set(0)
+            if self.current_time_label and self.current_time_label.winfo_exists():
+                self.current_time_label.configure(text="00:00")
 
     # --- Waveform Generation ---
 
-    def trigger_waveform_generation(self):
-        """Initiates background waveform data generation for the current song."""
-        # Abort previous generation if still running
-        if self.waveform_thread and self.waveform_thread.is_alive():
-            print("Aborting previous waveform generation thread...")
+    def trigger_waveform_generation(self, reload=False):
+        """
+        Initiates background waveform data generation for the current song. With reload, only the
+        released oscilloscope samples are rebuilt: the waveform stays drawn until the result arrives.
+        """
+        # Abort previous generation if still running (its token stops it at the next block; no need to wait)
+        if self.waveform_token is not None:
+            log.debug("Aborting previous waveform generation...")
             self.abort_waveform_generation()
-            # Give the old thread a moment to exit
-            # self.waveform_thread.join(timeout=0.1) # Optional wait
-            time.sleep(0.05) # Short sleep instead of join to avoid blocking UI
 
 
         if not self.current_song:
-            print("Waveform generation skipped: No current song.")
+            log.debug("Waveform generation skipped: No current song.")
             return
 
-        # Reset data and set state
-        self.waveform_peak_data = None
-        self.raw_sample_data = None
-        self.sample_rate = None
-        self.is_generating_waveform = True
-        self.has_error = False # Clear previous error status
-        self._update_display_title() # Show "GENERATING..."
+        # --- Serve from the decoded audio cache if this track was decoded recently ---
+        cached = self.decoded_cache.get(self.current_song)
+        if cached is not None:
+            peak_data, raw_data, sample_rate = cached
+            log.debug("Waveform cache hit for: %s", os.path.basename(self.current_song))
+            self.is_generating_waveform = True # process_waveform_result clears it
+            self.process_waveform_result(self.current_song, peak_data, raw_data, sample_rate, None)
+            return
 
-        # Show placeholder on plots
-        theme = self.themes[self.current_theme_name]
-        spine_color = theme['plot_spine']
-        self.draw_initial_placeholder(self.ax_wave, self.fig_wave, spine_color,"GENERATING...")
-        self.draw_initial_placeholder(self.ax_osc, self.fig_osc, spine_color,"")
-
-        # Start the background thread
-        self.waveform_abort_flag.clear() # Ensure flag is clear before starting
-        self.waveform_thread = threading.Thread(
-            target=self.generate_waveform_data_background,
-            args=(self.current_song, self.waveform_abort_flag), # Pass path and abort flag
-            daemon=True # Allows application to exit even if thread is running
-        )
-        self.waveform_thread.start()
-        print(f"Started waveform generation thread for: {os.path.basename(self.current_song)}")
+        # The foreground decode takes priority over any prefetch in flight
+        self.abort_prefetch()
 
+        if not reload or self.waveform_peak_data is None:
+            # Reset data and set state
+            self.waveform_peak_data = None
+            self.raw_sample_data = None
+            self.sample_rate = None
+            self.is_generating_waveform = True
+            self.has_error = False # Clear previous error status
+            self._update_display_title() # Show "GENERATING..."
+
+            # Show placeholder on plots
+            theme = self.themes[self.current_theme_name]
+            spine_color = theme['plot_spine']
+            self.draw_initial_placeholder(self.ax_wave, self.fig_wave, spine_color,"GENERATING...")
+            self.draw_initial_placeholder(self.ax_osc, self.fig_osc, spine_color,"")
 
-    def generate_waveform_data_background(self, song_path, abort_flag):
+        # Queue the decode ahead of all other background work
+        # A fresh token per decode: it cancels only this one, and its result is dropped once cancelled
+        self.waveform_token = self.tasks.submit(
+            self.generate_waveform_data_background, self.current_song,
+            priority=TASK_PRIORITY_FOREGROUND, name="waveform", on_done=self._on_waveform_result)
+        log.debug("Queued waveform generation for: %s", os.path.basename(self.current_song))
+
+
+    def generate_waveform_data_background(self, abort_flag, song_path):
         """
-        Background thread function to load audio data using soundfile
-        and generate peak data for waveform and raw data for oscilloscope.
+        Executor task that loads audio data using soundfile and generates peak data for the
+        waveform and raw data for the oscilloscope. Returns the arguments for process_waveform_result,
+        or None if aborted.
         """
         local_peak_data = None
         local_raw_data = None
         effective_sample_rate = None
         error_message = None
-        print(f"BG_THREAD: Starting waveform generation for {os.path.basename(song_path)}")
+        log.debug("Starting waveform generation for %s", os.path.basename(song_path))
 
         try:
             start_time = time.monotonic()
 
-            # --- Check for abort signal frequently ---
-            if abort_flag.is_set():
-                print("BG_THREAD: Aborted before loading.")
-                return
-
-            # --- Load Audio using soundfile ---
-            # soundfile supports many formats (MP3, FLAC, OGG, WAV etc.) via libsndfile
-            # always_2d=True ensures consistent shape even for mono files
-            if not os.path.exists(song_path):
-                raise FileNotFoundError(f"Audio file not found: {song_path}")
-
-            try:
-                audio_data, original_sample_rate = sf.read(song_path, dtype='float64', always_2d=True)
-            except sf.SoundFileError as sf_err:
-                 # More specific error catching for soundfile issues
-                 error_message = f"WAVEFORM ERROR\nSoundfile Error\n({sf_err})"
-                 print(f"BG_THREAD: SoundFileError: {sf_err}")
-                 raise # Re-raise to be caught by the general exception handler below
-            except Exception as load_err:
-                 # Catch other potential loading errors (permissions, etc.)
-                 print(f"BG_THREAD: Error loading audio with soundfile: {load_err}")
-                 # Check specifically for missing libsndfile library
-                 if "sndfile library not found" in str(load_err).lower():
-                     raise ImportError(f"libsndfile not found. Soundfile cannot operate. Error: {load_err}")
-                 else:
-                     raise RuntimeError(f"Soundfile load failed: {load_err}")
-
-
-            if abort_flag.is_set():
-                 print("BG_THREAD: Aborted after loading.")
-                 return
-
-            # --- Process Audio Data ---
-            if audio_data.size == 0:
-                raise ValueError("Audio file contains no samples.")
-
-            # Convert to mono if stereo by averaging channels
-            if audio_data.shape[1] > 1:
-                mono_samples_normalized = audio_data.mean(axis=1)
-            else:
-                mono_samples_normalized = audio_data[:, 0]
-
-            # Check for silence (optional, but can be informative)
-            if not np.any(mono_samples_normalized):
-                 print(f"Warning: Audio file {os.path.basename(song_path)} appears to be silent.")
-
-            # --- Check for abort signal ---
-            if abort_flag.is_set():
-                 print("BG_THREAD: Aborted before processing raw/peak data.")
-                 return
-
-            # --- Prepare Data for Oscilloscope (Downsample if needed) ---
-            if self.osc_downsample_factor > 1:
-                 # Take every Nth sample
-                 local_raw_data = mono_samples_normalized[::self.osc_downsample_factor]
-                 effective_sample_rate = original_sample_rate / self.osc_downsample_factor
-            else:
-                 local_raw_data = mono_samples_normalized
-                 effective_sample_rate = original_sample_rate
-
-            # --- Check for abort signal ---
-            if abort_flag.is_set():
-                 print("BG_THREAD: Aborted before generating peak data.")
-                 return
-
-            # --- Generate Peak Data for Static Waveform ---
-            # Aim for a fixed number of points for the visual waveform
-            target_points = 500 # Adjust for desired detail vs performance
-            num_samples = len(mono_samples_normalized)
-
-            if num_samples > 0:
-                # Calculate chunk size to get roughly target_points
-                chunk_size = max(1, num_samples // target_points)
-                processed_peaks = []
-                num_chunks = (num_samples + chunk_size - 1) // chunk_size # Ceiling division
-
-                # Iterate through chunks and find the peak (max absolute value) in each
-                for i in range(num_chunks):
-                     # --- Check for abort signal periodically inside loop ---
-                     if i % 50 == 0 and abort_flag.is_set(): # Check every 50 chunks
-                          print(f"BG_THREAD: Aborted during peak generation (chunk {i}).")
-                          return
-
-                     start = i * chunk_size
-                     end = min((i + 1) * chunk_size, num_samples)
-                     chunk = mono_samples_normalized[start:end]
-
-                     # Find peak (max absolute value) in the chunk
-                     peak = np.max(np.abs(chunk)) if len(chunk) > 0 else 0.0
-                     processed_peaks.append(peak)
-
-                local_peak_data = np.array(processed_peaks)
-            else:
-                # Handle empty audio case
-                local_peak_data = np.array([])
+            result = decode_waveform_data(song_path, abort_flag, self.osc_downsample_factor, memory=self.memory)
+            if result is None:
+                log.debug("Aborted while decoding %s.", os.path.basename(song_path))
+                return None
+            local_peak_data, local_raw_data, effective_sample_rate = result
 
+            # Keep the decoded data for instant previous/next navigation
+            self.decoded_cache.put(song_path, local_peak_data, local_raw_data, effective_sample_rate)
+            self._store_thumbnail_peaks(song_path, local_peak_data)
 
             # --- Generation Complete ---
             end_time = time.monotonic()
-            print(f"BG_THREAD: Waveform gen (soundfile) finished: {os.path.basename(song_path)} in {end_time - start_time:.2f}s")
+            log.debug("Waveform gen (soundfile) finished: %s in %.2fs", os.path.basename(song_path), end_time - start_time)
 
         # --- Error Handling ---
+        except sf.SoundFileError as sf_err:
+             error_message = f"WAVEFORM ERROR\nSoundfile Error\n({sf_err})"
+             log.debug("Waveform decode SoundFileError: %s", sf_err)
         except ImportError as e:
              # Specific error for missing dependencies like libsndfile
              error_message = f"WAVEFORM ERROR\nDependency Missing?\n(e.g., libsndfile)\n{e}"
-             print(f"BG_THREAD: ImportError: {e}")
+             log.debug("Waveform decode ImportError: %s", e)
         except FileNotFoundError as e:
             error_message = f"WAVEFORM ERROR\nFile Not Found\n({e})"
-            print(f"BG_THREAD: FileNotFoundError: {e}")
+            log.debug("Waveform decode FileNotFoundError: %s", e)
         except PermissionError as e:
              error_message = f"WAVEFORM ERROR\nPermission Denied\n({e})"
-             print(f"BG_THREAD: PermissionError: {e}")
+             log.debug("Waveform decode PermissionError: %s", e)
+        except OSError as e:
+            # E.g. no space left for the memory-mapped oscilloscope samples
+            error_message = f"WAVEFORM ERROR\nI/O Error\n({e})"
+            log.debug("Waveform decode OSError: %s", e)
         except MemoryError:
              # Handle cases where the file is too large to load into memory
              error_message = "WAVEFORM ERROR\nMemory Error"
-             print(f"BG_THREAD: MemoryError loading {os.path.basename(song_path)}")
+             log.debug("Waveform decode MemoryError loading %s", os.path.basename(song_path))
         except ValueError as e:
              # Handle invalid audio data (e.g., empty file, format issues not caught by sf.read)
              error_message = f"WAVEFORM ERROR\nInvalid Audio Data\n({e})"
-             print(f"BG_THREAD: ValueError: {e}")
+             log.debug("Waveform decode ValueError: %s", e)
         except RuntimeError as e:
              # Catch runtime errors, potentially from soundfile internal issues
              error_message = f"WAVEFORM ERROR\nLoad/Process Error\n({e})"
-             print(f"BG_THREAD: RuntimeError: {e}")
+             log.debug("Waveform decode RuntimeError: %s", e)
         except Exception as e:
              # Generic catch-all for unexpected errors
-             print(f"BG_THREAD: UNEXPECTED error generating waveform (soundfile):")
-             traceback.print_exc() # Print full traceback for debugging
+             log.exception("UNEXPECTED error generating waveform (soundfile)") # Full traceback for debugging
              error_message = f"WAVEFORM ERROR\nUnexpected Error\n({type(e).__name__})"
 
-        # --- Final Step: Send results back to main thread ---
-        finally:
-            if not abort_flag.is_set():
-                 # Check if root window still exists before scheduling callback
-                 if hasattr(self, 'root') and self.root.winfo_exists():
-                     # Use root.after to safely pass data back to the main thread
-                     self.root.after(1, self.process_waveform_result, song_path, local_peak_data, local_raw_data, effective_sample_rate, error_message)
-                 else:
-                      print("BG_THREAD: Root window closed, skipping result processing.")
-            else:
-                 # If aborted, don't send potentially incomplete results
-                 print(f"BG_THREAD: Waveform generation was aborted for {os.path.basename(song_path)}, result not processed.")
+        # --- Final Step: Hand results to the main thread (the executor drops them if aborted meanwhile) ---
+        return song_path, local_peak_data, local_raw_data, effective_sample_rate, error_message
+
+
+    def _on_waveform_result(self, result):
+        """Executor callback (Tk thread) for the current song's decode."""
+        self.waveform_token = None
+        if result is not None:
+            self.process_waveform_result(*result)
 
 
     def process_waveform_result(self, song_path, peak_data, raw_data, sample_rate, error_message):
         """Processes the waveform data received from the background thread."""
         # Check if the result is still relevant (user might have switched songs)
         if song_path != self.current_song:
-            print(f"Waveform result for '{os.path.basename(song_path)}' ignored (song changed).")
+            log.debug("Waveform result for '%s' ignored (song changed).", os.path.basename(song_path))
             # Ensure generating flag is cleared if this was the active generation task
-            if self.is_generating_waveform and self.waveform_thread and not self.waveform_thread.is_alive():
+            if self.is_generating_waveform and self.waveform_token is None:
                  self.is_generating_waveform = False
                  # Don't update title here, let the new song's process handle it
             return
@@ -2152,29 +5279,33 @@ class MN1MusicPlayer:
             # Display error message on the waveform plot
             self.draw_initial_placeholder(self.ax_wave, self.fig_wave, spine_color, error_message)
             self.draw_initial_placeholder(self.ax_osc, self.fig_osc, spine_color, "") # Clear oscilloscope
-            print(f"Waveform generation failed for {os.path.basename(song_path)}: {error_message.replace('/n', ' - ')}") # Log flattened error
+            log.warning("Waveform generation failed for %s: %s", os.path.basename(song_path), error_message.replace('/n', ' - ')) # Log flattened error
         elif peak_data is not None and raw_data is not None and sample_rate is not None:
             # Handle success case
             self.waveform_peak_data = peak_data
             self.raw_sample_data = raw_data
             self.sample_rate = sample_rate
+            self.memory.enforce() # Older cache entries make room for the track now held
             self.has_error = False
             self._update_display_title() # Update title (remove generating prefix)
             # Draw the newly generated waveform
             self.draw_static_matplotlib_waveform()
             # Update position immediately in case song started playing during generation
             self.update_song_position() # This will also trigger oscilloscope update if playing
-            print(f"Waveform generated successfully for: {os.path.basename(song_path)}")
+            log.debug("Waveform generated successfully for: %s", os.path.basename(song_path))
+            # Decode the upcoming track in the background so skipping ahead is instant
+            self.prefetch_upcoming_track()
         else:
              # Handle unexpected case where thread finished without error but data is missing
              self.waveform_peak_data = None; self.raw_sample_data = None; self.sample_rate = None; self.has_error = True
              self._update_display_title(base_title=os.path.basename(song_path))
              self.draw_initial_placeholder(self.ax_wave, self.fig_wave, spine_color,"GEN FAILED (Internal)")
              self.draw_initial_placeholder(self.ax_osc, self.fig_osc, spine_color,"")
-             print(f"Waveform generation failed internally (missing data) for: {os.path.basename(song_path)}")
+             log.error("Waveform generation failed internally (missing data) for: %s", os.path.basename(song_path))
 
     # --- Matplotlib Drawing Functions ---
 
+    @PERF.timed("draw_waveform")
     def draw_static_matplotlib_waveform(self):
         """Draws the full waveform using the processed peak data."""
         ax = self.ax_wave
@@ -2229,12 +5360,12 @@ class MN1MusicPlayer:
 
 
         except Exception as e:
-            print(f"Error drawing static waveform: {e}")
-            traceback.print_exc()
+            log.exception("Error drawing static waveform: %s", e)
             # Attempt to draw error placeholder
             self.draw_initial_placeholder(ax, fig, spine_color, "DRAW ERROR")
 
 
+    @PERF.timed("draw_position")
     def draw_waveform_position_indicator(self, position_ratio):
         """Draws or updates the vertical line indicating playback position on the waveform."""
         ax = self.ax_wave
@@ -2286,11 +5417,11 @@ class MN1MusicPlayer:
                  setattr(self, line_attr, new_line) # Store reference to the new line
 
         except Exception as e:
-            print(f"Error drawing position indicator: {e}")
-            traceback.print_exc()
+            log.exception("Error drawing position indicator: %s", e)
             # Ensure attribute is cleared on error
             setattr(self, line_attr, None)
 
+    @PERF.timed("oscilloscope")
     def update_oscilloscope(self):
         """Updates the oscilloscope display based on current playback time."""
         ax = self.ax_osc
@@ -2328,6 +5459,8 @@ class MN1MusicPlayer:
             start_index = max(0, end_index - window_samples)
 
             sample_slice = self.raw_sample_data[start_index:end_index]
+            if sample_slice.dtype == np.int16: # Stored compactly under a tight memory budget
+                sample_slice = sample_slice / INT16_FULL_SCALE
 
             # --- Draw the slice ---
             if len(sample_slice) > 0:
@@ -2352,7 +5485,7 @@ class MN1MusicPlayer:
 
         except Exception as e:
             # Prevent errors here from crashing the update loop
-            print(f"Error updating oscilloscope: {e}")
+            log.error("Error updating oscilloscope: %s", e)
             # Optionally clear plot on error:
             # self.draw_initial_placeholder(ax, fig, spine_color, "")
 
@@ -2367,329 +5500,119 @@ class MN1MusicPlayer:
 
         if self.playing_state and not self.paused:
              try:
-                 # Check if mixer is still initialized and music is playing
-                 if pygame.mixer.get_init() and pygame.mixer.music.get_busy():
-                     # Get time elapsed since the last play() or unpause() call (in ms)
-                     current_pos_ms = pygame.mixer.music.get_pos()
-
-                     if current_pos_ms != -1: # -1 indicates an error or not playing
-                         # Calculate absolute time: base position + elapsed time
-                         time_since_last_play_sec = current_pos_ms / 1000.0
-                         current_abs_time = self.stopped_position + time_since_last_play_sec
-
-                         # --- Sanity Check / Prevent runaway time ---
-                         # Add a small buffer to song length check
-                         buffer = 0.1
-                         current_abs_time = np.clip(current_abs_time, 0.0, (self.song_length + buffer) if self.song_length > 0 else current_abs_time + 1.0) # Clip to length + buffer
-                         self.song_time = current_abs_time # Update internal time tracker
-
-                         # --- Update UI elements ---
-                         # Use time clipped to actual song length for display
-                         display_time_for_ui = np.clip(self.song_time, 0.0, self.song_length if self.song_length > 0 else self.song_time)
-
-                         # Update Slider (if not being dragged)
-                         if self.song_slider and self.song_slider.winfo_exists():
-                             max_slider_val = self.song_slider.cget("to")
-                             self.song_slider.set(min(display_time_for_ui, max_slider_val))
-
-                         # Update Time Label
-                         if self.current_time_label and self.current_time_label.winfo_exists():
-                             mins, secs = divmod(int(display_time_for_ui), 60)
-                             time_elapsed_str = f"{mins:02d}:{secs:02d}"
-                             # Only update label if text changed to reduce flicker/overhead
-                             if self.current_time_label.cget("text") != time_elapsed_str:
-                                 self.current_time_label.configure(text=time_elapsed_str)
-
-                         # Update Waveform Indicator
-                         pos_ratio = np.clip(display_time_for_ui / self.song_length, 0.0, 1.0) if self.song_length > 0 else 0
-                         self.draw_waveform_position_indicator(pos_ratio)
-                         # Redraw waveform canvas (needed for indicator update)
-                         if self.fig_wave and self.fig_wave.canvas:
-                             try: self.fig_wave.canvas.draw_idle()
-                             except Exception: pass # Ignore if canvas not ready
-
-                         # Update Oscilloscope
-                         self.update_oscilloscope()
-
-                     # else: get_pos() returned -1, might be end of song or error
-
-                 else: # Mixer not init or music not busy (i.e., stopped)
-                     # Check if this happened unexpectedly while self.playing_state is true
-                     if hasattr(self, 'root') and self.root.winfo_exists() and self.playing_state:
-                        # Potential end-of-song condition or unexpected stop
-                        # Use song_time and song_length for check
-                        is_past_end = (self.song_length > 0 and self.song_time >= self.song_length - 0.05) # Check slightly before end
-                        mixer_really_stopped = pygame.mixer.get_init() and not pygame.mixer.music.get_busy()
-
-                        # If mixer stopped OR we are past the calculated end time, trigger end check
-                        if is_past_end or mixer_really_stopped:
-                            if hasattr(self, 'root') and self.root.winfo_exists():
-                                # Schedule the check on the main thread to handle UI/state changes safely
-                                self.root.after(50, self.check_music_end_on_main_thread)
-                        # else: Normal playback, just hasn't reached end yet
+                 # Absolute time from the output clock (None if the output isn't running)
+                 position = self.engine.update_position()
+                 if position is not None:
+                     # --- Update UI elements ---
+                     # Use time clipped to actual song length for display
+                     display_time_for_ui = np.clip(position, 0.0, self.song_length if self.song_length > 0 else position)
+
+                     # Update Slider (if not being dragged)
+                     if self.song_slider and self.song_slider.winfo_exists():
+                         max_slider_val = self.song_slider.cget("to")
+                         self.song_slider.set(min(display_time_for_ui, max_slider_val))
+
+                     # Update Time Label
+                     if self.current_time_label and self.current_time_label.winfo_exists():
+                         mins, secs = divmod(int(display_time_for_ui), 60)
+                         time_elapsed_str = f"{mins:02d}:{secs:02d}"
+                         # Only update label if text changed to reduce flicker/overhead
+                         if self.current_time_label.cget("text") != time_elapsed_str:
+                             self.current_time_label.configure(text=time_elapsed_str)
+
+                     # Update Waveform Indicator
+                     pos_ratio = np.clip(display_time_for_ui / self.song_length, 0.0, 1.0) if self.song_length > 0 else 0
+                     self.draw_waveform_position_indicator(pos_ratio)
+                     # Redraw waveform canvas (needed for indicator update)
+                     if self.fig_wave and self.fig_wave.canvas:
+                         try: self.fig_wave.canvas.draw_idle()
+                         except Exception: pass # Ignore if canvas not ready
+
+                     # Update Oscilloscope
+                     self.update_oscilloscope()
+
+                 elif self.engine.end_pending() and self.root.winfo_exists():
+                     # Output stopped or past the end: confirm on the main loop (handles state changes safely)
+                     self.root.after(50, self.check_music_end_on_main_thread)
 
              except pygame.error as e:
                  # Handle Pygame errors during update (e.g., mixer died)
-                 print(f"Pygame error in update_song_position: {e}")
+                 log.warning("Pygame error in update_song_position: %s", e)
                  self.has_error = True
                  if hasattr(self, 'root') and self.root.winfo_exists(): self._update_display_title()
                  self.stop() # Attempt to stop cleanly
              except Exception as e:
                  # Catch other unexpected errors in the update logic
                  if hasattr(self, 'root') and self.root.winfo_exists(): # Check if window exists
-                     print(f"Error during UI update: {e}")
+                     log.error("Error during UI update: %s", e)
                      # traceback.print_exc() # Optional detailed traceback
-                 # Stop the update thread if unexpected errors occur
-                 self.thread_running = False
-
-
-    def start_update_thread(self):
-        """Starts the background thread for updating time if not already running."""
-        # Only start if playing, not paused, and thread isn't already marked as running
-        if not self.thread_running and self.playing_state and not self.paused:
-            self.thread_running = True
-            # Prevent starting multiple threads if one is already assigned and alive
-            if self.update_thread and self.update_thread.is_alive():
-                # print("Update thread already running.") # Debug
-                return
-            # Create and start the thread
-            self.update_thread = threading.Thread(target=self.update_time, daemon=True)
-            self.update_thread.start()
-            # print("Update thread started.") # Debug
-        elif not self.playing_state or self.paused:
-            # If state changed to non-playing/paused, ensure thread flag is off
-            self.thread_running = False
-
-
-    def update_time(self):
-        """Background thread function to periodically trigger UI updates."""
-        # Update frequency (e.g., 20 times per second)
-        # Lower value = smoother updates but more CPU usage
-        # Higher value = less smooth but less CPU usage
-        update_interval = 0.05 # seconds (20 Hz)
-
-        while self.thread_running:
-            start_loop_time = time.monotonic()
-            try:
-                # --- Schedule UI update on main thread ---
-                # Check if root window still exists before calling 'after'
-                if hasattr(self, 'root') and self.root.winfo_exists():
-                    # root.after(0, ...) schedules the function to run ASAP in the main event loop
-                    self.root.after(0, self.update_song_position)
-                else:
-                    # Root window closed, stop the thread
-                    print("Update thread stopping: Root window destroyed.")
-                    self.thread_running = False
-                    break # Exit the loop
+                 # Stop the update loop if unexpected errors occur
+                 self.update_loop_running = False
 
-            except Exception as e:
-                 # Catch errors related to scheduling the update (e.g., Tkinter errors)
-                 if "application has been destroyed" in str(e).lower() or \
-                    "invalid command name" in str(e).lower():
-                     print("Update thread stopping: Tkinter object destroyed.")
-                 else:
-                     print(f"Update thread error: {e}")
-                     # traceback.print_exc() # Optional detailed traceback
-                 self.thread_running = False # Stop thread on error
-                 break # Exit the loop
-
-            # --- Calculate sleep time ---
-            # Sleep for the remainder of the interval to maintain update frequency
-            time_taken = time.monotonic() - start_loop_time
-            sleep_time = max(0, update_interval - time_taken)
-            time.sleep(sleep_time)
-
-            # Check running condition again at end of loop (might have changed during sleep)
-            if not self.playing_state or self.paused:
-                self.thread_running = False
-                # print("Update thread stopping: Playback stopped/paused.") # Debug
 
-        # print("Update thread finished.") # Debug
+    def start_update_loop(self):
+        """Starts the position/visual update loop (root.after on the Tk thread) if playing and not already running."""
+        if self.playing_state and not self.paused:
+            self.update_loop_running = True
+            if self.update_after_id is None: # A tick may still be pending from before a quick pause/resume
+                self.update_after_id = self.root.after(0, self._update_tick)
+        else:
+            self.update_loop_running = False
+
+    def stop_update_loop(self):
+        """Stops the update loop and cancels its pending tick."""
+        self.update_loop_running = False
+        if self.update_after_id is not None:
+            try: self.root.after_cancel(self.update_after_id)
+            except Exception: pass
+            self.update_after_id = None
+
+    @PERF.timed("update_tick")
+    def _update_tick(self):
+        """One update loop iteration; reschedules itself only while playing."""
+        self.update_after_id = None
+        if not self.update_loop_running or not self.playing_state or self.paused:
+            self.update_loop_running = False # Stopped by a state transition since the last tick
+            return
+        tick_start = time.perf_counter()
+        self.update_wakeups += 1
+        self.update_song_position()
+        if self.update_loop_running and self.playing_state and not self.paused:
+            # Keep a steady rate: subtract the time this tick took
+            elapsed_ms = int((time.perf_counter() - tick_start) * 1000)
+            self.update_after_id = self.root.after(max(1, UPDATE_INTERVAL_MS - elapsed_ms), self._update_tick)
+        else:
+            self.update_loop_running = False
 
 
     def check_music_end_on_main_thread(self):
-        """Checks if the music has finished playing and handles end-of-song actions."""
+        """Checks if the music has finished playing and schedules the end-of-song action."""
         # Ensure runs on main thread and window exists
         if not (hasattr(self, 'root') and self.root.winfo_exists()):
             return
-        # Don't check if paused, seeking, or already stopped
-        if not self.playing_state or self.paused or self.is_seeking:
+        # Don't check while seeking (the output is restarting); the engine ignores paused/stopped
+        if self.is_seeking:
             return
-
-        try:
-            # --- Conditions for song end ---
-            # 1. Time reached or passed song length (with tolerance)
-            is_at_end = (self.song_length > 0 and self.song_time >= self.song_length - 0.05)
-            # 2. Pygame mixer reports music is no longer busy
-            mixer_stopped = pygame.mixer.get_init() and not pygame.mixer.music.get_busy()
-            # 3. Pygame mixer get_pos() returns -1 (can happen at end or on error)
-            mixer_pos_error = False
-            if pygame.mixer.get_init():
-                 try:
-                      mixer_pos_error = (pygame.mixer.music.get_pos() == -1)
-                 except pygame.error:
-                      mixer_pos_error = True # Treat pygame error as potential stop
-
-            # --- If any end condition is met ---
-            if mixer_stopped or mixer_pos_error or is_at_end:
-                 # Prevent multiple triggers by ensuring we are still in 'playing' state logically
-                 if not self.playing_state: return
-
-                 print(f"Detected song end: {os.path.basename(self.current_song)} (MixerStopped: {mixer_stopped}, MixerPosError: {mixer_pos_error}, IsAtEnd: {is_at_end})")
-
-                 # --- Update State ---
-                 self.playing_state = False # No longer playing
-                 self.paused = False
-                 self.thread_running = False # Stop update thread
-                 # Set final position accurately to song length if known
-                 final_pos = self.song_length if self.song_length > 0 else 0
-                 self.stopped_position = final_pos
-                 self.song_time = final_pos
-
-                 # --- Update UI ---
-                 # Set slider/time to the very end
-                 if self.song_length > 0:
-                     if self.song_slider and self.song_slider.winfo_exists(): self.song_slider.set(self.song_length)
-                     if self.current_time_label and self.current_time_label.winfo_exists(): mins, secs = divmod(int(self.song_length), 60); self.current_time_label.configure(text=f"{mins:02d}:{secs:02d}")
-                     self.draw_waveform_position_indicator(1.0) # Move indicator to end
-                 else: # Reset if length is unknown
-                     if self.song_slider and self.song_slider.winfo_exists(): self.song_slider.set(0);
-                     if self.current_time_label and self.current_time_label.winfo_exists(): self.current_time_label.configure(text="00:00");
-                     self.draw_waveform_position_indicator(0.0)
-
-                 # Redraw wave plot
-                 if self.fig_wave and self.fig_wave.canvas:
-                      try: self.fig_wave.canvas.draw_idle()
-                      except Exception: pass
-                 # Reset play button
-                 if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="▶")
-                 # Clear oscilloscope
-                 theme = self.themes[self.current_theme_name]; spine_color = theme['plot_spine']
-                 self.draw_initial_placeholder(self.ax_osc, self.fig_osc, spine_color, "")
-                 # Update title (remove playing prefix)
-                 self._update_display_title()
-
-                 # --- Schedule Next Action ---
-                 # Use root.after to handle next song/loop action in the main loop
-                 # This prevents modifying state directly within the check function
-                 if hasattr(self, 'root') and self.root.winfo_exists():
-                      self.root.after(50, self.handle_song_end_action) # Short delay
-
-            # Handle unexpected mixer stop
-            elif not pygame.mixer.get_init():
-                 print("Mixer stopped unexpectedly.")
-                 self.stop() # Try to stop cleanly
-
-        except pygame.error as e:
-             print(f"Pygame error during end check: {e}")
-             self.has_error=True; self._update_display_title(); self.stop()
-        except Exception as e:
-             print(f"Error during end check: {e}")
-             traceback.print_exc()
-             self.has_error=True; self._update_display_title(); self.stop()
+        if self.engine.check_end(): # "ended" event updates the widgets
+            # Handle the next song/loop action in the main loop, shortly
+            self.root.after(50, self.handle_song_end_action)
 
     def handle_song_end_action(self):
-        """Determines what action to take after a song finishes based on loop/mix state."""
+        """Replays, advances (loop/mix/next in sequence) or finishes the tracklist after a song ended."""
         # Ensure runs on main thread and window exists
         if not (hasattr(self, 'root') and self.root.winfo_exists()):
             return
-
-        theme = self.themes[self.current_theme_name]
-        spine_color = theme['plot_spine']
-
-        # --- Loop One ---
-        if self.loop_state == 2: # Loop One
-             print("Looping current song.")
-             # Reset UI for replay
-             if self.song_slider and self.song_slider.winfo_exists(): self.song_slider.set(0);
-             if self.current_time_label and self.current_time_label.winfo_exists(): self.current_time_label.configure(text="00:00");
-             # Just call play_music again for the current index
-             self.play_music()
-
-        # --- Loop All ---
-        elif self.loop_state == 1: # Loop All
-             print("Looping all - playing next.")
-             # Call next_song with auto_advance flag
-             self.next_song(auto_advance=True)
-
-        # --- Mix / Shuffle ---
-        elif self.shuffle_state:
-             print("Mix on - playing random.")
-             self.play_random_song(auto_advance=True)
-
-        # --- No Loop / End of Playlist ---
-        else: # loop_state == 0 and not shuffle_state
-             # Check if it was the last song in the list
-             if self.current_song_index >= len(self.songs_list) - 1:
-                 print("End of tracklist reached.")
-                 # Keep the last song's info displayed but reset playback state
-                 last_song_name = os.path.basename(self.current_song) if self.current_song else "TRACKLIST END"
-                 self.stop() # Ensure stopped state
-                 # Reset position variables for potential future play
-                 self.stopped_position = 0.0
-                 self.song_time = 0.0
-                 # Optionally reset index to 0 or keep it at the end
-                 self.current_song_index = 0 # Reset to start for next play action
-                 if self.songs_list: self.select_song(self.current_song_index) # Select first song
-
-                 # Reset UI elements to initial state
-                 if self.song_slider and self.song_slider.winfo_exists(): self.song_slider.set(0);
-                 if self.current_time_label and self.current_time_label.winfo_exists(): self.current_time_label.configure(text="00:00");
-                 self.draw_waveform_position_indicator(0) # Indicator to start
-                 if self.fig_wave and self.fig_wave.canvas:
-                     try: self.fig_wave.canvas.draw_idle()
-                     except Exception: pass
-                 self.draw_initial_placeholder(self.ax_osc, self.fig_osc, spine_color,"") # Clear osc
-                 self._update_display_title(base_title=last_song_name) # Show last song title (not playing)
-                 if self.play_pause_button and self.play_pause_button.winfo_exists(): self.play_pause_button.configure(text="▶") # Show play symbol
-
-             else: # Not the last song, play next in sequence
-                 print("Playing next song in sequence.")
-                 self.next_song(auto_advance=True)
-
-
-    def play_random_song(self, auto_advance=False):
-        """Plays a random song from the list, avoiding immediate repeat if possible."""
-        if not self.songs_list:
-            self.stop() # Stop if playlist became empty
-            return
-
-        # Handle state reset if auto-advancing
-        if not auto_advance:
-            self.stop()
-        else:
-             # Reset state without explicit stop() call
-             self.playing_state = False; self.paused = False; self.thread_running = False;
-             self.abort_waveform_generation(); # Abort previous gen
-             self.stopped_position = 0.0; self.song_time = 0.0;
-             print("Auto-advancing to random song.")
-
-        if len(self.songs_list) > 1:
-             # Create list of possible indices (all except current)
-             possible_indices = [i for i in range(len(self.songs_list)) if i != self.current_song_index]
-             # If list had only one song, possible_indices will be empty. Fallback to full list.
-             if not possible_indices:
-                 possible_indices = list(range(len(self.songs_list)))
-             # Choose a random index from the possibilities
-             self.current_song_index = random.choice(possible_indices)
-        elif len(self.songs_list) == 1:
-            # Only one song, just play it
-            self.current_song_index = 0
-        else:
-            # Should not happen if initial check passed, but handle defensively
-            self.clear_playlist() # Clear everything if list is somehow invalid
-            return
-
-        # Play the chosen song
-        self.play_music()
+        self.has_error = False
+        self.engine.advance_after_end()
 
 
     def abort_waveform_generation(self):
-        """Signals the waveform generation thread to stop."""
-        if self.waveform_thread and self.waveform_thread.is_alive():
-            if not self.waveform_abort_flag.is_set():
-                 print(f"Signalling waveform thread to abort...")
-                 self.waveform_abort_flag.set() # Set the event flag
+        """Cancels the waveform decode task (skipped if still queued, stopped at the next block if running)."""
+        if self.waveform_token is not None:
+            if not self.waveform_token.cancelled:
+                 log.debug("Cancelling waveform generation...")
+                 self.waveform_token.cancel()
+                 self.waveform_token = None
                  # Update UI immediately if it was in generating state
                  if self.is_generating_waveform:
                       self.is_generating_waveform = False
@@ -2702,22 +5625,156 @@ class MN1MusicPlayer:
                           except Exception: pass # Ignore if root is gone
 
 
+    # --- Prefetch ---
+
+    def prefetch_upcoming_track(self):
+        """Decodes the next track into the decoded audio cache on a background thread."""
+        next_index = self.engine.upcoming_index()
+        if next_index is None:
+            return
+        next_path = self.songs_list[next_index]
+        if next_path == self.current_song or self.decoded_cache.contains(next_path):
+            return
+        if self.prefetch_token is not None:
+            return # One prefetch at a time; the next track change will try again
+
+        self.prefetch_token = self.tasks.submit(self._prefetch_background, next_path, priority=TASK_PRIORITY_PREFETCH,
+                                                name="prefetch", on_done=self._on_prefetch_done)
+
+    def _prefetch_background(self, abort_flag, song_path):
+        """Executor task that decodes a track into the cache only."""
+        try:
+            # Only prefetch in the default layout, into memory the budget still has free
+            needed = -(-sf.info(song_path).frames // self.osc_downsample_factor) * np.dtype(np.float64).itemsize
+            if not self.memory.fits(needed):
+                log.debug("Prefetch skipped %s: over the memory budget", os.path.basename(song_path))
+                return
+            result = decode_waveform_data(song_path, abort_flag, self.osc_downsample_factor)
+            if result is not None and not abort_flag.is_set():
+                self.decoded_cache.put(song_path, *result)
+                self._store_thumbnail_peaks(song_path, result[0])
+                log.debug("Prefetched %s", os.path.basename(song_path))
+        except Exception as e:
+            # Prefetch failures are not user-visible; the foreground decode will report them
+            log.debug("Prefetch skipped %s: %s", os.path.basename(song_path), e)
+
+    def _on_prefetch_done(self, result):
+        self.prefetch_token = None
+
+    def abort_prefetch(self):
+        """Cancels the prefetch task (if any)."""
+        if self.prefetch_token is not None:
+            self.prefetch_token.cancel()
+            self.prefetch_token = None
+
+
+    # --- Memory Budget ---
+
+    def _update_image_bytes(self):
+        """
+        Re-estimates the bytes of rendered images (tracklist thumbnails and the two plot canvases)
+        into self.image_bytes. Tk thread only: call when a canvas resizes or the thumbnails change.
+        """
+        total = len(self.thumbnail_images) * THUMB_SIZE[0] * THUMB_SIZE[1] * 4 * 2 # RGBA bitmap + Tk photo image
+        for fig in (self.fig_wave, self.fig_osc):
+            if fig and fig.canvas:
+                width, height = fig.canvas.get_width_height()
+                total += width * height * 4 * 2 # Agg buffer + the Tk photo image it is blitted to
+        self.image_bytes = total
+
+    def _shared_cache_key(self):
+        """The cache entry whose arrays the player holds (counted under "track"), if any."""
+        return self.current_song if self.raw_sample_data is not None else None
+
+    def release_buffers(self, reason, images=False):
+        """
+        Drops what can be rebuilt after a user stop, the end of the tracklist or a minimize: the
+        current track's oscilloscope samples (decoded again, or served from the cache, on play or
+        restore) and, with images, the tracklist thumbnails. The waveform peaks stay so the waveform
+        remains drawn. The decoded cache is kept; enforce() trims it if the total is over budget.
+        """
+        before = self.memory.used_bytes()
+        self.abort_prefetch()
+        self.raw_sample_data = None
+        if images:
+            self.thumbnail_images.clear()
+            self._update_image_bytes()
+        self.memory.enforce()
+        log.info("Released %.1f MB of buffers (%s)", max(0, before - self.memory.used_bytes()) / (1024 * 1024), reason)
+
+    def _on_window_unmap(self, event):
+        # <Unmap> also reaches the root binding for every child widget that is hidden
+        if event.widget is not self.root or self.window_minimized:
+            return
+        self.window_minimized = True
+        self.release_buffers("minimized", images=True)
+
+    def _on_window_map(self, event):
+        if event.widget is not self.root or not self.window_minimized:
+            return
+        self.window_minimized = False
+        if self.tracklist_view:
+            self.tracklist_view.refresh() # Requests the visible rows' thumbnails again
+        if (self.playing_state or self.paused) and self.raw_sample_data is None and self.waveform_token is None:
+            self.trigger_waveform_generation(reload=True)
+
+
     # --- Closing ---
     def on_closing(self):
         """Handles cleanup when the application window is closed."""
-        print("Closing application...")
+        log.info("Closing application...")
+        self.stop_control_server()
+        if self.perf_json:
+            self.dump_perf_stats(path=self.perf_json)
+        self._cancel_pending_track_switch()
+        self.cancel_import()
+        if self.restore_work:
+            self.restore_work.cancel()
+            log.info("Session restore still in progress, keeping the previous session file.")
+        else:
+            self.save_session()
         # Stop background threads safely
-        self.thread_running = False # Signal update thread to stop
-        self.abort_waveform_generation() # Signal waveform thread to stop
+        self.stop_update_loop() # Cancel the pending position/visual tick
+        log.info("Update loop: %s ticks this session", self.update_wakeups)
+        self.abort_waveform_generation() # Cancel the waveform decode task
+        self.abort_prefetch() # Cancel the prefetch task
+        self.thumbnailer.close() # Cancel queued/running thumbnail tasks
+
+        cache_stats = self.decoded_cache.stats()
+        log.info("Decoded cache: %s entries, %.1f MB, hits=%s misses=%s evictions=%s",
+                 cache_stats['entries'], cache_stats['bytes'] / (1024 * 1024),
+                 cache_stats['hits'], cache_stats['misses'], cache_stats['evictions'])
+        memory_stats = self.memory.stats()
+        log.info("Memory budget: %.1f of %.0f MB in use, %s track(s) in a cheaper layout",
+                 memory_stats['used_bytes'] / (1024 * 1024), memory_stats['budget_bytes'] / (1024 * 1024),
+                 memory_stats['downgrades'])
+        self.decoded_cache.clear()
+        # Every task is cancelled by now; wait briefly for the workers before closing the index they use
+        self.tasks.close(timeout=0.3)
+        task_stats = self.tasks.stats()
+        log.info("Background tasks: completed=%s failed=%s skipped=%s peak queue=%s",
+                 task_stats['completed'], task_stats['failed'], task_stats['skipped'], task_stats['peak_queued'])
+        for name, timing in task_stats["tasks"].items():
+            log.info("  %s: %s runs, wait avg %.1f / max %.1f ms, run avg %.1f / max %.1f ms",
+                     name, timing['count'], timing['wait_avg_ms'], timing['wait_max_ms'],
+                     timing['run_avg_ms'], timing['run_max_ms'])
+        self.library.close()
+        self.save_profile() # After the workers have stopped, so their profiles are complete
 
         # Stop Pygame
         try:
-            if pygame.mixer.get_init():
-                pygame.mixer.music.stop()
+            if self.dsp_chain is not None:
+                dsp_stats = self.dsp_chain.timing_stats()
+                if dsp_stats.get("blocks"):
+                    log.info("DSP: %s blocks, mean %.3f ms, p99 %.3f ms per %.1f ms block (%.1f%% of real time), underruns=%s",
+                             dsp_stats['blocks'], dsp_stats['mean_ms'], dsp_stats['p99_ms'], dsp_stats['budget_ms'],
+                             100 * dsp_stats['load'], self.audio_output.underruns)
+            if self.audio_output.is_ready():
+                self.audio_output.close()
                 pygame.mixer.quit()
-                print("Pygame stopped.")
+                log.info("Pygame stopped.")
         except Exception as e:
-            print(f"Error quitting pygame: {e}")
+            log.warning("Error quitting pygame: %s", e)
 
         # Close Matplotlib figures to release resources
         try:
@@ -2727,31 +5784,68 @@ class MN1MusicPlayer:
             if self.fig_osc: plt.close(self.fig_osc)
         except Exception: pass
 
-        # Wait briefly for threads to exit (optional, daemon threads shouldn't block exit)
-        if self.waveform_thread and self.waveform_thread.is_alive():
-            print("Waiting for waveform thread to join...")
-            self.waveform_thread.join(timeout=0.3) # Short timeout
-            if self.waveform_thread.is_alive(): print("Waveform thread did not join cleanly.")
-
-        if self.update_thread and self.update_thread.is_alive():
-             print("Waiting for update thread to join...")
-             self.update_thread.join(timeout=0.3) # Short timeout
-             if self.update_thread.is_alive(): print("Update thread did not join cleanly.")
-
-
         # Destroy the Tkinter window
         if hasattr(self, 'root') and self.root:
             try:
                 if self.root.winfo_exists():
                      self.root.destroy()
-                     print("Application closed.")
+                     log.info("Application closed.")
                 else:
-                     print("Root window already destroyed.")
+                     log.debug("Root window already destroyed.")
             except Exception as e:
-                print(f"Error destroying root window: {e}")
+                log.warning("Error destroying root window: %s", e)
 
 # --- Main Execution Block ---
 if __name__ == "__main__":
+    # --- Command Line Options ---
+    parser = argparse.ArgumentParser(description="MN-1 music player")
+    parser.add_argument("--cache-mb", type=float, default=DECODED_CACHE_BUDGET_MB,
+                        help=f"Memory budget in MB for decoded audio of recent/prefetched tracks (default: {DECODED_CACHE_BUDGET_MB})")
+    parser.add_argument("--memory-mb", type=float, default=MEMORY_BUDGET_MB,
+                        help=f"Total memory budget in MB for track samples, the decoded cache and images (default: {MEMORY_BUDGET_MB})")
+    parser.add_argument("--native-rate", action="store_true",
+                        help="Re-open the audio output at each track's native sample rate instead of resampling")
+    parser.add_argument("--eq", type=str, default=None,
+                        help=f"Comma separated EQ band gains in dB for {', '.join(str(f) for f in EQ_BAND_FREQUENCIES)} Hz (enables the DSP output)")
+    parser.add_argument("--preamp", type=float, default=None,
+                        help="Pre-amp gain in dB (enables the DSP output)")
+    parser.add_argument("--replaygain", action="store_true",
+                        help="Apply ReplayGain track gain from tags (enables the DSP output)")
+    parser.add_argument("--no-session", action="store_true",
+                        help=f"Don't restore/save the tracklist and player state ({SESSION_PATH})")
+    parser.add_argument("--control-socket", nargs="?", const=CONTROL_SOCKET_PATH, default=None, metavar="PATH",
+                        help=f"Accept JSON commands on a local Unix socket (default path: {CONTROL_SOCKET_PATH})")
+    parser.add_argument("--perf", action="store_true",
+                        help="Time the hot paths from startup (F2 shows the timing overlay, F3 saves it as JSON)")
+    parser.add_argument("--perf-json", type=str, default=None, metavar="PATH",
+                        help="Write the hot-path timings to this JSON file on exit (implies --perf)")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"Record cProfile stats (Tk thread and task workers) and a tracemalloc snapshot per track load; "
+                             f"saved to {PROFILE_DIR} on exit. F4 pauses/resumes recording")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default=LOG_DEFAULT_LEVEL,
+                        help=f"Console/log file verbosity (default: {LOG_DEFAULT_LEVEL}; info shows lifecycle events, debug every action)")
+    parser.add_argument("--log-file", type=str, default=None, metavar="PATH",
+                        help="Also write the log to this file")
+    parser.add_argument("--library-db", type=str, default=LIBRARY_DB_PATH,
+                        help=f"SQLite file for the track metadata index (default: {LIBRARY_DB_PATH}, ':memory:' to disable persistence)")
+    args = parser.parse_args()
+    log_listener = setup_logging(args.log_level, args.log_file)
+    if args.profile:
+        PROFILER.start() # Before the UI is built, so startup is included
+    PERF.enabled = args.perf or args.perf_json is not None
+
+    # --- DSP Chain (only built when a DSP option is given) ---
+    dsp_chain = None
+    if args.eq is not None or args.preamp is not None or args.replaygain:
+        dsp_chain = DSPChain(replaygain=args.replaygain)
+        if args.eq is not None:
+            try:
+                dsp_chain.set_band_gains([float(g) for g in args.eq.split(",")])
+            except ValueError as e:
+                parser.error(f"--eq: {e}")
+        if args.preamp is not None:
+            dsp_chain.set_preamp_db(args.preamp)
+
     try:
         # --- Set DPI awareness on Windows (optional but recommended) ---
         if os.name == 'nt':
@@ -2764,7 +5858,7 @@ if __name__ == "__main__":
                     try: windll.user32.SetProcessDPIAware()
                     except AttributeError: pass # No DPI awareness setting possible
              except Exception as dpi_error:
-                 print(f"Could not set DPI awareness: {dpi_error}")
+                 log.warning("Could not set DPI awareness: %s", dpi_error)
 
         # --- Initialize Tkinter ---
         root = ctk.CTk()
@@ -2772,14 +5866,17 @@ if __name__ == "__main__":
         # root.minsize(600, 450)
 
         # --- Create and Run Player ---
-        player = MN1MusicPlayer (root)
+        player = MN1MusicPlayer (root, decoded_cache_mb=args.cache_mb, native_rate_output=args.native_rate,
+                                 dsp_chain=dsp_chain, library=LibraryIndex(args.library_db),
+                                 session_path=None if args.no_session else SESSION_PATH,
+                                 control_socket=args.control_socket, perf_json=args.perf_json,
+                                 memory_budget_mb=args.memory_mb)
         root.mainloop()
+        log_listener.stop() # Flush queued log records
 
     except Exception as main_error:
         # --- Fatal Error Handling ---
-        print("\n--- FATAL APPLICATION ERROR ---")
-        print(f"Error: {main_error}")
-        traceback.print_exc() # Print full traceback to console
+        log.critical("--- FATAL APPLICATION ERROR --- %s", main_error, exc_info=True) # Full traceback to the console/log file
 
         # Try to show a simple Tkinter error message box as a fallback
         try:
@@ -2793,4 +5890,5 @@ if __name__ == "__main__":
             pass # Ignore if even the fallback messagebox fails
 
         # Keep console open until user presses Enter
+        log_listener.stop() # Flush the traceback before waiting
         input("Press Enter to exit console.")
\ No newline at end of file
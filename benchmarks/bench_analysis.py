@@ -0,0 +1,176 @@
+"""
+Waveform/oscilloscope analysis benchmark with baseline regression checks.
+
+Generates deterministic WAV/FLAC/OGG fixtures (cached between runs) covering 1 min to
+3 h, mono/stereo/5.1 and 44.1/48/96 kHz, runs decode_waveform_data (the path behind
+the waveform and oscilloscope) on each in a fresh process and records wall time,
+frames decoded per second and peak RSS. Results are compared with the stored
+baseline; a case that is slower or uses more memory than the tolerance allows is
+reported as a REGRESSION and the script exits non-zero.
+
+Baselines are machine specific: record one on the machine you compare on.
+
+    python benchmarks/bench_analysis.py                    # quick suite (up to 10 min files)
+    python benchmarks/bench_analysis.py --suite full       # adds the 1 h and 3 h fixtures (several GB of RAM/disk)
+    python benchmarks/bench_analysis.py --update-baseline  # store this run as the new baseline
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from common import load_mn1, write_test_tone
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "analysis.json")
+FIXTURE_DIR = os.path.join(tempfile.gettempdir(), "mn1-bench-fixtures")
+RSS_NOISE_MB = 8 # Allowed RSS growth difference on top of the tolerance (allocator noise on small cases)
+
+# (suite, format, minutes, sample rate, channels)
+CASES = [
+    ("quick", "wav", 1, 44100, 2),
+    ("quick", "flac", 1, 44100, 2),
+    ("quick", "ogg", 1, 44100, 2),
+    ("quick", "flac", 1, 48000, 1),
+    ("quick", "wav", 1, 48000, 6),
+    ("quick", "flac", 1, 96000, 2),
+    ("quick", "flac", 10, 44100, 2),
+    ("quick", "wav", 10, 96000, 2),
+    ("quick", "ogg", 10, 48000, 2),
+    ("full", "flac", 60, 44100, 2),
+    ("full", "flac", 60, 48000, 6),
+    ("full", "wav", 60, 96000, 2),
+    ("full", "flac", 180, 44100, 1),
+    ("full", "wav", 180, 44100, 2),
+]
+
+
+def case_id(fmt, minutes, rate, channels):
+    return f"{fmt}-{minutes}m-{rate / 1000:g}k-{channels}ch"
+
+
+def fixture_path(fixture_dir, fmt, minutes, rate, channels):
+    """Generates the fixture on first use; the seed depends only on the parameters, so files are reproducible."""
+    path = os.path.join(fixture_dir, f"{case_id(fmt, minutes, rate, channels)}.{fmt}")
+    if not os.path.exists(path):
+        os.makedirs(fixture_dir, exist_ok=True)
+        print(f"  generating {os.path.basename(path)} ...", flush=True)
+        partial = path + ".partial." + fmt # Keep the extension: soundfile picks the format from it
+        write_test_tone(partial, minutes * 60, sample_rate=rate, channels=channels, seed=minutes * 1000 + channels)
+        os.replace(partial, path)
+    return path
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024 # Bytes on macOS, KiB elsewhere
+
+
+def run_case(path):
+    """Child process: one analysis run; prints the measurements as JSON."""
+    mn1 = load_mn1()
+    import soundfile as sf
+    info = sf.info(path)
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    result = mn1.decode_waveform_data(path, threading.Event(), 5) # Same downsample factor as the player
+    wall = time.perf_counter() - start
+    peaks = result[0]
+    print(json.dumps({"frames": info.frames, "wall_s": wall, "frames_per_s": info.frames / wall,
+                      "peak_rss_mb": peak_rss_mb(), "rss_growth_mb": peak_rss_mb() - rss_before,
+                      "peak_points": len(peaks)}))
+
+
+def measure(path, repeat):
+    """Best wall time / highest RSS over `repeat` fresh processes (peak RSS is per process)."""
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-case", path],
+                             capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if out.returncode != 0:
+            raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else f"exit {out.returncode}")
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    best = min(runs, key=lambda r: r["wall_s"])
+    best["peak_rss_mb"] = max(r["peak_rss_mb"] for r in runs)
+    best["rss_growth_mb"] = max(r["rss_growth_mb"] for r in runs)
+    return best
+
+
+def compare(result, baseline, time_tolerance, rss_tolerance):
+    """Returns the regression messages for one case (empty if within tolerance or no baseline)."""
+    if not baseline:
+        return []
+    problems = []
+    if result["wall_s"] > baseline["wall_s"] * (1 + time_tolerance):
+        problems.append(f"wall {result['wall_s']:.2f}s vs {baseline['wall_s']:.2f}s baseline")
+    # Memory is judged on the growth during analysis; the import footprint would dilute it
+    if result["rss_growth_mb"] > baseline["rss_growth_mb"] * (1 + rss_tolerance) + RSS_NOISE_MB:
+        problems.append(f"RSS growth {result['rss_growth_mb']:.0f} MB vs {baseline['rss_growth_mb']:.0f} MB baseline")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--suite", choices=("quick", "full"), default="quick")
+    parser.add_argument("--only", nargs="+", metavar="CASE", help="Run only these case ids (e.g. flac-1m-44.1k-2ch)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the fastest counts")
+    parser.add_argument("--fixtures", default=FIXTURE_DIR, help=f"Fixture cache directory (default: {FIXTURE_DIR})")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="Store this run's results as the baseline")
+    parser.add_argument("--time-tolerance", type=float, default=0.25, help="Allowed wall time increase (fraction)")
+    parser.add_argument("--rss-tolerance", type=float, default=0.15, help="Allowed RSS growth increase (fraction)")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        run_case(args.run_case)
+        return
+
+    try:
+        with open(args.baseline, encoding="utf-8") as f:
+            baselines = json.load(f)["cases"]
+    except (OSError, ValueError, KeyError):
+        baselines = {}
+        if not args.update_baseline:
+            print(f"No baseline at {args.baseline}; run with --update-baseline to record one.")
+
+    suites = ("quick",) if args.suite == "quick" else ("quick", "full")
+    cases = [c for c in CASES if c[0] in suites and (not args.only or case_id(*c[1:]) in args.only)]
+    results, regressions = {}, []
+    print(f"{'case':<22}{'wall':>9}{'Mframes/s':>11}{'peak RSS':>10}{'growth':>9}  vs baseline")
+    for _, fmt, minutes, rate, channels in cases:
+        name = case_id(fmt, minutes, rate, channels)
+        try:
+            result = measure(fixture_path(args.fixtures, fmt, minutes, rate, channels), args.repeat)
+        except (RuntimeError, OSError) as e:
+            print(f"{name:<22} FAILED: {e}")
+            regressions.append(f"{name}: failed ({e})")
+            continue
+        results[name] = result
+        baseline = baselines.get(name)
+        problems = compare(result, baseline, args.time_tolerance, args.rss_tolerance)
+        verdict = "REGRESSION: " + "; ".join(problems) if problems else (
+            f"{100 * (result['wall_s'] / baseline['wall_s'] - 1):+.0f}% time" if baseline else "no baseline")
+        print(f"{name:<22}{result['wall_s']:>8.2f}s{result['frames_per_s'] / 1e6:>11.1f}"
+              f"{result['peak_rss_mb']:>8.0f}MB{result['rss_growth_mb']:>7.0f}MB  {verdict}", flush=True)
+        regressions.extend(f"{name}: {p}" for p in problems)
+
+    if args.update_baseline:
+        baselines.update(results)
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "platform": sys.platform, "cases": baselines}, f, indent=1, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} REGRESSION(S):")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
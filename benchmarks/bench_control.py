@@ -0,0 +1,112 @@
+"""
+Round-trip latency of the control socket: a client sends newline-delimited JSON
+commands and waits for each reply. "status" is answered on the server thread from
+the published snapshot; play/pause/seek/next are handed to the UI thread. Here the
+UI thread is the main thread waiting on the server's wake-up socket (what Tk's file
+handler does), driving a PlayerEngine on a NullAudioOutput, so no display or sound
+device is needed. --ui-busy-ms makes the UI thread do that much work per wake-up,
+like a redraw or an import slice in progress.
+
+Usage:
+    python bench_control.py [--requests 2000] [--ui-busy-ms 0 8]
+"""
+import argparse
+import json
+import os
+import random
+import select
+import socket
+import tempfile
+import threading
+import time
+
+from common import load_mn1
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def make_handler(mn1, engine, server):
+    def publish():
+        server.publish({"state": "playing" if engine.playing_state else "paused" if engine.paused else "stopped",
+                        "track": engine.current_song, "index": engine.current_song_index,
+                        "position": engine.position(), "length": engine.song_length,
+                        "tracks": len(engine.tracks)})
+
+    def handle(request):
+        cmd = request["cmd"]
+        if cmd == "play":
+            engine.play_index(request.get("index", 0))
+        elif cmd == "pause":
+            engine.pause()
+        elif cmd == "seek":
+            engine.seek(float(request["position"]))
+        elif cmd == "next":
+            engine.play_index(engine.next_track_index())
+        elif cmd == "enqueue":
+            engine.tracks.extend(request["paths"])
+        publish()
+        return server.status()
+    return handle, publish
+
+
+def run_client(path, commands, timings, errors):
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.connect(path)
+        reader = sock.makefile("rb")
+        for request in commands:
+            start = time.perf_counter()
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            reply = json.loads(reader.readline())
+            timings[request["cmd"]].append(time.perf_counter() - start)
+            if not reply["ok"]:
+                errors.append(reply["error"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--ui-busy-ms", type=float, nargs="+", default=[0.0, 8.0])
+    args = parser.parse_args()
+
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    mn1 = load_mn1()
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        for busy_ms in args.ui_busy_ms:
+            lengths = {f"/music/track_{i:03d}.flac": 240.0 for i in range(100)}
+            engine = mn1.PlayerEngine(mn1.NullAudioOutput(track_length=lengths.get), list(lengths), track_length=lengths.get)
+            server = mn1.ControlServer(os.path.join(tmp, f"control_{busy_ms}.sock"), None)
+            server.handler, publish = make_handler(mn1, engine, server)
+            server.start()
+            publish()
+
+            commands = [{"cmd": "play", "index": 0}]
+            for _ in range(args.requests):
+                commands.append(rng.choice([{"cmd": "status"}, {"cmd": "status"}, {"cmd": "pause"}, {"cmd": "play"},
+                                            {"cmd": "seek", "position": rng.uniform(0, 200)}, {"cmd": "next"}]))
+            timings = {cmd: [] for cmd in mn1.CONTROL_COMMANDS}
+            errors = []
+            client = threading.Thread(target=run_client, args=(server.path, commands, timings, errors))
+            client.start()
+            while client.is_alive():
+                if select.select([server], [], [], 0.05)[0]:
+                    if busy_ms:
+                        time.sleep(busy_ms / 1000.0) # Stands in for whatever the UI thread was doing
+                    server.process_pending()
+            client.join()
+            server.close()
+
+            print(f"UI thread busy {busy_ms:.0f} ms per wake-up ({server.handled} commands, "
+                  f"{server.status_queries} status queries, {len(errors)} errors)")
+            for cmd, values in timings.items():
+                if values:
+                    values_us = [t * 1e6 for t in values]
+                    print(f"  {cmd:<8}: p50 {percentile(values_us, 50):8.1f} us   p99 {percentile(values_us, 99):8.1f} us   "
+                          f"max {max(values_us):8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Per-block CPU cost of the DSP chain (10-band EQ + pre-amp + track gain).
+
+Feeds synthetic float32 blocks through DSPChain.process() the way the DSP stream
+thread does and reports time per block against the block's real-time duration.
+A load well below 100% leaves headroom for decoding and the UI on a slow machine.
+
+    python benchmarks/bench_dsp.py [--blocks 2000] [--block-frames 4096]
+"""
+import argparse
+
+import numpy as np
+
+from common import load_mn1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--blocks", type=int, default=2000)
+    parser.add_argument("--block-frames", type=int, default=None, help="Defaults to DSP_BLOCK_FRAMES")
+    parser.add_argument("--rates", type=int, nargs="+", default=[44100, 48000, 96000])
+    args = parser.parse_args()
+
+    mn1 = load_mn1()
+    block_frames = args.block_frames or mn1.DSP_BLOCK_FRAMES
+    rng = np.random.default_rng(0)
+    gains = rng.uniform(-6.0, 6.0, len(mn1.EQ_BAND_FREQUENCIES)) # Every band active
+    if mn1.sosfilt is None:
+        print("scipy not installed: EQ bands are bypassed, only gain/clipping is measured.")
+
+    for rate in args.rates:
+        for channels in (1, 2):
+            dsp = mn1.DSPChain(sample_rate=rate, channels=channels)
+            dsp.set_band_gains(gains)
+            dsp.set_preamp_db(-3.0)
+            dsp.set_track_gain_db(-6.5)
+            source = (0.5 * rng.standard_normal((block_frames, channels))).astype(np.float32)
+            block = np.empty_like(source)
+            for _ in range(args.blocks):
+                np.copyto(block, source) # Stands in for the decoder filling the preallocated buffer
+                dsp.process(block)
+            stats = dsp.timing_stats()
+            print(f"{rate:6d} Hz {channels}ch {block_frames} frames: mean {stats['mean_ms']:.3f} ms, "
+                  f"p99 {stats['p99_ms']:.3f} ms, max {stats['max_ms']:.3f} ms "
+                  f"of {stats['budget_ms']:.1f} ms budget -> {100 * stats['load']:.2f}% real-time load")
+
+
+if __name__ == "__main__":
+    main()
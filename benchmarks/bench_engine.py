@@ -0,0 +1,109 @@
+"""
+Times PlayerEngine transitions headlessly on a NullAudioOutput (no display, no sound
+device): play, pause/resume, seek and next, plus a scripted-clock run through the
+tracklist that checks end-of-track handling in each loop/mix mode.
+
+Usage:
+    python bench_engine.py [--tracks 1000] [--ops 5000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+from common import load_mn1
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def report(label, timings):
+    timings_us = [t * 1e6 for t in timings]
+    print(f"{label:<14}: mean {sum(timings_us) / len(timings_us):8.1f} us   "
+          f"p50 {percentile(timings_us, 50):8.1f} us   p99 {percentile(timings_us, 99):8.1f} us")
+
+
+def make_engine(mn1, tracks, clock):
+    lengths = {f"/music/track_{i:05d}.flac": 180.0 + i % 60 for i in range(tracks)}
+    engine = mn1.PlayerEngine(mn1.NullAudioOutput(clock=clock, track_length=lengths.get), track_length=lengths.get)
+    for path in lengths:
+        engine.tracks.append(path)
+    return engine
+
+
+def bench_transitions(mn1, args, rng):
+    engine = make_engine(mn1, args.tracks, time.monotonic)
+    events = []
+    engine.subscribe(lambda event, detail: events.append(event))
+    ops = {
+        "play_index": lambda: engine.play_index(rng.randrange(args.tracks)),
+        "toggle": lambda: engine.toggle_play_pause(),
+        "seek": lambda: engine.seek(rng.uniform(0, engine.song_length)),
+        "next": lambda: engine.play_index(engine.next_track_index()),
+        "position": lambda: engine.update_position(),
+    }
+    timings = {name: [] for name in ops}
+    engine.play_index(0)
+    for i in range(args.ops):
+        if i == args.ops // 2:
+            engine.set_shuffle(True) # Second half with MIX on
+        name = rng.choice(list(ops))
+        start = time.perf_counter()
+        ops[name]()
+        timings[name].append(time.perf_counter() - start)
+    return timings, len(events)
+
+
+def check_end_handling(mn1, args):
+    """Plays the whole tracklist on a scripted clock in each mode; returns (label, ok) per mode."""
+    results = []
+    for loop_state, shuffle, expected in ((0, False, "stops after the last track"), (1, False, "wraps to the first"),
+                                          (2, False, "repeats one track"), (0, True, "visits every track")):
+        now = [0.0]
+        engine = make_engine(mn1, min(args.tracks, 50), lambda: now[0])
+        engine.loop_state = loop_state
+        engine.set_shuffle(shuffle)
+        played, finished = [], []
+        engine.subscribe(lambda event, detail: played.append(engine.current_song_index) if event == "track" else
+                         finished.append(detail) if event == "finished" else None)
+        engine.play_index(0)
+        for _ in range(len(engine.tracks) + 5):
+            now[0] += 10_000 # Far past the end of any track
+            engine.update_position()
+            if engine.end_pending() and engine.check_end():
+                engine.advance_after_end()
+            if finished:
+                break
+        count = len(engine.tracks)
+        ok = {(0, False): played == list(range(count)) and len(finished) == 1,
+              (1, False): played[:count + 1] == list(range(count)) + [0],
+              (2, False): set(played) == {0},
+              (0, True): set(played[:count]) == set(range(count))}[(loop_state, shuffle)]
+        results.append((f"loop={loop_state} mix={'on ' if shuffle else 'off'}: {expected:<26}", ok))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=1000)
+    parser.add_argument("--ops", type=int, default=5000)
+    args = parser.parse_args()
+
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    mn1 = load_mn1()
+    rng = random.Random(0)
+    timings, events = bench_transitions(mn1, args, rng)
+    results = check_end_handling(mn1, args)
+    print(f"{args.tracks} tracks, {args.ops} operations, {events} events delivered")
+    for name, values in timings.items():
+        report(name, values)
+    for label, ok in results:
+        print(f"{label} {'ok' if ok else 'FAIL'}")
+    sys.exit(0 if all(ok for _, ok in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
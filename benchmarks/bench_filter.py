@@ -0,0 +1,51 @@
+"""
+Measures tracklist filter latency per keystroke on a synthetic 100k-track index
+(names + tags), plus the incremental add/remove cost of TrackSearchIndex.
+
+Usage:
+    python bench_filter.py [--tracks 100000] [--query "mo deep blue"]
+"""
+import argparse
+import random
+import string
+import time
+
+from common import load_mn1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=100000)
+    parser.add_argument("--query", default=None, help="Typed one character at a time (default: built from the data)")
+    args = parser.parse_args()
+
+    mn1 = load_mn1()
+    rng = random.Random(0)
+    words = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9))) for _ in range(5000)]
+    index = mn1.TrackSearchIndex()
+
+    start = time.perf_counter()
+    for track_id in range(1, args.tracks + 1):
+        name = f"{track_id:05d} - " + " ".join(rng.choice(words) for _ in range(3)) + ".flac"
+        index.add(track_id, name, {"artist": rng.choice(words), "album": rng.choice(words)})
+    elapsed = time.perf_counter() - start
+    print(f"index build : {args.tracks} tracks in {elapsed:.2f}s ({elapsed / args.tracks * 1e6:.1f} us/track)")
+
+    query = args.query or f"{words[11][:4]} {words[42]}"
+    print(f"typing '{query}':")
+    for k in range(1, len(query) + 1):
+        start = time.perf_counter()
+        result = index.search(query[:k])
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"  {query[:k]!r:<24} {len(result or []):7d} matches  {elapsed_ms:7.2f} ms")
+
+    start = time.perf_counter()
+    removed = rng.sample(range(1, args.tracks + 1), min(1000, args.tracks))
+    for track_id in removed:
+        index.remove(track_id)
+    elapsed = time.perf_counter() - start
+    print(f"remove      : {len(removed)} tracks, {elapsed / len(removed) * 1e6:.1f} us/track")
+
+
+if __name__ == "__main__":
+    main()
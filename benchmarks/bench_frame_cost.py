@@ -0,0 +1,246 @@
+"""
+Per-frame cost of the playback update loop: update_song_position and the two visuals it
+drives (update_oscilloscope, draw_waveform_position_indicator), plus the whole frame
+including the canvas redraws it queues.
+
+The player runs against a stub pygame.mixer whose music plays silently on a scripted
+clock: each frame advances the clock by UPDATE_INTERVAL_MS and ticks the update loop once,
+for N simulated seconds of playback with periodic seeks and track changes (their own
+work, waveform decodes included, is settled between frames and not counted). No sound
+device is needed, and the numbers don't depend on how fast the machine plays audio.
+
+Hosts:
+    offscreen  (default without $DISPLAY) a Tcl interpreter without Tk. The widgets aren't
+               built (the update path skips absent widgets) and the figures render on Agg
+               canvases: the Python + Matplotlib work, without the Tk blit.
+    tk         (default with a display, e.g. under xvfb-run) the full UI.
+
+Usage:
+    python benchmarks/bench_frame_cost.py [--seconds 120] [--seek-every 3] [--switch-every 20]
+    xvfb-run python benchmarks/bench_frame_cost.py --host tk --json frames.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tkinter
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+if not os.environ.get("DISPLAY") and sys.platform.startswith("linux"):
+    os.environ.setdefault("MPLBACKEND", "Agg") # Before MN-1 imports pyplot
+
+from common import load_mn1, write_test_tone
+
+METHODS = ("update_song_position", "update_oscilloscope", "draw_waveform_position_indicator")
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class ScriptedClock:
+    """Simulated time in seconds; only advance() moves it."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeMixer:
+    """Stands in for pygame.mixer: no device, `music` plays silently on the scripted clock."""
+    def __init__(self, mn1, clock):
+        import soundfile as sf
+        self.music = mn1.NullAudioOutput(clock, track_length=lambda path: sf.info(path).duration)
+        self._config = None
+
+    def init(self, frequency=44100, size=-16, channels=2, buffer=512, **kwargs):
+        self._config = (int(frequency), size, channels)
+
+    def pre_init(self, *args, **kwargs): pass
+    def get_init(self): return self._config
+
+    def quit(self):
+        self.music.stop()
+        self._config = None
+
+
+class OffscreenRoot(tkinter.Tk):
+    """A Tcl interpreter without Tk: after()/update() work, window manager calls are ignored."""
+    def __init__(self):
+        super().__init__(useTk=False)
+        tkinter._default_root = self # Tk variables (ctk.StringVar) look for a default root
+
+    def title(self, *args): return "MN-1"
+    def geometry(self, *args): pass
+    def resizable(self, *args): pass
+    def protocol(self, *args): pass
+    def bind(self, *args): pass
+    def configure(self, **kwargs): pass
+    def winfo_exists(self): return True
+
+    def destroy(self):
+        tkinter.Misc.destroy(self) # No Tk window to destroy; drops the registered callbacks
+        tkinter._default_root = None
+
+
+def offscreen_player_class(mn1):
+    """MN1MusicPlayer without widgets; its figures keep the Agg canvases pyplot gave them."""
+    class OffscreenPlayer(mn1.MN1MusicPlayer):
+        def __getattr__(self, name):
+            # Only reached for attributes the skipped builders would have set: every widget
+            # access on the update path is guarded with `widget and widget.winfo_exists()`
+            if name.endswith(("_frame", "_button", "_label", "_slider", "_entry", "_view")):
+                return None
+            raise AttributeError(name)
+
+        def create_frames(self): pass
+        def create_player_area(self): pass
+        def create_waveform_display(self): pass
+        def create_oscilloscope_display(self): pass
+        def create_controls(self): pass
+        def create_tracklist_area(self): pass
+        def select_song(self, index): pass # Tracklist highlight only
+    return OffscreenPlayer
+
+
+class FrameRecorder:
+    """Wraps the measured player methods; timings are kept per frame, not for calls between frames."""
+    def __init__(self, player):
+        self.frames = [] # {"frame": s, method: s, ...} per frame
+        self._current = None
+        for name in METHODS:
+            setattr(player, name, self._wrap(name, getattr(player, name)))
+
+    def _wrap(self, name, method):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                if self._current is not None:
+                    self._current[name] = self._current.get(name, 0.0) + time.perf_counter() - start
+        return timed
+
+    def frame(self, root, player):
+        """One update loop tick plus the idle redraws it queued (Tk draws the canvases there)."""
+        self._current = {}
+        start = time.perf_counter()
+        player.update_song_position()
+        root.update_idletasks()
+        self._current["frame"] = time.perf_counter() - start
+        self.frames.append(self._current)
+        self._current = None
+
+    def summary(self):
+        rows = {}
+        for name in ("frame",) + METHODS:
+            samples_ms = [f[name] * 1000 for f in self.frames if name in f]
+            if samples_ms:
+                rows[name] = {"calls": len(samples_ms), "mean_ms": sum(samples_ms) / len(samples_ms),
+                              "max_ms": max(samples_ms),
+                              **{f"p{p}_ms": percentile(samples_ms, p) for p in PERCENTILES}}
+        return rows
+
+
+def settle(root, player, timeout=30.0):
+    """Pumps the event loop until seeks, track switches and the waveform decode have finished."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        root.update()
+        busy = (player.is_seeking or player.is_loading or player.pending_track_switch is not None
+                or player.waveform_token is not None or player.engine.end_pending())
+        if not busy:
+            return True
+        time.sleep(0.002)
+    return False
+
+
+def build_player(mn1, host, library_path):
+    if host == "tk":
+        root = mn1.ctk.CTk()
+        player = mn1.MN1MusicPlayer(root, library=mn1.LibraryIndex(library_path), session_path=None)
+    else:
+        root = OffscreenRoot()
+        player = offscreen_player_class(mn1)(root, library=mn1.LibraryIndex(library_path), session_path=None)
+    # The harness ticks the loop on the scripted clock; root.after would tick it on the wall clock
+    def start_update_loop():
+        player.update_loop_running = player.playing_state and not player.paused
+    player.start_update_loop = start_update_loop
+    return root, player
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", choices=("offscreen", "tk"), default="tk" if os.environ.get("DISPLAY") else "offscreen")
+    parser.add_argument("--seconds", type=float, default=120.0, help="Simulated playback time")
+    parser.add_argument("--seek-every", type=float, default=3.0, help="Simulated seconds between random seeks (0: none)")
+    parser.add_argument("--switch-every", type=float, default=20.0, help="Simulated seconds between track changes (0: none)")
+    parser.add_argument("--tracks", type=int, default=3)
+    parser.add_argument("--track-seconds", type=float, default=45.0, help="Length of the generated tracks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the per-frame summary to this file")
+    args = parser.parse_args()
+
+    mn1 = load_mn1()
+    clock = ScriptedClock()
+    mn1.pygame.mixer = FakeMixer(mn1, clock) # MixerMusicOutput and the player only reach the device through this
+    rng = random.Random(args.seed)
+    frame_seconds = mn1.UPDATE_INTERVAL_MS / 1000.0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [write_test_tone(os.path.join(tmp, f"track_{i}.wav"), args.track_seconds, seed=i) for i in range(args.tracks)]
+        root, player = build_player(mn1, args.host, os.path.join(tmp, "library.sqlite3"))
+        for path in paths:
+            player._append_track(path)
+        player.engine.loop_state = 1 # Loop all: the run never runs out of tracks
+        player.play_selected_song_by_index(0)
+        settle(root, player)
+
+        recorder = FrameRecorder(player)
+        next_seek, next_switch = args.seek_every, args.switch_every
+        seeks = switches = 0
+        wall_start = time.perf_counter()
+        for _ in range(int(args.seconds / frame_seconds)):
+            clock.advance(frame_seconds)
+            if args.switch_every and clock.now >= next_switch:
+                next_switch += args.switch_every
+                switches += 1
+                player.next_song(immediate=True)
+                settle(root, player)
+            elif args.seek_every and clock.now >= next_seek and player.song_length > 0:
+                next_seek += args.seek_every
+                seeks += 1
+                player.seek_song(rng.uniform(0.0, player.song_length * 0.95))
+                settle(root, player)
+            if player.update_loop_running:
+                recorder.frame(root, player)
+            if player.engine.end_pending(): # Reached the end: let the loop-all transition run
+                settle(root, player)
+        wall = time.perf_counter() - wall_start
+
+        summary = recorder.summary()
+        print(f"host={args.host}  {args.seconds:g}s simulated, {len(recorder.frames)} frames, "
+              f"{seeks} seeks, {switches} track changes, {wall:.1f}s wall")
+        print(f"{'':<34}{'calls':>7}{'mean':>9}" + "".join(f"{'p' + str(p):>9}" for p in PERCENTILES) + f"{'max':>9}  (ms)")
+        for name, row in summary.items():
+            print(f"{name:<34}{row['calls']:>7}{row['mean_ms']:>9.3f}"
+                  + "".join(f"{row[f'p{p}_ms']:>9.3f}" for p in PERCENTILES) + f"{row['max_ms']:>9.3f}")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump({"host": args.host, "simulated_s": args.seconds, "frames": len(recorder.frames),
+                           "seeks": seeks, "track_changes": switches, "methods": summary}, f, indent=1)
+            print(f"Wrote {args.json}")
+        player.on_closing()
+
+
+if __name__ == "__main__":
+    main()
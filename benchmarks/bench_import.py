@@ -0,0 +1,98 @@
+"""
+Compares import probing throughput: the serial Mutagen probe loop that add_songs
+used to run on the Tk thread vs. the pooled TrackImportJob.
+
+Usage:
+    python bench_import.py                    # generates test tones in a temp dir
+    python bench_import.py --dir /mnt/share   # probe real files (e.g. on a network share)
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from common import load_mn1, write_test_tone
+
+
+def list_audio_files(directory, mn1):
+    paths = []
+    for dirpath, _, filenames in os.walk(directory):
+        for name in filenames:
+            if name.lower().endswith(mn1.SUPPORTED_EXTENSIONS):
+                paths.append(os.path.join(dirpath, name))
+    return sorted(paths)
+
+
+def bench_serial(mn1, paths):
+    start = time.perf_counter()
+    ok = 0
+    for path in paths:
+        try:
+            if mn1.probe_audio_file(path) is not None:
+                ok += 1
+        except Exception:
+            pass
+    return ok, time.perf_counter() - start
+
+
+def bench_pooled(mn1, paths, workers, library=None):
+    start = time.perf_counter()
+    executor = mn1.TaskExecutor(workers=workers, limits={}) # No Tk root: nothing to deliver, probes only
+    job = mn1.TrackImportJob(list(paths), executor, library=library)
+    ok = 0
+    while not job.finished:
+        batch = job.drain()
+        if library:
+            library.store_many([(path, info) for path, info, error in batch if info and not info["indexed"]])
+        ok += sum(1 for _, info, error in batch if info is not None and error is None)
+        if not batch:
+            time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    executor.close()
+    return ok, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dir", help="Directory of audio files to probe (default: generated tones)")
+    parser.add_argument("--files", type=int, default=500, help="Number of generated files when --dir isn't given")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, 8, 16])
+    args = parser.parse_args()
+
+    mn1 = load_mn1()
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.dir:
+            paths = list_audio_files(args.dir, mn1)
+        else:
+            template = os.path.join(tmp, "tone_0000.wav")
+            write_test_tone(template, seconds=1.0)
+            with open(template, "rb") as f:
+                data = f.read()
+            paths = [template]
+            for i in range(1, args.files):
+                path = os.path.join(tmp, f"tone_{i:04d}.wav")
+                with open(path, "wb") as f:
+                    f.write(data)
+                paths.append(path)
+        if not paths:
+            print("No audio files found.")
+            return
+
+        print(f"{len(paths)} files")
+        ok, elapsed = bench_serial(mn1, paths)
+        print(f"serial        : {len(paths) / elapsed:9.1f} files/s ({ok} valid, {elapsed:.2f}s)")
+        for workers in args.workers:
+            ok, elapsed = bench_pooled(mn1, paths, workers)
+            print(f"pool x{workers:<2}      : {len(paths) / elapsed:9.1f} files/s ({ok} valid, {elapsed:.2f}s)")
+
+        # Library index: the first pass fills it, the second only stats the files
+        library = mn1.LibraryIndex(os.path.join(tmp, "library.sqlite3"))
+        workers = args.workers[-1]
+        for label in ("index cold", "index warm"):
+            ok, elapsed = bench_pooled(mn1, paths, workers, library)
+            print(f"{label:<14}: {len(paths) / elapsed:9.1f} files/s ({ok} valid, {elapsed:.2f}s)")
+        library.close()
+
+
+if __name__ == "__main__":
+    main()
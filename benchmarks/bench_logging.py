@@ -0,0 +1,83 @@
+"""
+Cost of log output on the calling (Tk) thread when the console is slow (Windows
+console, redirected pipe): print() to the slow stream vs. log records going through
+the QueueHandler/QueueListener set up by setup_logging, vs. a debug record below the
+configured level. Also shows the per-call-site rate limit in a burst.
+
+Usage:
+    python bench_logging.py [--messages 2000] [--write-ms 0.2]
+"""
+import argparse
+import sys
+import time
+
+from common import load_mn1
+
+
+class SlowStream:
+    """A text stream whose every write takes write_ms, like a slow console."""
+
+    def __init__(self, write_ms):
+        self.delay = write_ms / 1000.0
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        time.sleep(self.delay)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def per_call_us(fn, count):
+    start = time.perf_counter()
+    for i in range(count):
+        fn(i)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--write-ms", type=float, default=0.2, help="Time each write to the console takes")
+    args = parser.parse_args()
+
+    mn1 = load_mn1()
+    real_stderr = sys.stderr
+    stream = SlowStream(args.write_ms)
+
+    cost = per_call_us(lambda i: print(f"Seeking to: {i * 0.5:.2f}s", file=stream), args.messages)
+    print(f"print to slow console     : {cost:8.2f} us/call")
+
+    sys.stderr = stream # setup_logging's StreamHandler writes to sys.stderr
+    listener = mn1.setup_logging("info")
+    sys.stderr = real_stderr
+    # One call site: lift its rate limit so every record is queued and written
+    mn1.log.filters[0].limit = args.messages
+    cost = per_call_us(lambda i: mn1.log.info("Seeking to: %.2fs", i * 0.5), args.messages)
+    print(f"log.info through queue    : {cost:8.2f} us/call")
+    cost = per_call_us(lambda i: mn1.log.debug("Seeking to: %.2fs", i * 0.5), args.messages)
+    print(f"log.debug below the level : {cost:8.2f} us/call")
+
+    start = time.perf_counter()
+    listener.stop() # Waits for the listener thread to write everything queued
+    print(f"listener drained the queue in {time.perf_counter() - start:.2f}s (off the calling thread)")
+
+    # Rate limit: one call site in a burst
+    rate_filter = mn1.log.filters[0]
+    rate_filter.limit = mn1.LOG_RATE_LIMIT
+    stream.writes = 0
+    sys.stderr = stream
+    listener = mn1.setup_logging("info")
+    sys.stderr = real_stderr
+    before = rate_filter.suppressed_total
+    for i in range(args.messages):
+        mn1.log.info("Burst message %d", i)
+    listener.stop()
+    print(f"burst of {args.messages} from one call site: {stream.writes} written, "
+          f"{rate_filter.suppressed_total - before} suppressed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Oscilloscope sample layout and memory cost of decoding one long track under different
+global memory budgets (--memory-mb): the layout MemoryBudget.plan_samples picks, the bytes
+it keeps in RAM, peak RSS growth and wall time. Each budget runs in a fresh process.
+
+Usage:
+    python benchmarks/bench_memory_budget.py [--minutes 60] [--budgets 1024 256 64 8]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from bench_analysis import FIXTURE_DIR, fixture_path, peak_rss_mb
+from common import load_mn1
+
+
+def run_case(path, budget_mb):
+    """Child process: one decode under the budget; prints the measurements as JSON."""
+    mn1 = load_mn1()
+    memory = mn1.MemoryBudget(budget_mb)
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    peaks, raw, sample_rate = mn1.decode_waveform_data(path, threading.Event(), 5, memory=memory)
+    wall = time.perf_counter() - start
+    layout = f"{raw.dtype.name}{' memmap' if isinstance(raw, mn1.np.memmap) else ''} @ {sample_rate:g} Hz"
+    print(json.dumps({"layout": layout, "resident_mb": mn1.buffer_nbytes(raw) / (1024 * 1024),
+                      "rss_growth_mb": peak_rss_mb() - rss_before, "wall_s": wall}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--minutes", type=int, default=60, help="Length of the stereo 44.1 kHz FLAC fixture")
+    parser.add_argument("--budgets", type=float, nargs="+", default=[1024, 256, 64, 8], help="Budgets in MB")
+    parser.add_argument("--fixtures", default=FIXTURE_DIR)
+    parser.add_argument("--run-case", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        run_case(args.run_case[0], float(args.run_case[1]))
+        return
+
+    path = fixture_path(args.fixtures, "flac", args.minutes, 44100, 2)
+    print(f"{os.path.basename(path)}")
+    print(f"{'budget':>8}  {'layout':<26}{'in RAM':>9}{'RSS growth':>12}{'wall':>8}")
+    for budget in args.budgets:
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-case", path, str(budget)],
+                             capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if out.returncode != 0:
+            print(f"{budget:>6g}MB  FAILED: {out.stderr.strip().splitlines()[-1] if out.stderr.strip() else out.returncode}")
+            continue
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{budget:>6g}MB  {result['layout']:<26}{result['resident_mb']:>7.1f}MB"
+              f"{result['rss_growth_mb']:>10.0f}MB{result['wall_s']:>7.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+CPU load during playback with and without native sample rate output.
+
+Plays a 48 kHz / 96 kHz test file through pygame.mixer.music, once with the mixer
+at its default rate (SDL resamples every buffer) and once re-opened at the file's
+rate via reopen_mixer_at_rate(), and reports process CPU time per second of audio.
+
+    python benchmarks/bench_native_rate.py [--seconds 10] [--rates 48000 96000]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from common import load_mn1, write_test_tone
+
+
+def measure_playback(mn1, path, seconds):
+    """Plays path for the given wall time and returns CPU seconds used by the process."""
+    pygame = mn1.pygame
+    pygame.mixer.music.load(path)
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    pygame.mixer.music.play()
+    while time.monotonic() - wall_start < seconds:
+        time.sleep(0.05)
+    pygame.mixer.music.stop()
+    return time.process_time() - cpu_start, time.monotonic() - wall_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=10.0, help="Playback time per run")
+    parser.add_argument("--rates", type=int, nargs="+", default=[48000, 96000])
+    args = parser.parse_args()
+
+    mn1 = load_mn1()
+    pygame = mn1.pygame
+    with tempfile.TemporaryDirectory() as tmp:
+        for rate in args.rates:
+            path = write_test_tone(os.path.join(tmp, f"tone_{rate}.flac"), args.seconds + 5, sample_rate=rate)
+
+            pygame.mixer.quit()
+            pygame.mixer.init() # Default rate: SDL resamples
+            default_rate = pygame.mixer.get_init()[0]
+            cpu_default, wall = measure_playback(mn1, path, args.seconds)
+
+            mn1.reopen_mixer_at_rate(rate) # Native rate: no resampling
+            cpu_native, _ = measure_playback(mn1, path, args.seconds)
+
+            print(f"{rate} Hz file | mixer {default_rate} Hz: {100 * cpu_default / wall:5.1f}% CPU"
+                  f" | mixer {rate} Hz (native): {100 * cpu_native / wall:5.1f}% CPU")
+    pygame.mixer.quit()
+
+
+if __name__ == "__main__":
+    main()
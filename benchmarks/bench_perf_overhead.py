@@ -0,0 +1,67 @@
+"""
+Overhead of the hot-path timers (PERF): per-call cost of a @PERF.timed function and
+of a start()/stop() pair with the timers off and on, next to an uninstrumented call,
+and decode_waveform_data on a test tone both ways. Writes the recorded histograms as
+JSON with --json.
+
+Usage:
+    python bench_perf_overhead.py [--calls 1000000] [--json perf.json]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from common import load_mn1, write_test_tone
+
+
+def per_call_ns(fn, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=1_000_000)
+    parser.add_argument("--json", help="Also write the recorded timings to this file")
+    args = parser.parse_args()
+
+    mn1 = load_mn1()
+    perf = mn1.PERF
+
+    def plain():
+        return None
+
+    timed = perf.timed("noop")(plain)
+
+    def sectioned():
+        started = perf.start()
+        perf.stop("noop_section", started)
+
+    for enabled in (False, True):
+        perf.enabled = enabled
+        label = "on " if enabled else "off"
+        baseline = per_call_ns(plain, args.calls)
+        print(f"timers {label}: plain call {baseline:6.1f} ns   @timed {per_call_ns(timed, args.calls) - baseline:+6.1f} ns   "
+              f"start/stop {per_call_ns(sectioned, args.calls) - baseline:+6.1f} ns")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_test_tone(os.path.join(tmp, "tone.wav"), seconds=120)
+        for enabled in (False, True, False, True):
+            perf.enabled = enabled
+            start = time.perf_counter()
+            mn1.decode_waveform_data(path, threading.Event(), 5)
+            print(f"decode_waveform_data, timers {'on ' if enabled else 'off'}: {(time.perf_counter() - start) * 1000:7.1f} ms")
+
+    print()
+    print(perf.format_table())
+    if args.json:
+        perf.dump_json(args.json)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Measures tracklist selection cost on a 10k-row tracklist: the virtualized view
+(selection kept as one track ID, at most two rows restyled) vs. the old per-row
+widget loop that reconfigured every entry (--legacy, slow to build).
+
+Needs a display (Tk). Usage:
+    python bench_selection.py [--rows 10000] [--selects 500] [--legacy]
+"""
+import argparse
+import random
+import time
+
+from common import load_mn1
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def report(label, timings):
+    timings_ms = [t * 1000 for t in timings]
+    print(f"{label:<22}: mean {sum(timings_ms) / len(timings_ms):8.3f} ms   "
+          f"p50 {percentile(timings_ms, 50):8.3f} ms   p99 {percentile(timings_ms, 99):8.3f} ms")
+
+
+def bench_virtual(mn1, ctk, root, rows, selects, rng):
+    model = mn1.TracklistModel()
+    for i in range(rows):
+        model.append(f"/music/track_{i:06d}.flac")
+    view = mn1.VirtualTrackList(root, model, on_select=lambda i: None, on_activate=lambda i: None,
+                                font=("SF Mono", 11))
+    view.frame.pack(fill="both", expand=True)
+    root.update()
+
+    timings = []
+    for _ in range(selects):
+        # Mostly nearby rows (arrow-key/click style), sometimes far away (scroll_to)
+        index = rng.randrange(rows) if rng.random() < 0.2 else min(rows - 1, view.first_row + rng.randrange(10))
+        start = time.perf_counter()
+        view.set_selected(index)
+        view.scroll_to(index)
+        root.update_idletasks()
+        timings.append(time.perf_counter() - start)
+    report("virtual select", timings)
+
+    timings = []
+    for _ in range(selects):
+        start = time.perf_counter()
+        view.selected_index
+        timings.append(time.perf_counter() - start)
+    report("virtual lookup", timings)
+    view.frame.destroy()
+
+
+def bench_legacy(ctk, root, rows, selects, rng):
+    """Reproduces the previous select_song: every entry reconfigured on each selection."""
+    scrollable = ctk.CTkScrollableFrame(root)
+    scrollable.pack(fill="both", expand=True)
+    entries = []
+    for i in range(rows):
+        frame = ctk.CTkFrame(scrollable, corner_radius=0)
+        frame.pack(fill="x", pady=1)
+        label = ctk.CTkLabel(frame, text=f"track_{i:06d}.flac", anchor="w")
+        label.pack(fill="x", padx=5)
+        entries.append({"frame": frame, "label": label, "selected": False})
+    root.update()
+
+    timings = []
+    for _ in range(selects):
+        index = rng.randrange(rows)
+        start = time.perf_counter()
+        for i, entry in enumerate(entries):
+            entry["frame"].configure(fg_color="#000000")
+            entry["label"].configure(fg_color="transparent", text_color="#8B0000" if i == index else "#FFFFFF")
+            entry["selected"] = i == index
+        root.update_idletasks()
+        timings.append(time.perf_counter() - start)
+    report("legacy select", timings)
+
+    timings = []
+    for _ in range(selects):
+        start = time.perf_counter()
+        next((i for i, e in enumerate(entries) if e["selected"]), -1)
+        timings.append(time.perf_counter() - start)
+    report("legacy lookup", timings)
+    scrollable.destroy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--selects", type=int, default=500)
+    parser.add_argument("--legacy", action="store_true", help="Also time the old per-row widget list")
+    args = parser.parse_args()
+
+    mn1 = load_mn1()
+    ctk = mn1.ctk
+    root = ctk.CTk()
+    root.geometry("300x600")
+    rng = random.Random(0)
+    print(f"{args.rows} rows, {args.selects} selections")
+    bench_virtual(mn1, ctk, root, args.rows, args.selects, rng)
+    if args.legacy:
+        bench_legacy(ctk, root, args.rows, max(5, args.selects // 50), rng)
+    root.destroy()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Counts process wake-ups of the position/visual update mechanism, idle and while
+"playing": the old daemon thread (sleep 50 ms, then root.after(0, ...)) vs. the
+root.after loop that only runs while playing. Context switches come from
+getrusage (voluntary + involuntary) and, on Linux, /proc/self/status.
+
+Needs a display (Tk). Usage:
+    python bench_update_loop.py [--seconds 5]
+"""
+import argparse
+import resource
+import threading
+import time
+import tkinter as tk
+
+from common import load_mn1
+
+
+def context_switches():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    total = usage.ru_nvcsw + usage.ru_nivcsw
+    try: # Includes every thread of the process on Linux
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f if "ctxt_switches" in line)
+        total = int(fields["voluntary_ctxt_switches"]) + int(fields["nonvoluntary_ctxt_switches"])
+    except (OSError, KeyError, ValueError):
+        pass
+    return total
+
+
+def run(root, seconds):
+    """Pumps the Tk loop for `seconds`, returns (context switches, cpu seconds)."""
+    switches, cpu = context_switches(), time.process_time()
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        root.update()
+        time.sleep(0.002)
+    return context_switches() - switches, time.process_time() - cpu
+
+
+class LegacyThread:
+    """The previous pattern: a thread polling every 50 ms for as long as the player is open."""
+
+    def __init__(self, root, interval_ms):
+        self.root, self.interval = root, interval_ms / 1000
+        self.running, self.playing, self.ticks = True, False, 0
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def _loop(self):
+        while self.running:
+            if self.playing:
+                self.root.after(0, self._tick)
+            time.sleep(self.interval)
+
+    def _tick(self):
+        self.ticks += 1
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+
+
+class AfterLoop:
+    """The new pattern: root.after reschedules only while playing."""
+
+    def __init__(self, root, interval_ms):
+        self.root, self.interval_ms = root, interval_ms
+        self.after_id, self.ticks = None, 0
+
+    def start(self):
+        if self.after_id is None:
+            self.after_id = self.root.after(0, self._tick)
+
+    def stop(self):
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+
+    def _tick(self):
+        self.ticks += 1
+        self.after_id = self.root.after(self.interval_ms, self._tick)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    interval_ms = load_mn1().UPDATE_INTERVAL_MS
+    root = tk.Tk()
+    root.withdraw()
+
+    baseline, _ = run(root, args.seconds)
+    print(f"{'tk loop alone':<22}: {baseline:6d} ctx switches")
+
+    legacy = LegacyThread(root, interval_ms)
+    idle, idle_cpu = run(root, args.seconds)
+    legacy.playing = True
+    playing, playing_cpu = run(root, args.seconds)
+    legacy.close()
+    print(f"{'thread, idle':<22}: {idle:6d} ctx switches  cpu {idle_cpu * 1000:7.1f} ms")
+    print(f"{'thread, playing':<22}: {playing:6d} ctx switches  cpu {playing_cpu * 1000:7.1f} ms  ticks {legacy.ticks}")
+
+    loop = AfterLoop(root, interval_ms)
+    idle, idle_cpu = run(root, args.seconds)
+    loop.start()
+    playing, playing_cpu = run(root, args.seconds)
+    loop.stop()
+    print(f"{'after loop, idle':<22}: {idle:6d} ctx switches  cpu {idle_cpu * 1000:7.1f} ms")
+    print(f"{'after loop, playing':<22}: {playing:6d} ctx switches  cpu {playing_cpu * 1000:7.1f} ms  ticks {loop.ticks}")
+    root.destroy()
+
+
+if __name__ == "__main__":
+    main()
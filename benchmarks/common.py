@@ -0,0 +1,35 @@
+"""Shared helpers for the MN-1 benchmark scripts."""
+import importlib.util
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MN1_PATH = os.path.join(REPO_ROOT, "MN-1.py")
+
+
+def load_mn1():
+    """Imports MN-1.py as a module (its file name isn't a valid module name)."""
+    if "mn1" in sys.modules:
+        return sys.modules["mn1"]
+    spec = importlib.util.spec_from_file_location("mn1", MN1_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["mn1"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_test_tone(path, seconds, sample_rate=44100, channels=2, seed=0):
+    """Writes a deterministic tone + noise file (format taken from the extension) with soundfile."""
+    import numpy as np
+    import soundfile as sf
+    rng = np.random.default_rng(seed)
+    frames = int(seconds * sample_rate)
+    block = sample_rate * 10 # Write in 10 s blocks so long fixtures don't need the whole signal in memory
+    with sf.SoundFile(path, "w", samplerate=sample_rate, channels=channels) as out:
+        for start in range(0, frames, block):
+            n = min(block, frames - start)
+            t = (np.arange(start, start + n) / sample_rate)[:, None]
+            freqs = 220.0 * (1 + np.arange(channels))[None, :]
+            data = 0.4 * np.sin(2 * np.pi * freqs * t) + 0.05 * rng.standard_normal((n, channels))
+            out.write(data.astype("float32"))
+    return path
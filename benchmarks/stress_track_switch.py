@@ -0,0 +1,112 @@
+"""
+Stress test for debounced track switching.
+
+Mashes next/previous/double-click selection faster than TRACK_SWITCH_DEBOUNCE_MS,
+waits for the quiet period and checks that only the track the user settled on
+was loaded, parsed and decoded, and that no waveform task from an intermediate
+selection is still running. Then skips next and back to previous, which must be
+served from the decoded audio cache without decoding again. Exits non-zero on failure.
+
+Needs a display (or a virtual one):
+    xvfb-run python benchmarks/stress_track_switch.py [--presses 200]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from common import load_mn1, write_test_tone
+
+
+def pump(root, seconds):
+    """Runs the Tk event loop for the given time."""
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        root.update()
+        time.sleep(0.005)
+
+
+def settle(mn1, root, player):
+    """Waits for the debounced load and the waveform decode of the track switched to."""
+    pump(root, mn1.TRACK_SWITCH_DEBOUNCE_MS / 1000.0 + 0.2)
+    deadline = time.monotonic() + 10
+    while player.waveform_token is not None and time.monotonic() < deadline:
+        pump(root, 0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--presses", type=int, default=200, help="Number of rapid track changes")
+    parser.add_argument("--interval", type=float, default=0.02, help="Seconds between presses")
+    parser.add_argument("--tracks", type=int, default=20)
+    args = parser.parse_args()
+
+    mn1 = load_mn1()
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [write_test_tone(os.path.join(tmp, f"track_{i:03d}.wav"), 20, seed=i) for i in range(args.tracks)]
+
+        root = mn1.ctk.CTk()
+        player = mn1.MN1MusicPlayer(root)
+        for path in paths:
+            player._append_track(path)
+
+        # Count the expensive operations
+        loads, parses, decodes, decodes_done = [], [], [], []
+        original_load = player.audio_output.load
+        original_length = player.engine.track_length
+        original_decode = player.generate_waveform_data_background
+        def counting_load(path): loads.append(path); return original_load(path)
+        def counting_length(path): parses.append(path); return original_length(path)
+        def counting_decode(flag, path):
+            decodes.append(path)
+            try: return original_decode(flag, path)
+            finally: decodes_done.append(path)
+        player.audio_output.load = counting_load
+        player.engine.track_length = counting_length
+        player.generate_waveform_data_background = counting_decode
+
+        actions = [player.next_song, player.previous_song,
+                   lambda: player.play_selected_song_by_index(rng.randrange(len(paths)))]
+        start = time.monotonic()
+        for _ in range(args.presses):
+            rng.choice(actions)()
+            pump(root, args.interval)
+        mash_seconds = time.monotonic() - start
+
+        # Quiet period + time for the settled track's decode to finish
+        settle(mn1, root, player)
+        settled = player.current_song
+        leftover = len(decodes) - len(decodes_done)
+
+        failures = []
+        if loads != [settled]: failures.append(f"expected 1 load of the settled track, got {len(loads)}")
+        if parses != [settled]: failures.append(f"expected 1 metadata parse, got {len(parses)}")
+        if decodes not in ([settled], []): failures.append(f"expected at most 1 waveform decode, got {len(decodes)}") # [] = cache hit
+        if leftover: failures.append(f"{leftover} waveform task(s) still running")
+        if not player.playing_state: failures.append("settled track is not playing")
+
+        # Next, then back: the settled track was decoded above, so previous must be a cache hit
+        player.next_song()
+        settle(mn1, root, player)
+        decoded_before, hits_before = len(decodes), player.decoded_cache.hits
+        player.previous_song()
+        settle(mn1, root, player)
+        if player.current_song != settled: failures.append("previous did not return to the settled track")
+        elif len(decodes) != decoded_before or player.decoded_cache.hits == hits_before:
+            failures.append("next -> previous decoded again instead of hitting the decoded cache")
+
+        print(f"{args.presses} presses in {mash_seconds:.2f}s -> loads={len(loads)} parses={len(parses)} "
+              f"decodes={len(decodes)} leftover_tasks={leftover} cache_hits={player.decoded_cache.hits}")
+        player.on_closing()
+
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("PASS")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""Loads MN-1.py once for all tests, headless (no audio device, no display needed)."""
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("MPLBACKEND", "Agg") # Before MN-1 imports pyplot
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from common import load_mn1, write_test_tone # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def mn1():
+    return load_mn1()
+
+
+@pytest.fixture
+def tone(tmp_path):
+    """A short stereo WAV file."""
+    return write_test_tone(str(tmp_path / "tone.wav"), 1.0)
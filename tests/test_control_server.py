@@ -0,0 +1,62 @@
+import json
+import socket
+import threading
+
+import pytest
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Unix sockets only")
+
+
+@pytest.fixture
+def server(mn1, tmp_path):
+    calls = []
+    srv = mn1.ControlServer(str(tmp_path / "control.sock"), lambda request: calls.append(request["cmd"]) or len(calls))
+    srv.calls = calls
+    srv.start()
+    yield srv
+    srv.close()
+
+
+@pytest.fixture
+def client(server):
+    sock = socket.socket(socket.AF_UNIX)
+    sock.connect(server.path)
+    stream = sock.makefile("rwb")
+
+    def request(payload):
+        stream.write((json.dumps(payload) + "\n").encode())
+        stream.flush()
+        return json.loads(stream.readline())
+    yield request
+    stream.close()
+    sock.close()
+
+
+def test_command_runs_on_process_pending(server, client):
+    timer = threading.Timer(0.05, server.process_pending)
+    timer.start()
+    assert client({"cmd": "next", "id": 7}) == {"ok": True, "result": 1, "id": 7}
+    assert server.calls == ["next"]
+
+
+def test_status_is_answered_without_the_player(server, client):
+    server.publish({"state": "stopped", "position": 0.0, "length": 0.0})
+    reply = client({"cmd": "status"})
+    assert reply["ok"] and reply["result"]["state"] == "stopped"
+    assert server.calls == []
+
+
+def test_bad_requests(client):
+    assert client({"cmd": "explode"})["ok"] is False
+    assert client(["next"])["ok"] is False
+
+
+def test_timed_out_command_is_not_run_later(mn1, server, client, monkeypatch):
+    monkeypatch.setattr(mn1, "CONTROL_REPLY_TIMEOUT", 0.1)
+    assert client({"cmd": "next"}) == {"ok": False, "error": "player did not respond"}
+    server.process_pending() # The player catches up after the client gave up
+    assert server.calls == []
+    timer = threading.Timer(0.02, server.process_pending)
+    timer.start()
+    assert client({"cmd": "next"})["ok"] # A retry runs exactly once
+    assert server.calls == ["next"]
@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+
+
+def entry(nbytes):
+    return np.zeros(nbytes // 8), np.zeros(0)
+
+
+def test_lru_eviction_within_budget(mn1, tmp_path):
+    cache = mn1.DecodedAudioCache(budget_mb=3 / 1024) # 3 KB
+    paths = [str(tmp_path / f"{i}.wav") for i in range(4)]
+    for path in paths[:3]:
+        cache.put(path, *entry(1024), 44100)
+    assert cache.get(paths[0]) is not None # Now most recently used
+    cache.put(paths[3], *entry(1024), 44100)
+    assert not cache.contains(paths[1])
+    assert all(cache.contains(p) for p in (paths[0], paths[2], paths[3]))
+    assert cache.current_bytes <= cache.budget_bytes
+    assert cache.stats()["evictions"] == 1
+
+
+def test_oversized_entry_is_not_cached(mn1):
+    cache = mn1.DecodedAudioCache(budget_mb=1 / 1024)
+    assert cache.put("big", *entry(4096), 44100) is False
+    assert cache.stats()["entries"] == 0
+
+
+def test_entry_dropped_when_file_changes(mn1, tone):
+    cache = mn1.DecodedAudioCache()
+    cache.put(tone, *entry(1024), 44100)
+    assert cache.get(tone) is not None
+    stat = os.stat(tone)
+    os.utime(tone, ns=(stat.st_atime_ns, stat.st_mtime_ns + 5_000_000_000))
+    assert cache.get(tone) is None
+    assert not cache.contains(tone)
+
+
+def test_trim_keeps_the_shared_entry(mn1):
+    cache = mn1.DecodedAudioCache(budget_mb=1)
+    for name in "abc":
+        cache.put(name, *entry(1024), 44100)
+    assert cache.bytes_excluding("a") == 2048
+    cache.trim(0, keep="a")
+    assert cache.contains("a") and not cache.contains("b") and not cache.contains("c")
+    assert cache.bytes_excluding("a") == 0
@@ -0,0 +1,104 @@
+import time
+
+import numpy as np
+import pytest
+from common import write_test_tone
+
+
+@pytest.fixture
+def needs_scipy(mn1):
+    if mn1.sosfilt is None:
+        pytest.skip("scipy not installed")
+
+
+def noise(frames, channels=2, seed=0):
+    return (0.3 * np.random.default_rng(seed).standard_normal((frames, channels))).astype(np.float32)
+
+
+def band_gains(mn1, **by_hz):
+    return [by_hz.get(f"hz{int(f)}", 0.0) for f in mn1.EQ_BAND_FREQUENCIES]
+
+
+def test_flat_chain_passes_samples_through(mn1):
+    dsp = mn1.DSPChain()
+    block = noise(4096)
+    assert np.array_equal(dsp.process(block.copy()), np.clip(block, -1, 1))
+
+
+def test_gains_are_applied_in_db(mn1):
+    dsp = mn1.DSPChain()
+    dsp.set_preamp_db(-3.0)
+    dsp.set_track_gain_db(-3.0)
+    block = noise(1024)
+    np.testing.assert_allclose(dsp.process(block.copy()), block * 10 ** (-6 / 20), rtol=1e-6)
+
+
+def test_band_boosts_its_frequency(mn1, needs_scipy):
+    rate = 44100
+    dsp = mn1.DSPChain(sample_rate=rate, channels=1)
+    dsp.set_band_gains(band_gains(mn1, hz1000=6.0))
+    t = np.arange(rate) / rate
+    block = (0.1 * np.sin(2 * np.pi * 1000 * t)).astype(np.float32)[:, None]
+    out = dsp.process(block.copy())
+    gain_db = 20 * np.log10(np.max(np.abs(out[rate // 2:])) / 0.1)
+    assert gain_db == pytest.approx(6.0, abs=0.1)
+
+
+def test_filter_state_carries_across_blocks(mn1, needs_scipy):
+    gains = np.linspace(-6, 6, len(mn1.EQ_BAND_FREQUENCIES))
+    whole, blocked = mn1.DSPChain(), mn1.DSPChain()
+    whole.set_band_gains(gains)
+    blocked.set_band_gains(gains)
+    signal = noise(4096 * 8)
+    expected = whole.process(signal.copy())
+    got = np.concatenate([blocked.process(b.copy()) for b in np.split(signal, 8)])
+    np.testing.assert_allclose(got, expected, atol=1e-5)
+
+
+def test_float32_filtering_stays_close_to_float64(mn1, needs_scipy):
+    gains = np.linspace(-6, 6, len(mn1.EQ_BAND_FREQUENCIES))
+    dsp = mn1.DSPChain(sample_rate=96000)
+    dsp.set_band_gains(gains)
+    assert dsp._sos.dtype == np.float32 and dsp._zi.dtype == np.float32
+    signal = noise(4096 * 20)
+    got = np.concatenate([dsp.process(b.copy()) for b in np.split(signal, 20)])
+    reference, _ = mn1.sosfilt(dsp._sos.astype(np.float64), signal.astype(np.float64), axis=0,
+                               zi=np.zeros(dsp._zi.shape))
+    rms_error_db = 20 * np.log10(np.sqrt(np.mean((got - np.clip(reference, -1, 1)) ** 2)))
+    assert rms_error_db < -60
+
+
+def test_other_block_dtypes_are_followed(mn1, needs_scipy):
+    dsp = mn1.DSPChain()
+    dsp.set_band_gains(np.full(len(mn1.EQ_BAND_FREQUENCIES), 3.0))
+    block = noise(1024).astype(np.float64)
+    assert dsp.process(block).dtype == np.float64
+    assert dsp._sos.dtype == np.float64 and dsp._zi.dtype == np.float64
+
+
+def test_dsp_output_rejects_unsigned_16_bit(mn1, monkeypatch, tone):
+    monkeypatch.setattr(mn1, "reopen_mixer_at_rate", lambda rate: False)
+    monkeypatch.setattr(mn1.pygame.mixer, "get_init", lambda: (44100, 16, 2))
+    with pytest.raises(mn1.pygame.error, match="sample size 16"):
+        mn1.DSPStreamOutput(mn1.DSPChain()).load(tone)
+
+
+def test_dsp_output_stop_waits_for_the_feed_thread(mn1, tmp_path):
+    try:
+        mn1.pygame.mixer.init(frequency=44100, size=-16, channels=2)
+    except mn1.pygame.error as e:
+        pytest.skip(f"no audio device: {e}")
+    try:
+        tones = [write_test_tone(str(tmp_path / f"{i}.wav"), 2.0, seed=i) for i in range(2)]
+        output = mn1.DSPStreamOutput(mn1.DSPChain())
+        for i in range(6):
+            output.load(tones[i % 2])
+            output.play(0.5)
+            time.sleep(0.02)
+            thread = output._thread
+            output.stop()
+            assert not thread.is_alive()
+        output.close()
+        assert output._file is None
+    finally:
+        mn1.pygame.mixer.quit()
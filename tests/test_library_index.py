@@ -0,0 +1,45 @@
+import os
+
+
+def info(size=1, mtime_ns=2):
+    return {"size": size, "mtime_ns": mtime_ns, "length": 3.5, "format": "wav",
+            "sample_rate": 44100, "channels": 2, "tags": {"title": "T"}}
+
+
+def test_store_and_lookup(mn1, tmp_path):
+    index = mn1.LibraryIndex(str(tmp_path / "lib.sqlite3"))
+    index.store_many([("/a.wav", info()), ("/b.wav", info(size=9))])
+    found = index.lookup_many(["/a.wav", "/b.wav", "/missing.wav"])
+    assert set(found) == {"/a.wav", "/b.wav"}
+    assert found["/b.wav"]["size"] == 9 and found["/a.wav"]["tags"] == {"title": "T"}
+    index.close()
+
+
+def test_corrupt_database_falls_back_to_memory(mn1, tmp_path, caplog):
+    db_path = tmp_path / "lib.sqlite3"
+    db_path.write_bytes(b"this is not a database" * 100)
+    index = mn1.LibraryIndex(str(db_path))
+    assert index.db_path == ":memory:"
+    assert "Using an in-memory index" in caplog.text
+    index.store_many([("/a.wav", info())])
+    assert "/a.wav" in index.lookup_many(["/a.wav"])
+    index.close()
+
+
+def test_unwritable_location_falls_back_to_memory(mn1, tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    index = mn1.LibraryIndex(str(blocker / "sub" / "lib.sqlite3")) # Parent is a file
+    assert index.db_path == ":memory:"
+    index.close()
+
+
+def test_peaks_are_checked_against_the_file(mn1, tmp_path, tone):
+    index = mn1.LibraryIndex(str(tmp_path / "lib.sqlite3"))
+    st = os.stat(tone)
+    index.store_peaks(tone, st, [1, 2, 3])
+    assert list(index.lookup_peaks(tone, st)) == [1, 2, 3]
+    changed = os.stat_result((st.st_mode, st.st_ino, st.st_dev, st.st_nlink, st.st_uid, st.st_gid,
+                              st.st_size + 1, st.st_atime, st.st_mtime, st.st_ctime))
+    assert index.lookup_peaks(tone, changed) is None
+    index.close()
@@ -0,0 +1,71 @@
+import threading
+
+import numpy as np
+import pytest
+
+MB = 1024 * 1024
+
+
+def test_default_layout_when_it_fits(mn1):
+    memory = mn1.MemoryBudget(64)
+    assert memory.plan_samples(44100 * 60, 44100, 5) == (5, np.float64, False)
+    assert memory.downgrades == 0
+
+
+def test_cheaper_layouts_as_the_budget_shrinks(mn1):
+    frames = 44100 * 3600 # One hour: 8820 Hz float64 samples take ~254 MB
+    memory = mn1.MemoryBudget(200)
+    assert memory.plan_samples(frames, 44100, 5) == (5, np.int16, False)
+    memory = mn1.MemoryBudget(40)
+    factor, dtype, memmap = memory.plan_samples(frames, 44100, 5)
+    assert dtype == np.int16 and not memmap and factor > 5
+    assert 44100 / factor >= mn1.OSC_MIN_SAMPLE_RATE
+    assert -(-frames // factor) * 2 <= 40 * MB
+    memory = mn1.MemoryBudget(1)
+    assert memory.plan_samples(frames, 44100, 5) == (5, np.int16, True)
+    assert memory.downgrades == 1
+
+
+def test_fixed_sources_count_trimmable_ones_do_not(mn1):
+    frames = 44100 * 600 # 8820 Hz float64: ~40 MB
+    memory = mn1.MemoryBudget(64)
+    memory.add_source("images", lambda: 30 * MB)
+    memory.add_source("cache", lambda: 60 * MB, lambda limit: None)
+    assert memory.plan_samples(frames, 44100, 5)[1] == np.int16
+    memory.add_source("track", lambda: 100 * MB) # Replaced by the new track's samples
+    assert memory.plan_samples(frames, 44100, 5) == (5, np.int16, False)
+
+
+def test_enforce_trims_until_within_budget(mn1):
+    cache = mn1.DecodedAudioCache(budget_mb=100)
+    for name in "abcd":
+        cache.put(name, np.zeros(MB // 8), np.zeros(0), 44100)
+    memory = mn1.MemoryBudget(2.5)
+    memory.add_source("track", lambda: 0)
+    memory.add_source("cache", lambda: cache.bytes_excluding(None), cache.trim)
+    assert memory.enforce() == 2 * MB
+    assert memory.used_bytes() <= memory.budget_bytes
+    assert cache.contains("c") and cache.contains("d")
+
+
+def test_decode_follows_the_plan(mn1, tone):
+    memory = mn1.MemoryBudget(0.01)
+    peaks, raw, rate = mn1.decode_waveform_data(tone, threading.Event(), 5, memory=memory)
+    assert raw.dtype == np.int16
+    assert len(peaks) > 0 and np.max(np.abs(raw)) <= mn1.INT16_FULL_SCALE
+
+
+@pytest.mark.parametrize("error", [MemoryError("no room"), OSError(28, "No space left on device")])
+def test_decode_allocation_errors_propagate(mn1, tone, monkeypatch, error):
+    def fail(*args, **kwargs):
+        raise error
+    monkeypatch.setattr(mn1, "allocate_samples", fail)
+    with pytest.raises(type(error)):
+        mn1.decode_waveform_data(tone, threading.Event(), 5)
+
+
+def test_decode_of_an_unreadable_file_is_a_soundfile_error(mn1, tmp_path):
+    path = tmp_path / "junk.wav"
+    path.write_bytes(b"not audio" * 10)
+    with pytest.raises(mn1.sf.SoundFileError):
+        mn1.decode_waveform_data(str(path), threading.Event(), 5)
@@ -0,0 +1,35 @@
+import os
+
+
+def test_read_m3u_skips_comments_and_streams(mn1, tmp_path):
+    playlist = tmp_path / "list.m3u8"
+    playlist.write_text("#EXTM3U\n#EXTINF:10,A\nsub/a.mp3\n\nhttp://radio.example/stream\n"
+                        f"{tmp_path / 'b.flac'}\n", encoding="utf-8")
+    assert list(mn1.read_m3u(str(playlist))) == [str(tmp_path / "sub" / "a.mp3"), str(tmp_path / "b.flac")]
+
+
+def test_read_m3u_file_urls(mn1, tmp_path):
+    playlist = tmp_path / "list.m3u"
+    url_path = "/music/My%20Album/01%20Intro.mp3"
+    playlist.write_text(f"file://{url_path}\n", encoding="utf-8")
+    assert list(mn1.read_m3u(str(playlist))) == [os.path.normpath(mn1.url2pathname(url_path))]
+
+
+def test_file_url_with_a_drive_letter_has_no_leading_slash(mn1):
+    import nturl2path # What url2pathname is on Windows
+    assert nturl2path.url2pathname(mn1.urlparse("file:///C:/Music/a%20b.mp3").path) == "C:\\Music\\a b.mp3"
+
+
+def test_read_m3u_latin1_fallback(mn1, tmp_path):
+    playlist = tmp_path / "old.m3u"
+    playlist.write_bytes("Café.mp3\n".encode("latin-1"))
+    assert [os.path.basename(p) for p in mn1.read_m3u(str(playlist))] == ["Café.mp3"]
+
+
+def test_write_then_read_round_trip(mn1, tmp_path):
+    paths = [str(tmp_path / "a b.mp3"), str(tmp_path / "é" / "c.flac")]
+    playlist = str(tmp_path / "out.m3u8")
+    mn1.write_m3u(playlist, paths)
+    assert open(playlist, encoding="utf-8").readline() == "#EXTM3U\n"
+    assert list(mn1.read_m3u(playlist)) == paths
+    assert not os.path.exists(playlist + ".tmp")
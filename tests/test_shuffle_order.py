@@ -0,0 +1,64 @@
+import random
+
+
+def make(mn1, keys, seed=0, **kwargs):
+    return mn1.ShuffleOrder(keys, rng=random.Random(seed), **kwargs)
+
+
+def test_cycle_visits_every_key_once(mn1):
+    order = make(mn1, range(50))
+    played = [order.next() for _ in range(50)]
+    assert sorted(played) == list(range(50))
+
+
+def test_new_cycle_keeps_recent_tracks_away_from_its_start(mn1):
+    order = make(mn1, range(40), no_repeat_window=8)
+    first = [order.next() for _ in range(40)]
+    second = [order.next() for _ in range(40)]
+    assert sorted(second) == list(range(40))
+    assert not set(first[-8:]) & set(second[:8])
+
+
+def test_previous_walks_back_through_history(mn1):
+    order = make(mn1, "abcdef")
+    played = [order.next() for _ in range(4)]
+    assert [order.previous() for _ in range(3)] == played[-2::-1]
+    assert order.previous() is None
+    assert order.next() == played[1]
+
+
+def test_upcoming_matches_next(mn1):
+    order = make(mn1, range(20))
+    order.next()
+    assert order.upcoming(5) == [order.next() for _ in range(5)]
+
+
+def test_added_key_is_played_in_this_cycle(mn1):
+    order = make(mn1, range(10))
+    order.next()
+    order.add("new")
+    assert "new" in order and len(order) == 11
+    assert "new" in order.upcoming(20)
+
+
+def test_removed_keys_are_skipped(mn1):
+    order = make(mn1, range(30))
+    for _ in range(5):
+        order.next()
+    for key in range(0, 30, 2):
+        order.remove(key) # Enough to trigger compaction
+    assert len(order) == 15
+    rest = order.upcoming(30)
+    assert all(key % 2 for key in rest)
+    assert [order.next() for _ in range(len(rest))] == rest
+
+
+def test_set_current_keeps_history(mn1):
+    order = make(mn1, range(10))
+    played = [order.next() for _ in range(3)]
+    order.set_current(played[0]) # Replay an already played track
+    assert order.current == played[0]
+    assert order.previous() == played[2]
+    upcoming = order.upcoming(1)[0]
+    order.set_current(upcoming)
+    assert order.current == upcoming
@@ -0,0 +1,64 @@
+import logging
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def executor(mn1):
+    tasks = mn1.TaskExecutor(workers=2)
+    yield tasks
+    tasks.close(timeout=1.0)
+
+
+def wait_for(predicate, timeout=2.0):
+    done = threading.Event()
+    for _ in range(int(timeout / 0.01)):
+        if predicate():
+            return True
+        done.wait(0.01)
+    return predicate()
+
+
+def fail(token):
+    raise ValueError("kaput")
+
+
+def test_callbacks_run_on_deliver(mn1, executor):
+    results, errors = [], []
+    executor.submit(lambda token, x: x * 2, 21, on_done=results.append)
+    executor.submit(fail, on_error=errors.append)
+    assert wait_for(lambda: executor.completed + executor.failed == 2)
+    assert executor.deliver() == 2
+    assert results == [42] and isinstance(errors[0], ValueError)
+
+
+def test_failure_without_error_callback_is_logged_with_traceback(mn1, executor, caplog):
+    caplog.set_level(logging.ERROR, logger="mn1")
+    executor.submit(fail, name="fire-and-forget")
+    assert wait_for(lambda: executor.failed == 1)
+    assert wait_for(lambda: "fire-and-forget" in caplog.text)
+    record = next(r for r in caplog.records if "fire-and-forget" in r.getMessage())
+    assert record.exc_info and record.exc_info[0] is ValueError
+
+
+def test_error_callback_failures_are_not_logged_twice(mn1, executor, caplog):
+    caplog.set_level(logging.ERROR, logger="mn1")
+    errors = []
+    executor.submit(fail, name="handled", on_error=errors.append)
+    assert wait_for(lambda: executor.failed == 1)
+    executor.deliver()
+    assert errors and "handled" not in caplog.text
+
+
+def test_cancelled_tasks_are_skipped(mn1, executor):
+    gate = threading.Event()
+    executor.submit(lambda token: gate.wait(2.0), priority=mn1.TASK_PRIORITY_BACKGROUND)
+    executor.submit(lambda token: gate.wait(2.0), priority=mn1.TASK_PRIORITY_BACKGROUND)
+    ran = []
+    token = executor.submit(lambda token: ran.append(1), on_done=ran.append)
+    token.cancel()
+    gate.set()
+    assert wait_for(lambda: executor.skipped == 1 or ran)
+    executor.deliver()
+    assert ran == []
@@ -0,0 +1,46 @@
+def build(mn1, names):
+    index = mn1.TrackSearchIndex()
+    for track_id, name in enumerate(names, 1):
+        index.add(track_id, name)
+    return index
+
+
+def brute_force(names, query):
+    terms = query.lower().split()
+    return [i for i, name in enumerate(names, 1) if all(t in name.lower() for t in terms)]
+
+
+def test_matches_a_substring_scan(mn1):
+    names = ["Blue Monday.mp3", "Blue in Green.flac", "Monday Morning.ogg", "So What.mp3", "Green Onions.wav"]
+    index = build(mn1, names)
+    for query in ("blue", "mon", "blue mon", "gr", "x", "what so", "ee", "n"):
+        assert index.search(query) == brute_force(names, query), query
+    assert index.search("  ") is None
+
+
+def test_typing_narrows_correctly(mn1):
+    names = [f"track {i} {'live' if i % 3 else 'studio'}.mp3" for i in range(100)]
+    index = build(mn1, names)
+    for query in ("l", "li", "liv", "live", "live 1", "live 12"):
+        assert index.search(query) == brute_force(names, query), query
+
+
+def test_tags_and_reindexing(mn1):
+    index = mn1.TrackSearchIndex()
+    index.add(1, "01.flac", {"artist": "Miles Davis"})
+    assert index.search("davis") == [1]
+    index.add(1, "01.flac", {"artist": "John Coltrane"}) # Re-index
+    assert index.search("davis") == [] and index.search("coltrane") == [1]
+
+
+def test_removed_tracks_never_match(mn1):
+    names = [f"song number {i}" for i in range(300)]
+    index = build(mn1, names)
+    removed = set()
+    for step in (2, 3): # Stale postings first, then enough of them to force a rebuild
+        for track_id in range(1, 301):
+            if track_id % step and track_id not in removed:
+                index.remove(track_id)
+                removed.add(track_id)
+        for query in ("song", "number 1", "12"):
+            assert index.search(query) == [i for i in brute_force(names, query) if i not in removed], query
@@ -0,0 +1,40 @@
+import random
+
+
+def test_positions_and_ids_stay_consistent(mn1):
+    model = mn1.TracklistModel()
+    paths = [f"/music/{i:03d}.mp3" for i in range(200)]
+    ids = [model.append(p) for p in paths]
+    assert model.append(paths[5]) == ids[5] # Duplicate path keeps its ID
+    rng = random.Random(1)
+    expected = list(paths)
+    for _ in range(150): # Well past the compaction threshold
+        index = rng.randrange(len(expected))
+        assert model.remove_at(index) == expected.pop(index)
+    assert len(model) == len(expected) and list(model) == expected
+    for index, path in enumerate(expected):
+        assert model[index] == path
+        assert model.index_of_path(path) == index
+        assert model.id_at(index) == model.id_of(path)
+    assert model[-1] == expected[-1]
+
+
+def test_removed_id_is_gone(mn1):
+    model = mn1.TracklistModel()
+    first = model.append("/a.mp3")
+    model.append("/b.mp3")
+    model.remove(first)
+    assert model.index_of(first) is None and model.path_of(first) is None
+    assert "/a.mp3" not in model and model.remove(first) is None
+    assert model.index_of_path("/b.mp3") == 0
+
+
+def test_observers_get_the_index_at_the_time(mn1):
+    model = mn1.TracklistModel()
+    events = []
+    model.subscribe(lambda event, track_id, index: events.append((event, index)))
+    ids = [model.append(p) for p in ("/a", "/b", "/c")]
+    model.remove(ids[1])
+    model.clear()
+    assert events == [("added", 0), ("added", 1), ("added", 2), ("removed", 1), ("cleared", None)]
+    assert len(model) == 0 and not model